@@ -0,0 +1,63 @@
+"""
+Generate functions of a given size, for the benchmarks and the scaling tests.
+"""
+
+from __future__ import annotations
+
+import linecache
+
+WORKLOADS = ["sequential", "early_return", "elif", "match", "match_or", "nested", "assignments"]
+
+
+def make_function(workload: str, n: int, *, literals: bool = True):  # noqa: PLR0912
+    """
+    Generate a function of size `n`, its source is registered in linecache for `inspect`.
+    With `literals`, the branches of the elif, early_return and match workloads return
+    literals, which are lowered to a lookup table, otherwise they return `x + i`.
+    """
+    if workload not in WORKLOADS:
+        raise ValueError(f"Unknown workload: {workload}, available workloads are {WORKLOADS}")
+
+    def value(i: int) -> str:
+        return str(i * 2) if literals else f"x + {i}"
+
+    lines = ["def generated(x):"]
+    if workload == "sequential":
+        # if statements without return, every one doubles the number of branches
+        lines += ["    s = x"]
+        for i in range(n):
+            lines += [f"    if x > {i}:", f"        s = s + {i}"]
+        lines += ["    return s"]
+    elif workload == "early_return":
+        for i in range(n):
+            lines += [f"    if x == {i}:", f"        return {value(i)}"]
+        lines += ["    return -1"]
+    elif workload == "elif":
+        for i in range(n):
+            lines += [f"    {'elif' if i else 'if'} x == {i}:", f"        return {value(i)}"]
+        lines += ["    else:", "        return -1"]
+    elif workload == "match":
+        lines += ["    match x:"]
+        for i in range(n):
+            lines += [f"        case {i}:", f"            return {value(i)}"]
+        lines += ["        case _:", "            return -1"]
+    elif workload == "match_or":
+        lines += ["    match x:", "        case " + " | ".join(map(str, range(n))) + ":"]
+        lines += ["            return 1", "        case _:", "            return -1"]
+    elif workload == "nested":
+        for i in range(n):
+            indent = "    " * (i + 1)
+            lines += [f"{indent}if x > {i}:", f"{indent}    x = x - 1"]
+        lines += ["    " * (n + 1) + "return x"]
+        lines += ["    return -x"]
+    elif workload == "assignments":
+        # every assignment uses the previous value twice
+        lines += ["    y = x"]
+        lines += ["    y = y * 2 + y"] * n
+        lines += ["    return y"]
+    source = "\n".join(lines) + "\n"
+    filename = f"<polarify-generated-{workload}-{n}-{'literals' if literals else 'values'}>"
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    namespace: dict = {}
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace["generated"]
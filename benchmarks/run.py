@@ -0,0 +1,237 @@
+"""
+Benchmark polarified functions against `map_elements` and `map_rows` on the functions
+in `tests/functions.py`.
+
+    python benchmarks/run.py run --rows 1000 1000000 --threads 1 8
+    python benchmarks/run.py compare benchmarks/results/old.json benchmarks/results/new.json
+
+Every combination of thread count, method, number of rows and function runs in a separate
+worker process, since `POLARS_MAX_THREADS` must be set before polars is imported and the peak
+memory (RSS) of a process can only grow. The peak memory of a function is the growth of the peak
+RSS of its worker while it runs, i.e. without the frame. The results are stored as JSON together with the versions
+of python, polars and polarify so that runs of different versions can be compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+
+import polars as pl
+
+import polarify
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(ROOT))
+from tests.functions import functions  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None  # type: ignore[assignment]
+
+METHODS = ("polarify", "map_elements", "map_rows")
+ROWS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+# map_elements and map_rows call python for every row, larger frames take minutes per function
+UDF_MAX_ROWS = 1_000_000
+# the fields of a result that are measured, all other fields identify the benchmark
+MEASUREMENTS = {
+    "seconds",
+    "error",
+    "peak_rss_bytes",
+    "peak_memory_bytes",
+    "timings",
+    "nodes",
+    "max_depth",
+    "length",
+}
+
+
+def peak_rss() -> int | None:
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def benchmark_functions(names: list[str] | None) -> list:
+    return [f for f in functions if names is None or f.__name__ in names]
+
+
+def worker(args: argparse.Namespace):
+    """
+    Time one function with one method on one frame, prints the result as JSON.
+    """
+    # deterministic integers in [-100, 100]
+    df = pl.select(
+        ((pl.int_range(0, args.rows, eager=False).hash(0) % 201).cast(pl.Int64) - 100).alias("x")
+    )
+    (func,) = benchmark_functions([args.function])
+    if args.method == "polarify":
+        polarified = polarify.polarify(func)
+
+        def run():
+            df.select(polarified(pl.col("x")))
+
+    elif args.method == "map_elements":
+        map_elements = getattr(pl.col("x"), "map_elements", None) or pl.col("x").apply  # type: ignore[attr-defined]
+
+        def run():
+            with warnings.catch_warnings():
+                # polars warns that the UDF could be replaced with a native expression
+                warnings.simplefilter("ignore")
+                df.select(map_elements(func))
+
+    else:
+        # `map_rows` was called `apply` in polars < 0.19
+        map_rows = getattr(df, "map_rows", None) or df.apply  # type: ignore[attr-defined]
+
+        def run():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                map_rows(lambda row: func(row[0]))
+
+    result = {"function": func.__name__, "method": args.method, "rows": args.rows}
+    baseline = peak_rss()
+    try:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        result["seconds"] = min(timings)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    peak = peak_rss()
+    result["peak_rss_bytes"] = None if peak is None or baseline is None else peak - baseline
+    print(json.dumps(result), flush=True)
+
+
+def run_worker(
+    method: str, rows: int, threads: int, function: str, args: argparse.Namespace
+) -> dict:
+    command = [
+        sys.executable,
+        __file__,
+        "worker",
+        "--method",
+        method,
+        "--rows",
+        str(rows),
+        "--function",
+        function,
+        "--repeat",
+        str(args.repeat),
+    ]
+    env = {**os.environ, "POLARS_MAX_THREADS": str(threads)}
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return {**json.loads(output), "threads": threads}
+
+
+def metadata() -> dict:
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "polars": pl.__version__,
+        "polarify": polarify.__version__,
+    }
+
+
+def run(args: argparse.Namespace) -> int:
+    info = metadata()
+    results = []
+    for threads in args.threads:
+        for rows in args.rows:
+            for method in args.methods:
+                if method != "polarify" and rows > args.udf_max_rows:
+                    continue
+                print(f"{method} on {rows} rows with {threads} threads", file=sys.stderr)
+                results += [
+                    run_worker(method, rows, threads, func.__name__, args)
+                    for func in benchmark_functions(args.functions)
+                ]
+    output = (
+        args.output
+        or RESULTS / f"{info['polarify']}-polars{info['polars']}-{int(time.time())}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"metadata": info, "results": results}, indent=2) + "\n")
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    """
+    Compare the timings of two result files, returns 1 if any benchmark got slower
+    by more than `threshold`. Works for the results of `transpile.py` as well.
+    """
+
+    def load(path: Path) -> dict[tuple, float]:
+        results = json.loads(path.read_text())["results"]
+        # a benchmark is identified by everything but its measurements
+        return {
+            tuple((k, v) for k, v in r.items() if k not in MEASUREMENTS): r["seconds"]
+            for r in results
+            if "seconds" in r
+        }
+
+    old, new = load(args.old), load(args.new)
+    regressions = 0
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key] / old[key]
+        if ratio > args.threshold:
+            regressions += 1
+            print(
+                f"{' '.join(f'{k}={v}' for k, v in key)}: "
+                f"{old[key] * 1e3:.2f} ms -> {new[key] * 1e3:.2f} ms ({ratio:.2f}x)"
+            )
+    print(f"{regressions} of {len(old.keys() & new.keys())} benchmarks regressed")
+    return 1 if regressions else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python benchmarks/run.py")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--rows", type=int, nargs="+", default=list(ROWS))
+    run_parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    run_parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    run_parser.add_argument("--functions", nargs="+", help="names of the functions to benchmark")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--udf-max-rows", type=int, default=UDF_MAX_ROWS)
+    run_parser.add_argument("--output", type=Path)
+
+    worker_parser = subparsers.add_parser("worker")
+    worker_parser.add_argument("--method", choices=METHODS, required=True)
+    worker_parser.add_argument("--rows", type=int, required=True)
+    worker_parser.add_argument("--function", required=True)
+    worker_parser.add_argument("--repeat", type=int, default=3)
+
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old", type=Path)
+    compare_parser.add_argument("new", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=1.2)
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        worker(args)
+        return 0
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Benchmark the compiler on generated functions of growing size.
+
+    python benchmarks/transpile.py --workloads sequential nested --budget none
+
+For every workload and size this measures the wall time and the peak memory allocated by
+`transform_func_to_new_source` and the size of the generated expression.
+Without a budget the sizes show the exponential paths of the full lowering, e.g. sequential
+if statements without return duplicate the rest of the function into both branches.
+The results can be compared with `python benchmarks/run.py compare`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import polars as pl
+
+import polarify
+from polarify import transform_func_to_new_source
+from polarify.stats import collect_stats
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+
+sys.path.insert(0, str(ROOT))
+from benchmarks._generate import make_function  # noqa: E402
+
+# the sizes of every workload, larger sizes are skipped once a size takes longer than --timeout
+SIZES = {
+    "sequential": [1, 2, 4, 8, 12, 16, 20],
+    "elif": [10, 100, 1_000, 2_000],
+    "match": [10, 100, 1_000, 10_000],
+    "nested": [1, 5, 10, 25, 50, 90],
+    "assignments": [1, 4, 8, 12, 16, 20],
+}
+BUDGETS = {"none": None, "default": polarify.DEFAULT_BUDGET}
+
+
+def measure(workload: str, n: int, budget: str) -> dict:
+    func = make_function(workload, n)
+    result: dict = {"workload": workload, "size": n, "budget": budget}
+    try:
+        with collect_stats(workload) as stats:
+            start = time.perf_counter()
+            source = transform_func_to_new_source(func, budget=BUDGETS[budget])
+            result["seconds"] = time.perf_counter() - start
+        # tracing slows down allocations, so memory is measured in a separate run
+        tracemalloc.start()
+        try:
+            transform_func_to_new_source(func, budget=BUDGETS[budget])
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except (ValueError, RecursionError) as e:
+        result["error"] = f"{type(e).__name__}: {e}".splitlines()[0]
+        return result
+    stats.measure(ast.parse(source).body[0])  # type: ignore[arg-type]
+    result.update(
+        timings=stats.timings, nodes=stats.nodes, max_depth=stats.max_depth, length=len(source)
+    )
+    return result
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python benchmarks/transpile.py")
+    parser.add_argument("--workloads", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--budget", nargs="+", choices=list(BUDGETS), default=list(BUDGETS))
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args(argv)
+
+    results = []
+    for budget in args.budget:
+        for workload in args.workloads:
+            if workload == "match" and sys.version_info < (3, 10):
+                continue
+            for n in SIZES[workload]:
+                result = measure(workload, n, budget)
+                results.append(result)
+                print(
+                    f"{workload:<12} n={n:<6} budget={budget:<8}"
+                    + (
+                        f"{result['seconds'] * 1e3:10.2f} ms {result['nodes']:>10} nodes"
+                        if "seconds" in result and "nodes" in result
+                        else f"  {result.get('error', '')}"
+                    ),
+                    file=sys.stderr,
+                )
+                if result.get("seconds", 0.0) > args.timeout:
+                    break
+
+    info = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "polars": pl.__version__,
+        "polarify": polarify.__version__,
+    }
+    output = args.output or RESULTS / f"transpile-{info['polarify']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"metadata": info, "results": results}, indent=2) + "\n")
+    print(f"Results written to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,52 @@
+from __future__ import annotations
+
 import ast
 import importlib.metadata
 import inspect
+import logging
+import os
+import sys
+import textwrap
+import types
 import warnings
-from functools import wraps
+from functools import partial, wraps
+
+import polars as pl
 
-from .main import parse_body, transform_tree_into_expr
+from .backends import PolarsBackend, get_backend
+from .budget import (
+    DEFAULT_BUDGET,
+    BudgetTracker,
+    ExpressionBudget,
+    ExpressionBudgetError,
+    check_budget,
+    count_nodes,
+)
+from .bytecode import function_code, function_def_from_code, parse_bytecode
+from .cache import (
+    TRANSPILE_CACHE,
+    CacheInfo,
+    bind,
+    cache_key,
+    find_code,
+    inlined_unchanged,
+    record_inlined,
+)
+from .dtypes import (
+    determine_return_dtype,
+    lookup_key_fits,
+    parameter_dtypes,
+    type_branch_literals,
+)
+from .main import (
+    ConstantInliner,
+    LookupTableBuilder,
+    State,
+    WhenChainSplitter,
+    hoist_shared_expressions,
+    parse_body,
+)
+from .stats import collect_stats, current_stats, phase
 
 try:
     __version__ = importlib.metadata.version(__name__)
@@ -13,41 +55,340 @@ except importlib.metadata.PackageNotFoundError as e:
     warnings.warn(str(e), stacklevel=1)
     __version__ = "unknown"
 
+logger = logging.getLogger(__name__)
+
+
+def _function_def_from_source(func) -> ast.FunctionDef | None:
+    """
+    Parse the source of `func`, returns None if the source is not available.
+    """
+    if func.__name__ == "<lambda>":
+        # the source of a lambda is the whole line it is defined in
+        return None
+    try:
+        # nested functions (e.g. closures) are indented in their source file
+        with phase("getsource"):
+            source = textwrap.dedent(inspect.getsource(func))
+    except (OSError, TypeError):
+        return None
+    with phase("ast_parse"):
+        tree = ast.parse(source)
+    func_def = tree.body[0]
+    if not isinstance(func_def, ast.FunctionDef):
+        return None
+    return func_def
+
+
+def _function_body(func, func_def: ast.FunctionDef, inline_constants: bool) -> list[ast.stmt]:
+    if not inline_constants:
+        return func_def.body
+    # Resolve immutable globals and closure variables to literals before parsing
+    # so that they can be folded and used to prune branches
+    return [ConstantInliner.from_function(func).visit(stmt) for stmt in func_def.body]
+
 
-def transform_func_to_new_source(func) -> str:
-    source = inspect.getsource(func)
-    tree = ast.parse(source)
-    func_def: ast.FunctionDef = tree.body[0]  # type: ignore
-    root_node = parse_body(func_def.body)
+def _parse_function(
+    func, *, inline_constants: bool = False, budget: ExpressionBudget | None = None
+) -> tuple[ast.FunctionDef, State, list[tuple[str, ast.expr]]]:
+    """
+    Build the state tree of `func` from its source code.
+    Falls back to the bytecode if the source code is not available.
+    Also returns the variables hoisted by the compact lowering, see `ExpressionBudget`.
+    """
+    # builtins and other callables without bytecode can't be transpiled
+    function_code(func)
+    func_def = _function_def_from_source(func)
+    if func_def is None:
+        with phase("parse_bytecode"):
+            state = parse_bytecode(func, inline_constants)
+            if budget is not None:
+                check_budget(budget, state)
+        return function_def_from_code(func), state, []
+    func_def.body = _function_body(func, func_def, inline_constants)
+    if budget is None:
+        with phase("parse_body"):
+            return func_def, parse_body(func_def.body), []
 
-    expr = transform_tree_into_expr(root_node)
+    source_nodes = count_nodes(func_def.body)
+    tracker = BudgetTracker(budget, source_nodes, line_offset=func.__code__.co_firstlineno - 1)
+    try:
+        with phase("parse_body"):
+            return func_def, parse_body(func_def.body, on_statement=tracker), []
+    except ExpressionBudgetError as e:
+        if budget.on_exceed != "compact":
+            raise
+        logger.info("Using the compact lowering for %s: %s", func.__qualname__, e)
+    # parse a fresh copy of the source, parse_body may have modified the statements
+    func_def = _function_def_from_source(func)
+    assert func_def is not None
+    func_def.body = _function_body(func, func_def, inline_constants)
+    stats = current_stats()
+    if stats is not None:
+        # only count the inlining of the compact lowering
+        stats.inlined.clear()
+    with phase("parse_body"):
+        state = parse_body(func_def.body, compact=True)
+        variables = hoist_shared_expressions(state)
+        check_budget(budget, state, source_nodes, variables)
+    return func_def, state, variables
+
+
+def _build_polarified_def(  # noqa: PLR0913
+    func,
+    *,
+    inline_constants: bool = False,
+    schema=None,
+    return_dtype=None,
+    backend: str = "polars",
+    budget: ExpressionBudget | None = DEFAULT_BUDGET,
+) -> ast.FunctionDef:
+    generator = get_backend(backend)
+    if not isinstance(generator, PolarsBackend) and (
+        schema is not None or return_dtype is not None
+    ):
+        raise ValueError("schema and return_dtype are only supported by the polars backend")
+    func_def, root_node, variables = _parse_function(
+        func, inline_constants=inline_constants, budget=budget
+    )
+
+    arguments = func_def.args
+    generator.bound_names = frozenset(
+        [
+            *(arg.arg for arg in [*arguments.posonlyargs, *arguments.args, *arguments.kwonlyargs]),
+            *(arg.arg for arg in (arguments.vararg, arguments.kwarg) if arg is not None),
+            *(name for name, _ in variables),
+        ]
+    )
+    with phase("transform"):
+        statements, expr = generator.generate(root_node)
+        statements = [
+            *(
+                ast.Assign(
+                    targets=[ast.Name(id=name, ctx=ast.Store())], value=generator.lower_value(value)
+                )
+                for name, value in variables
+            ),
+            *statements,
+        ]
+        if isinstance(generator, PolarsBackend):
+            if hasattr(pl.Expr, "replace_strict"):
+                # only subjects of known dtypes are looked up, see `lookup_key_fits`
+                key_fits = partial(lookup_key_fits, param_dtypes=parameter_dtypes(func, schema))
+                expr = LookupTableBuilder.build(expr, key_fits)
+            dtype = determine_return_dtype(func, expr, schema=schema, return_dtype=return_dtype)
+            if dtype is not None:
+                expr = type_branch_literals(expr, dtype)
+            chains, expr = WhenChainSplitter.split(expr)
+            statements += chains
 
     # Replace the body of the function with the parsed expr
-    # Also import polars as pl since this is used in the generated code
+    # Also import the backend's modules (e.g. polars as pl) since this is used in the generated code
     # We don't want to rely on the user having imported polars as pl
-    func_def.body = [
-        ast.Import(names=[ast.alias(name="polars", asname="pl")]),
-        ast.Return(value=expr),
+    imports = [
+        ast.Import(names=[ast.alias(name=module, asname=alias)])
+        for module, alias in generator.imports
     ]
+    func_def.body = [*imports, *statements, ast.Return(value=expr)]
     # TODO: make this prettier
     func_def.decorator_list = []
     func_def.name += "_polarified"
+    return func_def
+
 
+def transform_func_to_new_source(  # noqa: PLR0913
+    func,
+    *,
+    inline_constants: bool = False,
+    schema=None,
+    return_dtype=None,
+    backend: str = "polars",
+    budget: ExpressionBudget | None = DEFAULT_BUDGET,
+) -> str:
+    func_def = _build_polarified_def(
+        func,
+        inline_constants=inline_constants,
+        schema=schema,
+        return_dtype=return_dtype,
+        backend=backend,
+        budget=budget,
+    )
+    return _unparse(func_def)
+
+
+def _unparse(func_def: ast.stmt) -> str:
     # Unparse the modified AST back into source code
-    return ast.unparse(tree)
+    return ast.unparse(ast.fix_missing_locations(ast.Module(body=[func_def], type_ignores=[])))
+
 
+def polarify(  # noqa: PLR0913
+    func=None,
+    *,
+    inline_constants: bool = False,
+    schema=None,
+    return_dtype=None,
+    backend: str = "polars",
+    budget: ExpressionBudget | None = DEFAULT_BUDGET,
+):
+    """
+    Transform a function using python control flow into a function returning a polars expression.
 
-def polarify(func):
-    new_func_code = transform_func_to_new_source(func)
-    # Execute the new function code in the original function's globals
-    exec_globals = func.__globals__
-    exec(new_func_code, exec_globals)
+    Can be used as `@polarify` or with options as `@polarify(inline_constants=True)`.
+    If `inline_constants` is set, immutable module-level constants, enum values and closure
+    variables referenced by the function are inlined as literals at transpile time.
+    Literal branch values are emitted as `pl.lit(value, dtype=...)` if their dtype is known.
+    It is taken from `return_dtype`, the return annotation or is inferred from the dtypes
+    of the parameters given by `schema` (a mapping of parameter names to dtypes)
+    or their annotations.
+    With `backend="numpy"` the function is compiled to numpy operations on arrays instead,
+    with `backend="sql"` to a function building a SQL `CASE WHEN` expression.
+    `budget` limits the size of the generated expression, see `ExpressionBudget`,
+    None disables the limits.
+    The returned function has a `stats` attribute with the `CompilationStats` of the compilation,
+    `func.stats.explain()` summarizes them. They are also logged on the `polarify` logger
+    at level DEBUG with the stats as the `stats` attribute of the record.
+    """
+    options = {
+        "inline_constants": inline_constants,
+        "schema": schema,
+        "return_dtype": return_dtype,
+        "backend": backend,
+        "budget": budget,
+    }
+    if func is None:
+        return partial(polarify, **options)
 
-    # Get the new function from the globals
-    new_func = exec_globals[func.__name__ + "_polarified"]
+    key = cache_key(func, options)
+    cached = TRANSPILE_CACHE.get(key, lambda entry: inlined_unchanged(func, entry[2]))
+    if cached is not None:
+        code, stats, _ = cached
+        logger.debug("Using the cached compilation of %s", stats.name, extra={"stats": stats})
+    else:
+        name = getattr(func, "__qualname__", repr(func))
+        with collect_stats(name) as stats, record_inlined() as constants:
+            func_def = _build_polarified_def(func, **options)
+            stats.measure(func_def)
+            with phase("unparse"):
+                new_func_code = _unparse(_bind_free_variables(func_def, func.__code__.co_freevars))
+            with phase("exec"):
+                code = find_code(compile(new_func_code, "<string>", "exec"), func_def.name)
+        assert code is not None
+        logger.debug(
+            "Compiled %s in %.2f ms", stats.name, stats.total_time * 1e3, extra={"stats": stats}
+        )
+        TRANSPILE_CACHE.put(key, (code, stats, constants))
+
+    # the generated code runs in the globals of the original function with its closure
+    new_func = bind(code, func)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
         return new_func(*args, **kwargs)
 
+    wrapper.stats = stats  # type: ignore[attr-defined]
     return wrapper
+
+
+def _bind_free_variables(func_def: ast.FunctionDef, freevars: tuple[str, ...]) -> ast.stmt:
+    """
+    Nest the generated function into a function with the free variables of the original function
+    as parameters, so that they are free variables of the generated function as well.
+    """
+    if not freevars:
+        return func_def
+    return ast.FunctionDef(
+        name="_polarify_closure",
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(arg=name) for name in freevars],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        ),
+        body=[func_def, ast.Return(value=ast.Name(id=func_def.name, ctx=ast.Load()))],
+        decorator_list=[],
+    )
+
+
+def _compile_bound(func_def: ast.FunctionDef, func) -> types.FunctionType:
+    """
+    Compile the generated `func_def` into a function with the globals, defaults and closure
+    of `func`.
+    """
+    source = _unparse(_bind_free_variables(func_def, func.__code__.co_freevars))
+    code = find_code(compile(source, "<string>", "exec"), func_def.name)
+    assert code is not None
+    return bind(code, func)
+
+
+def cache_info() -> CacheInfo:
+    """
+    Hits, misses and size of the cache of compiled functions, see `TranspileCache`.
+    """
+    return TRANSPILE_CACHE.info()
+
+
+def cache_clear():
+    TRANSPILE_CACHE.clear()
+
+
+def _call_site() -> str:
+    """
+    Location of the first caller outside of polarify and polars,
+    e.g. `vectorize` may be called through `pl.Expr.pipe`.
+    """
+    frame = sys._getframe(1)
+    while frame.f_back is not None and frame.f_globals.get("__name__", "").split(".")[0] in (
+        __name__,
+        "polars",
+    ):
+        frame = frame.f_back
+    return f"{os.path.relpath(frame.f_code.co_filename)}:{frame.f_lineno}"
+
+
+def vectorize(
+    expr: pl.Expr, func, *, return_dtype=None, skip_nulls: bool = True, **kwargs
+) -> pl.Expr:
+    """
+    Replacement for `expr.map_elements(func)` that tries to transpile `func` with `polarify`.
+
+    Like `map_elements`, null values are passed through as null unless `skip_nulls` is False.
+    If `func` can't be transpiled or other keyword arguments of `map_elements` are given,
+    e.g. `pass_name`, this falls back to `expr.map_elements(func, ...)`, passing all arguments
+    along. Whether a call site was vectorized is logged on the `polarify` logger at level INFO,
+    fallbacks include the reason.
+    Can also be used as `pl.col("x").pipe(vectorize, func)`.
+    """
+    call_site = _call_site()
+    name = getattr(func, "__qualname__", repr(func))
+    try:
+        if kwargs:
+            raise ValueError(
+                f"the arguments {', '.join(kwargs)} are only supported by map_elements"
+            )
+        polarified = polarify(func, return_dtype=return_dtype)
+    except ValueError as e:
+        logger.info(
+            "Falling back to map_elements for %s at %s: %s",
+            name,
+            call_site,
+            e,
+            extra={"call_site": call_site, "vectorized": False},
+        )
+        # `map_elements` was called `apply` in polars < 0.19
+        map_elements = getattr(expr, "map_elements", None) or expr.apply  # type: ignore[attr-defined]
+        if not skip_nulls:
+            # `apply` of polars < 0.16 has no `skip_nulls`
+            kwargs["skip_nulls"] = False
+        return map_elements(func, return_dtype=return_dtype, **kwargs)
+    logger.info(
+        "Vectorized %s at %s",
+        name,
+        call_site,
+        extra={"call_site": call_site, "vectorized": True},
+    )
+    result = polarified(expr)
+    if return_dtype is not None:
+        # map_elements casts the result to `return_dtype`, branch values that aren't literals may differ
+        result = result.cast(return_dtype)
+    # map_elements doesn't call `func` on nulls, the polarified function would take a branch
+    return pl.when(expr.is_not_null()).then(result).otherwise(None) if skip_nulls else result
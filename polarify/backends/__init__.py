@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from polarify.main import Backend, PolarsBackend
+
+from .numpy import NumpyBackend
+from .pyarrow import PyarrowBackend
+from .sql import SqlBackend
+
+BACKENDS: dict[str, type[Backend]] = {
+    backend.name: backend for backend in (PolarsBackend, NumpyBackend, PyarrowBackend, SqlBackend)
+}
+
+
+def get_backend(name: str) -> Backend:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown backend: {name}, available backends are {', '.join(BACKENDS)}"
+        ) from None
+
+
+__all__ = [
+    "BACKENDS",
+    "Backend",
+    "NumpyBackend",
+    "PolarsBackend",
+    "PyarrowBackend",
+    "SqlBackend",
+    "get_backend",
+]
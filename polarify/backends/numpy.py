@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import ast
+from collections.abc import Sequence
+from functools import reduce
+
+from polarify.main import Backend, ResolvedCase, State, flatten_tree
+
+
+def np_call(attr: str, *args: ast.expr, **kwargs: ast.expr) -> ast.Call:
+    func: ast.expr = ast.Name(id="np", ctx=ast.Load())
+    for name in attr.split("."):
+        func = ast.Attribute(value=func, attr=name, ctx=ast.Load())
+    return ast.Call(
+        func=func,
+        args=list(args),
+        keywords=[ast.keyword(arg=key, value=value) for key, value in kwargs.items()],
+    )
+
+
+class NumpyBackend(Backend):
+    """
+    Generates a function operating on numpy arrays.
+
+    The state tree is flattened into a single `np.select`. The mask of every condition is
+    computed once and reused by the cases nested below it.
+    """
+
+    name = "numpy"
+    imports = (("numpy", "np"),)
+
+    def generate(self, node: State) -> tuple[list[ast.stmt], ast.expr]:
+        *cases, (_, default) = flatten_tree(node)
+        if not cases:
+            return [], self.lower(default)
+        statements, masks = self.build_masks([conditions for conditions, _ in cases])
+        expr = np_call(
+            "select",
+            ast.List(elts=masks, ctx=ast.Load()),
+            ast.List(elts=[self.lower(value) for _, value in cases], ctx=ast.Load()),
+            default=self.lower(default),
+        )
+        return statements, expr
+
+    def build_conditional(self, body: Sequence[ResolvedCase], orelse: ast.expr) -> ast.expr:
+        return reduce(
+            lambda acc, case: np_call("where", case.test, case.state, acc), reversed(body), orelse
+        )
+
+    def build_is_in(self, left: ast.expr, values: ast.List, negate: bool) -> ast.expr:
+        is_in = np_call("isin", left, values)
+        return ast.UnaryOp(op=ast.Invert(), operand=is_in) if negate else is_in
+
+    def build_format(self, parts: Sequence[str | ast.expr]) -> ast.expr:
+        # np.char.mod formats every element with `%`, i.e. like `str`
+        strings = [
+            ast.Constant(value=part)
+            if isinstance(part, str)
+            else np_call("char.mod", ast.Constant(value="%s"), part)
+            for part in parts
+            if part != ""
+        ]
+        return reduce(lambda left, right: np_call("char.add", left, right), strings)
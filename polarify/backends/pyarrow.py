@@ -0,0 +1,153 @@
+# ruff: noqa: N802
+from __future__ import annotations
+
+import ast
+from collections.abc import Sequence
+from functools import reduce
+
+from polarify.main import Backend, ResolvedCase, State, flatten_tree
+
+BINARY_KERNELS: dict[type[ast.operator], str] = {
+    ast.Add: "add",
+    ast.Sub: "subtract",
+    ast.Mult: "multiply",
+    ast.Pow: "power",
+    # `&` and `|` combine conditions with kleene logic like polars does
+    ast.BitAnd: "and_kleene",
+    ast.BitOr: "or_kleene",
+}
+
+UNARY_KERNELS: dict[type[ast.unaryop], str] = {
+    ast.USub: "negate",
+    ast.Invert: "invert",
+    ast.Not: "invert",
+}
+
+COMPARE_KERNELS: dict[type[ast.cmpop], str] = {
+    ast.Eq: "equal",
+    ast.NotEq: "not_equal",
+    ast.Lt: "less",
+    ast.LtE: "less_equal",
+    ast.Gt: "greater",
+    ast.GtE: "greater_equal",
+}
+
+
+def pc_call(kernel: str, *args: ast.expr, **kwargs: ast.expr) -> ast.Call:
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id="pc", ctx=ast.Load()), attr=kernel, ctx=ast.Load()),
+        args=list(args),
+        keywords=[ast.keyword(arg=key, value=value) for key, value in kwargs.items()],
+    )
+
+
+def pa_call(attr: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id="pa", ctx=ast.Load()), attr=attr, ctx=ast.Load()),
+        args=list(args),
+        keywords=[],
+    )
+
+
+def as_float(expr: ast.expr) -> ast.Call:
+    # integer division truncates in arrow
+    return pc_call("cast", expr, pa_call("float64"))
+
+
+def floored_division(left: ast.expr, right: ast.expr) -> tuple[ast.expr, ast.expr, ast.expr]:
+    """
+    Python's floor division with integer kernels, returns the quotient rounded down,
+    the remainder of `left` and that quotient, and the mask of the rows whose remainder
+    has a different sign than `right`, those quotients are one too large.
+    Rounding down keeps integers integral, so integer quotients are truncated and corrected
+    by the mask, float quotients are floored already.
+    """
+    quotient = pc_call(
+        "round", pc_call("divide", left, right), round_mode=ast.Constant(value="down")
+    )
+    remainder = pc_call("subtract", left, pc_call("multiply", right, quotient))
+    signs = pc_call("multiply", pc_call("sign", remainder), pc_call("sign", right))
+    return quotient, remainder, pc_call("less", signs, ast.Constant(value=0))
+
+
+class PyarrowBackend(Backend):
+    """
+    Generates a function operating on pyarrow arrays using `pyarrow.compute` kernels.
+
+    The state tree is flattened into a single `pc.case_when` over precomputed masks,
+    operators are replaced by the corresponding kernels since arrow arrays don't support them.
+    """
+
+    name = "pyarrow"
+    imports = (("pyarrow", "pa"), ("pyarrow.compute", "pc"))
+
+    def generate(self, node: State) -> tuple[list[ast.stmt], ast.expr]:
+        *cases, (_, default) = flatten_tree(node)
+        if not cases:
+            return [], self.lower(default)
+        statements, masks = self.build_masks([conditions for conditions, _ in cases])
+        field_names = ast.List(
+            elts=[ast.Constant(value=str(i)) for i in range(len(masks))], ctx=ast.Load()
+        )
+        expr = pc_call(
+            "case_when",
+            pc_call("make_struct", *masks, field_names=field_names),
+            *[self.lower(value) for _, value in cases],
+            self.lower(default),
+        )
+        return statements, expr
+
+    def build_and(self, left: ast.expr, right: ast.expr) -> ast.expr:
+        return pc_call("and_kleene", left, right)
+
+    def build_conditional(self, body: Sequence[ResolvedCase], orelse: ast.expr) -> ast.expr:
+        return reduce(
+            lambda acc, case: pc_call("if_else", case.test, case.state, acc), reversed(body), orelse
+        )
+
+    def build_is_in(self, left: ast.expr, values: ast.List, negate: bool) -> ast.expr:
+        is_in = pc_call("is_in", left, value_set=pa_call("array", values))
+        return pc_call("invert", is_in) if negate else is_in
+
+    def build_format(self, parts: Sequence[str | ast.expr]) -> ast.expr:
+        strings = [
+            ast.Constant(value=part)
+            if isinstance(part, str)
+            else pc_call("cast", part, pa_call("string"))
+            for part in parts
+            if part != ""
+        ]
+        # the last argument is the separator
+        return pc_call("binary_join_element_wise", *strings, ast.Constant(value=""))
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        left, right = self.visit(node.left), self.visit(node.right)
+        if type(node.op) in BINARY_KERNELS:
+            return pc_call(BINARY_KERNELS[type(node.op)], left, right)
+        if isinstance(node.op, ast.Div):
+            return pc_call("divide", as_float(left), right)
+        if isinstance(node.op, ast.FloorDiv):
+            quotient, _, too_large = floored_division(left, right)
+            one = ast.Constant(value=1)
+            return pc_call("if_else", too_large, pc_call("subtract", quotient, one), quotient)
+        if isinstance(node.op, ast.Mod):
+            # python's modulo has the sign of the divisor
+            _, remainder, too_large = floored_division(left, right)
+            return pc_call("if_else", too_large, pc_call("add", remainder, right), remainder)
+        raise ValueError(f"Unsupported operator in pyarrow: {type(node.op).__name__}")
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        return pc_call(UNARY_KERNELS[type(node.op)], operand)
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        lowered = super().visit_Compare(node)
+        if not isinstance(lowered, ast.Compare):
+            # `in` checks against literals
+            return lowered
+        op = lowered.ops[0]
+        if type(op) not in COMPARE_KERNELS:
+            raise ValueError(f"Unsupported comparison in pyarrow: {type(op).__name__}")
+        return pc_call(COMPARE_KERNELS[type(op)], lowered.left, lowered.comparators[0])
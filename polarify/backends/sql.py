@@ -0,0 +1,222 @@
+# ruff: noqa: N802
+from __future__ import annotations
+
+import ast
+import math
+from collections.abc import Sequence
+from typing import Union
+
+from polarify.main import (
+    Backend,
+    ResolvedCase,
+    State,
+    build_joined_str,
+    flatten_tree,
+    string_parts,
+)
+
+# parts of a sql expression, parameters of the function are substituted at call time
+Parts = list[Union[str, ast.expr]]
+
+BINARY_OPERATORS: dict[type[ast.operator], str] = {
+    ast.Add: "+",
+    ast.Sub: "-",
+    ast.Mult: "*",
+    # `&` and `|` combine conditions, e.g. in match statements
+    ast.BitAnd: "AND",
+    ast.BitOr: "OR",
+}
+
+COMPARE_OPERATORS: dict[type[ast.cmpop], str] = {
+    ast.Eq: "=",
+    ast.NotEq: "<>",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+}
+
+FUNCTIONS = {"abs": "ABS", "round": "ROUND"}
+
+
+def sql_literal(value: object) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int) or (isinstance(value, float) and math.isfinite(value)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise ValueError(f"Unsupported literal in SQL: {value!r}")
+
+
+def join(*items: str | ast.expr | Parts) -> Parts:
+    parts: Parts = []
+    for item in items:
+        if isinstance(item, list):
+            parts.extend(item)
+        else:
+            parts.append(item)
+    return parts
+
+
+def join_with(separator: str, items: Sequence[Parts]) -> Parts:
+    parts: Parts = []
+    for i, item in enumerate(items):
+        parts += [separator, *item] if i else item
+    return parts
+
+
+def python_mod(left: Parts, right: Parts) -> Parts:
+    # the result of `%` has the sign of the divisor in python, of the dividend in SQL
+    return join("(((", left, " % ", right, ") + ", right, ") % ", right, ")")
+
+
+class SqlBackend(Backend):
+    """
+    Generates a function building a SQL expression.
+
+    The arguments of the generated function are SQL expressions, e.g. column names.
+    Functions called by the transpiled function are called with SQL expressions as well.
+    The state tree is flattened into a single `CASE WHEN ... END` expression
+    in which the conditions of nested cases are combined with `AND`.
+    """
+
+    name = "sql"
+
+    def generate(self, node: State) -> tuple[list[ast.stmt], ast.expr]:
+        *cases, (_, default) = flatten_tree(node)
+        if not cases:
+            return [], build_joined_str(self.render(default))
+        parts = join("CASE")
+        for conditions, value in cases:
+            parts += join(
+                " WHEN ",
+                join_with(" AND ", [self.render(test) for test in conditions]),
+                " THEN ",
+                self.render(value),
+            )
+        parts += join(" ELSE ", self.render(default), " END")
+        return [], build_joined_str(parts)
+
+    def lower_value(self, expr: ast.expr) -> ast.expr:
+        return build_joined_str(self.render(expr))
+
+    # the SQL is rendered from python expressions, lowering keeps the python constructs
+
+    def build_conditional(self, body: Sequence[ResolvedCase], orelse: ast.expr) -> ast.expr:
+        for case in reversed(body):
+            orelse = ast.IfExp(test=case.test, body=case.state, orelse=orelse)
+        return orelse
+
+    def build_is_in(self, left: ast.expr, values: ast.List, negate: bool) -> ast.expr:
+        op = ast.NotIn() if negate else ast.In()
+        return ast.Compare(left=left, ops=[op], comparators=[values])
+
+    def build_format(self, parts: Sequence[str | ast.expr]) -> ast.expr:
+        return build_joined_str(parts)
+
+    def render(self, node: ast.expr) -> Parts:
+        """
+        Render a python expression as SQL, every compound expression is parenthesized.
+        """
+        method = getattr(self, f"render_{type(node).__name__}", None)
+        if method is None:
+            raise ValueError(f"Unsupported expression in SQL: {ast.unparse(node)}")
+        return method(node)
+
+    def render_Constant(self, node: ast.Constant) -> Parts:
+        return [sql_literal(node.value)]
+
+    def render_Name(self, node: ast.Name) -> Parts:
+        # other names would be substituted into the SQL as they are when it is built
+        if node.id not in self.bound_names:
+            raise ValueError(
+                f"Unsupported name in SQL: {node.id}, only the parameters of the function"
+                " can be used, use inline_constants=True to inline constants"
+            )
+        return [node]
+
+    def render_UnaryOp(self, node: ast.UnaryOp) -> Parts:
+        operand = self.render(node.operand)
+        if isinstance(node.op, ast.USub):
+            return join("(-", operand, ")")
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        # `~` negates conditions in polars
+        return join("(NOT ", operand, ")")
+
+    def render_IfExp(self, node: ast.IfExp) -> Parts:
+        return join(
+            "CASE WHEN ",
+            self.render(node.test),
+            " THEN ",
+            self.render(node.body),
+            " ELSE ",
+            self.render(node.orelse),
+            " END",
+        )
+
+    def render_JoinedStr(self, node: ast.JoinedStr) -> Parts:
+        parts = string_parts(node)
+        assert parts is not None
+        strings: list[Parts] = [
+            [sql_literal(part)]
+            if isinstance(part, str)
+            else join("CAST(", self.render(part), " AS VARCHAR)")
+            for part in parts
+        ]
+        return join("(", join_with(" || ", strings), ")")
+
+    def render_Call(self, node: ast.Call) -> Parts:
+        if not isinstance(node.func, ast.Name):
+            raise ValueError(f"Unsupported call in SQL: {ast.unparse(node)}")
+        if node.func.id in FUNCTIONS and not node.keywords:
+            args = join_with(", ", [self.render(arg) for arg in node.args])
+            return join(FUNCTIONS[node.func.id], "(", args, ")")
+        # other functions are called with the SQL of their arguments when the SQL is built,
+        # just like they are called with polars expressions by the polars backend
+        return [
+            ast.Call(
+                func=node.func,
+                args=[build_joined_str(self.render(arg)) for arg in node.args],
+                keywords=[
+                    ast.keyword(arg=k.arg, value=build_joined_str(self.render(k.value)))
+                    for k in node.keywords
+                ],
+            )
+        ]
+
+    def render_BinOp(self, node: ast.BinOp) -> Parts:
+        left, right = self.render(node.left), self.render(node.right)
+        if type(node.op) in BINARY_OPERATORS:
+            return join("(", left, f" {BINARY_OPERATORS[type(node.op)]} ", right, ")")
+        if isinstance(node.op, ast.Div):
+            # integer division truncates in some SQL dialects
+            return join("(CAST(", left, " AS DOUBLE) / ", right, ")")
+        if isinstance(node.op, ast.FloorDiv):
+            # `//` truncates in some SQL dialects and floors in others, subtracting the
+            # remainder first makes the division exact and keeps integers integers
+            return join("((", left, " - ", python_mod(left, right), ") // ", right, ")")
+        if isinstance(node.op, ast.Mod):
+            return python_mod(left, right)
+        if isinstance(node.op, ast.Pow):
+            return join("POWER(", left, ", ", right, ")")
+        raise ValueError(f"Unsupported operator in SQL: {type(node.op).__name__}")
+
+    def render_Compare(self, node: ast.Compare) -> Parts:
+        left, op, comparator = self.render(node.left), node.ops[0], node.comparators[0]
+        if isinstance(op, (ast.In, ast.NotIn)) and isinstance(comparator, ast.List):
+            keyword = " NOT IN " if isinstance(op, ast.NotIn) else " IN "
+            values = join_with(", ", [self.render(e) for e in comparator.elts])
+            return join("(", left, keyword, "(", values, "))")
+        if (
+            isinstance(op, (ast.Is, ast.IsNot))
+            and isinstance(comparator, ast.Constant)
+            and comparator.value is None
+        ):
+            return join("(", left, " IS NOT NULL)" if isinstance(op, ast.IsNot) else " IS NULL)")
+        if type(op) not in COMPARE_OPERATORS:
+            raise ValueError(f"Unsupported comparison in SQL: {type(op).__name__}")
+        return join("(", left, f" {COMPARE_OPERATORS[type(op)]} ", self.render(comparator), ")")
@@ -0,0 +1,220 @@
+"""
+Limits on the size of the expressions generated by polarify.
+
+If statements duplicate the rest of the function into both branches and inlining assignments
+duplicates their values into every use, so a small function can expand into a huge expression.
+"""
+
+from __future__ import annotations
+
+import ast
+import warnings
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Literal
+
+from .main import ConditionalState, ReturnState, State, UnresolvedState
+
+ON_EXCEED = ("raise", "warn", "compact")
+
+
+@dataclass(frozen=True)
+class ExpressionBudget:
+    """
+    Limits on the expression generated from a function, checked while its body is parsed.
+
+    `max_nodes` limits the number of AST nodes of the conditions and returned values,
+    subexpressions shared by inlining count once per use.
+    `max_depth` limits the nesting of conditions and subexpressions and `max_duplication`
+    the ratio of the number of nodes to the number of expression nodes in the function body.
+    A limit of None disables the check.
+
+    If a limit is exceeded, `on_exceed` decides what happens:
+    `"raise"` raises an `ExpressionBudgetError` error with a report of the offending statements,
+    `"warn"` warns and continues and `"compact"` parses the function again with a compact lowering
+    which merges if statements without return into conditional expressions and assigns shared
+    subexpressions to variables. The compact expression must be within the limits as well.
+    """
+
+    max_nodes: int | None = 200_000
+    max_depth: int | None = 200
+    max_duplication: float | None = 100.0
+    on_exceed: Literal["raise", "warn", "compact"] = "compact"
+
+    def __post_init__(self):
+        if self.on_exceed not in ON_EXCEED:
+            raise ValueError(f"on_exceed must be one of {ON_EXCEED}, got {self.on_exceed!r}")
+
+    def violations(self, stats: ExpressionStats) -> list[str]:
+        violations = []
+        if self.max_nodes is not None and stats.nodes > self.max_nodes:
+            violations.append(f"{stats.nodes} nodes > max_nodes={self.max_nodes}")
+        if self.max_depth is not None and stats.depth > self.max_depth:
+            violations.append(f"depth {stats.depth} > max_depth={self.max_depth}")
+        if self.max_duplication is not None and stats.duplication > self.max_duplication:
+            violations.append(
+                f"duplication {stats.duplication:.1f} > max_duplication={self.max_duplication}"
+            )
+        return violations
+
+
+DEFAULT_BUDGET = ExpressionBudget()
+
+
+@dataclass
+class ExpressionStats:
+    nodes: int = 0
+    depth: int = 0
+    # the number of expression nodes in the function body
+    source_nodes: int = 0
+
+    @property
+    def duplication(self) -> float:
+        # the size of the source is unknown for functions built from bytecode
+        return self.nodes / self.source_nodes if self.source_nodes else 0.0
+
+
+class ExpressionBudgetError(ValueError):
+    def __init__(self, message: str, stats: ExpressionStats):
+        super().__init__(message)
+        self.stats = stats
+
+
+def count_nodes(statements: list[ast.stmt]) -> int:
+    return sum(isinstance(node, ast.expr) for stmt in statements for node in ast.walk(stmt))
+
+
+class ExpressionSize:
+    """
+    Measures the number of nodes and the depth of expressions without recursion.
+    Shared subexpressions are measured once but counted at every use.
+    """
+
+    def __init__(self):
+        # the nodes are kept alive so that their ids are not reused
+        self.memo: dict[int, tuple[ast.AST, int, int]] = {}
+
+    def __call__(self, expr: ast.AST) -> tuple[int, int]:
+        stack = [(expr, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in self.memo:
+                continue
+            children = list(ast.iter_child_nodes(node))
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children)
+                continue
+            is_expr = isinstance(node, ast.expr)
+            nodes = is_expr + sum(self.memo[id(child)][1] for child in children)
+            depth = is_expr + max((self.memo[id(child)][2] for child in children), default=0)
+            self.memo[id(node)] = (node, nodes, depth)
+        _, nodes, depth = self.memo[id(expr)]
+        return nodes, depth
+
+
+class BudgetTracker:
+    """
+    Checks an `ExpressionBudget` after every statement handled by `parse_body`.
+
+    Only the subtrees of the states that were unresolved before a statement can change,
+    so only these are measured. The values of the variables of unresolved states are checked
+    as well, since they are inlined into the expression once the function returns.
+    """
+
+    def __init__(
+        self,
+        budget: ExpressionBudget,
+        source_nodes: int,
+        *,
+        line_offset: int = 0,
+    ):
+        self.budget = budget
+        self.line_offset = line_offset
+        self.size = ExpressionSize()
+        self.stats = ExpressionStats(source_nodes=source_nodes)
+        # the unresolved states after the last statement and their depth
+        self.leaves: list[tuple[State, int]] = []
+        self.contributions: list[tuple[ast.stmt, int]] = []
+        self.warned = False
+
+    def __call__(self, stmt: ast.stmt, state: State):
+        if self.warned:
+            return
+        before = self.stats.nodes
+        pending = ExpressionStats()
+        leaves = self.leaves if self.contributions else [(state, 0)]
+        self.leaves = []
+        for leaf, depth in leaves:
+            self.measure(leaf, depth, pending)
+        self.contributions.append((stmt, self.stats.nodes - before + pending.nodes))
+        stats = ExpressionStats(
+            nodes=self.stats.nodes + pending.nodes,
+            depth=max(self.stats.depth, pending.depth),
+            source_nodes=self.stats.source_nodes,
+        )
+        self.check(stats)
+
+    def measure(self, node: State, depth: int, pending: ExpressionStats):
+        stack = [(node, depth)]
+        while stack:
+            state, depth = stack.pop()
+            if isinstance(state.node, ReturnState):
+                self.add(state.node.expr, depth, self.stats)
+            elif isinstance(state.node, ConditionalState):
+                for case in state.node.body:
+                    self.add(case.test, depth + 1, self.stats)
+                    stack.append((case.state, depth + 1))
+                # the cases of an orelse are chained, they don't nest
+                stack.append((state.node.orelse, depth))
+            elif isinstance(state.node, UnresolvedState):
+                self.leaves.append((state, depth))
+                for value in state.node.assignments.values():
+                    # only the largest value counts, not every value is necessarily used
+                    nodes, value_depth = self.size(value)
+                    pending.nodes = max(pending.nodes, nodes)
+                    pending.depth = max(pending.depth, depth + value_depth)
+
+    def add(self, expr: ast.expr, depth: int, stats: ExpressionStats):
+        nodes, expr_depth = self.size(expr)
+        stats.nodes += nodes
+        stats.depth = max(stats.depth, depth + expr_depth)
+
+    def check(self, stats: ExpressionStats):
+        violations = self.budget.violations(stats)
+        if not violations:
+            return
+        message = self.report(violations)
+        if self.budget.on_exceed == "warn":
+            warnings.warn(message, stacklevel=2)
+            self.warned = True
+        else:
+            raise ExpressionBudgetError(message, stats)
+
+    def report(self, violations: list[str]) -> str:
+        largest = sorted(self.contributions, key=lambda c: c[1], reverse=True)[:3]
+        lines = [
+            f"  line {stmt.lineno + self.line_offset}: "
+            f"{ast.unparse(stmt).splitlines()[0]} ({nodes} nodes)"
+            for stmt, nodes in largest
+        ]
+        return "\n".join(
+            [f"Expression budget exceeded: {', '.join(violations)}", "Largest statements:", *lines]
+        )
+
+
+def check_budget(
+    budget: ExpressionBudget,
+    node: State,
+    source_nodes: int = 0,
+    variables: Sequence[tuple[str, ast.expr]] = (),
+):
+    """
+    Check the budget on a complete state tree, e.g. one built from bytecode
+    or with the compact lowering, including the values of the hoisted `variables`.
+    """
+    tracker = BudgetTracker(budget, source_nodes)
+    tracker.measure(node, 0, ExpressionStats())
+    for _, value in variables:
+        tracker.add(value, 0, tracker.stats)
+    tracker.check(tracker.stats)
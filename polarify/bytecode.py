@@ -0,0 +1,485 @@
+"""
+Front end that builds the `State` tree of a function from its bytecode.
+
+This is used for functions whose source code can't be retrieved, e.g. lambdas,
+functions defined in a REPL or with `exec` and modules that are only shipped as `.pyc` files.
+Instead of decompiling the bytecode into statements, the bytecode is executed symbolically:
+the stack and the local variables hold AST expressions, and every conditional jump forks
+the execution into a `ConditionalState` with one state per branch.
+"""
+
+from __future__ import annotations
+
+import ast
+import dis
+import inspect
+import sys
+import types
+from copy import copy, deepcopy
+from typing import Any, Callable
+
+from .main import (
+    ConditionalState,
+    ConstantInliner,
+    InlineTransformer,
+    ReturnState,
+    State,
+    UnresolvedCase,
+    as_literal,
+)
+
+PY_311 = sys.version_info >= (3, 11)
+PY_312 = sys.version_info >= (3, 12)
+
+
+class _Null:
+    """
+    Placeholder for the NULL that is pushed onto the stack in front of callables.
+    """
+
+    def __repr__(self) -> str:
+        return "NULL"
+
+
+NULL = _Null()
+
+BINARY_OPERATORS: dict[str, ast.operator] = {
+    "+": ast.Add(),
+    "-": ast.Sub(),
+    "*": ast.Mult(),
+    "/": ast.Div(),
+    "//": ast.FloorDiv(),
+    "%": ast.Mod(),
+    "**": ast.Pow(),
+    "@": ast.MatMult(),
+    "&": ast.BitAnd(),
+    "|": ast.BitOr(),
+    "^": ast.BitXor(),
+    "<<": ast.LShift(),
+    ">>": ast.RShift(),
+}
+
+# python <= 3.10 has one opcode per binary operator
+LEGACY_BINARY_OPERATORS = {
+    "ADD": "+",
+    "SUBTRACT": "-",
+    "MULTIPLY": "*",
+    "TRUE_DIVIDE": "/",
+    "FLOOR_DIVIDE": "//",
+    "MODULO": "%",
+    "POWER": "**",
+    "MATRIX_MULTIPLY": "@",
+    "AND": "&",
+    "OR": "|",
+    "XOR": "^",
+    "LSHIFT": "<<",
+    "RSHIFT": ">>",
+}
+
+UNARY_OPERATORS: dict[str, ast.unaryop] = {
+    "UNARY_NEGATIVE": ast.USub(),
+    "UNARY_POSITIVE": ast.UAdd(),
+    "UNARY_NOT": ast.Not(),
+    "UNARY_INVERT": ast.Invert(),
+}
+
+COMPARE_OPERATORS: dict[str, ast.cmpop] = {
+    "<": ast.Lt(),
+    "<=": ast.LtE(),
+    "==": ast.Eq(),
+    "!=": ast.NotEq(),
+    ">": ast.Gt(),
+    ">=": ast.GtE(),
+}
+
+# conversion flags of FORMAT_VALUE / CONVERT_VALUE
+CONVERSIONS = {0: -1, 1: ord("s"), 2: ord("r"), 3: ord("a")}
+
+NOOP_INSTRUCTIONS = {
+    "NOP",
+    "RESUME",
+    "CACHE",
+    "PRECALL",
+    "EXTENDED_ARG",
+    "COPY_FREE_VARS",
+    "MAKE_CELL",
+    "TO_BOOL",
+    "NOT_TAKEN",
+}
+
+LOAD_FAST_INSTRUCTIONS = {
+    "LOAD_FAST",
+    "LOAD_FAST_CHECK",
+    "LOAD_FAST_AND_CLEAR",
+    "LOAD_FAST_BORROW",
+    "LOAD_DEREF",
+    "LOAD_CLOSURE",
+    "LOAD_NAME",
+}
+
+UNCONDITIONAL_JUMPS = {
+    "JUMP_FORWARD",
+    "JUMP_ABSOLUTE",
+    "JUMP",
+    "JUMP_NO_INTERRUPT",
+    "JUMP_BACKWARD",
+    "JUMP_BACKWARD_NO_INTERRUPT",
+}
+
+
+def is_sequence(node: ast.expr) -> bool:
+    return isinstance(node, (ast.Tuple, ast.List)) or (
+        isinstance(node, ast.Constant) and isinstance(node.value, tuple)
+    )
+
+
+def function_code(func: Callable) -> types.CodeType:
+    """
+    The code object of `func`, builtins and other callables like `functools.partial` have none.
+    """
+    code = getattr(func, "__code__", None)
+    if not isinstance(code, types.CodeType):
+        raise ValueError(f"{func!r} has no Python bytecode")
+    return code
+
+
+def function_def_from_code(func: Callable) -> ast.FunctionDef:
+    """
+    Build an empty function definition with the signature of `func` from its code object.
+    Default values are not part of the definition, they have to be copied from `func`.
+    """
+    code = function_code(func)
+    names = code.co_varnames
+    positional = [ast.arg(arg=name) for name in names[: code.co_argcount]]
+    index = code.co_argcount
+    kwonly = [ast.arg(arg=name) for name in names[index : index + code.co_kwonlyargcount]]
+    index += code.co_kwonlyargcount
+    vararg = kwarg = None
+    if code.co_flags & inspect.CO_VARARGS:
+        vararg = ast.arg(arg=names[index])
+        index += 1
+    if code.co_flags & inspect.CO_VARKEYWORDS:
+        kwarg = ast.arg(arg=names[index])
+    name = func.__name__ if func.__name__.isidentifier() else "lambda"
+    func_def = ast.FunctionDef(
+        name=name,
+        args=ast.arguments(
+            posonlyargs=positional[: code.co_posonlyargcount],
+            args=positional[code.co_posonlyargcount :],
+            vararg=vararg,
+            kwonlyargs=kwonly,
+            kw_defaults=[None] * len(kwonly),
+            kwarg=kwarg,
+            defaults=[],
+        ),
+        body=[],
+        decorator_list=[],
+        returns=None,
+        type_comment=None,
+    )
+    if PY_312:
+        func_def.type_params = []  # type: ignore[attr-defined]
+    return func_def
+
+
+class BytecodeParser:
+    """
+    Symbolically executes the bytecode of a function and builds the corresponding `State` tree.
+    """
+
+    def __init__(self, func: Callable, inline_constants: bool = False):
+        code = function_code(func)
+        if code.co_flags & (inspect.CO_GENERATOR | inspect.CO_COROUTINE):
+            raise ValueError("Generators and coroutines are not supported")
+        self.code = code
+        self.instructions = list(dis.get_instructions(code))
+        self.index_by_offset = {ins.offset: i for i, ins in enumerate(self.instructions)}
+        self.constants = ConstantInliner.from_function(func) if inline_constants else None
+        self.parameters = code.co_varnames[
+            : code.co_argcount
+            + code.co_kwonlyargcount
+            + bool(code.co_flags & inspect.CO_VARARGS)
+            + bool(code.co_flags & inspect.CO_VARKEYWORDS)
+        ]
+
+    def parse(self) -> State:
+        variables: dict[str, ast.expr] = {
+            name: ast.Name(id=name, ctx=ast.Load()) for name in self.parameters
+        }
+        return self.execute(0, [], variables)
+
+    def finalize(self, expr: ast.expr) -> ast.expr:
+        """
+        Apply the same transformations to an expression as the source based front end.
+        """
+        if self.constants is not None:
+            # expressions are shared between branches, so we must not modify them in place
+            expr = self.constants.visit(deepcopy(expr))
+        return InlineTransformer.inline_expr(expr, {})
+
+    def execute(  # noqa: PLR0912, PLR0915
+        self, index: int, stack: list[Any], variables: dict[str, ast.expr]
+    ) -> State:
+        kw_names: tuple[str, ...] = ()
+        while True:
+            ins = self.instructions[index]
+            op = ins.opname
+            arg = ins.arg or 0
+            index += 1
+
+            if op in NOOP_INSTRUCTIONS:
+                continue
+
+            # loading and storing
+            if op in LOAD_FAST_INSTRUCTIONS:
+                stack.append(variables.get(ins.argval, ast.Name(id=ins.argval, ctx=ast.Load())))
+            elif op in ("LOAD_FAST_LOAD_FAST", "LOAD_FAST_BORROW_LOAD_FAST_BORROW"):
+                for name in ins.argval:
+                    stack.append(variables.get(name, ast.Name(id=name, ctx=ast.Load())))
+            elif op in ("STORE_FAST", "STORE_DEREF", "STORE_NAME"):
+                variables[ins.argval] = stack.pop()
+            elif op == "STORE_FAST_STORE_FAST":
+                for name in ins.argval:
+                    variables[name] = stack.pop()
+            elif op == "STORE_FAST_LOAD_FAST":
+                variables[ins.argval[0]] = stack.pop()
+                stack.append(variables[ins.argval[1]])
+            elif op in ("DELETE_FAST", "DELETE_DEREF"):
+                variables.pop(ins.argval, None)
+            elif op in ("LOAD_CONST", "LOAD_SMALL_INT"):
+                stack.append(self.constant(ins.argval))
+            elif op == "LOAD_GLOBAL":
+                if PY_311 and arg & 1 and sys.version_info < (3, 13):
+                    stack.append(NULL)
+                stack.append(ast.Name(id=ins.argval, ctx=ast.Load()))
+                if arg & 1 and sys.version_info >= (3, 13):
+                    stack.append(NULL)
+            elif op in ("LOAD_ATTR", "LOAD_METHOD"):
+                attribute = ast.Attribute(value=stack.pop(), attr=ins.argval, ctx=ast.Load())
+                if op == "LOAD_METHOD" or (PY_312 and arg & 1):
+                    stack.append(NULL)
+                stack.append(attribute)
+            elif op == "PUSH_NULL":
+                stack.append(NULL)
+
+            # stack manipulation
+            elif op == "POP_TOP":
+                stack.pop()
+            elif op == "DUP_TOP":
+                stack.append(stack[-1])
+            elif op == "DUP_TOP_TWO":
+                stack.extend(stack[-2:])
+            elif op == "COPY":
+                stack.append(stack[-arg])
+            elif op == "SWAP":
+                stack[-1], stack[-arg] = stack[-arg], stack[-1]
+            elif op in ("ROT_TWO", "ROT_THREE", "ROT_FOUR"):
+                n = {"ROT_TWO": 2, "ROT_THREE": 3, "ROT_FOUR": 4}[op]
+                stack[-n:] = [stack[-1], *stack[-n:-1]]
+            elif op == "ROT_N":
+                stack[-arg:] = [stack[-1], *stack[-arg:-1]]
+
+            # operators
+            elif op == "BINARY_OP":
+                right, left = stack.pop(), stack.pop()
+                symbol = ins.argrepr.rstrip("=")
+                if symbol not in BINARY_OPERATORS:
+                    raise ValueError(f"Unsupported binary operator: {ins.argrepr}")
+                stack.append(ast.BinOp(left=left, op=BINARY_OPERATORS[symbol], right=right))
+            elif op.startswith(("BINARY_", "INPLACE_")) and op.split("_", 1)[1] in (
+                LEGACY_BINARY_OPERATORS
+            ):
+                right, left = stack.pop(), stack.pop()
+                symbol = LEGACY_BINARY_OPERATORS[op.split("_", 1)[1]]
+                stack.append(ast.BinOp(left=left, op=BINARY_OPERATORS[symbol], right=right))
+            elif op == "BINARY_SUBSCR":
+                key, value = stack.pop(), stack.pop()
+                stack.append(ast.Subscript(value=value, slice=key, ctx=ast.Load()))
+            elif op in UNARY_OPERATORS:
+                stack.append(ast.UnaryOp(op=UNARY_OPERATORS[op], operand=stack.pop()))
+            elif op == "CALL_INTRINSIC_1" and ins.argrepr == "INTRINSIC_UNARY_POSITIVE":
+                stack.append(ast.UnaryOp(op=ast.UAdd(), operand=stack.pop()))
+            elif op == "COMPARE_OP":
+                right, left = stack.pop(), stack.pop()
+                symbol = ins.argval if isinstance(ins.argval, str) else ins.argrepr
+                if symbol in ("==", "!=") and is_sequence(left) != is_sequence(right):
+                    # e.g. `case 1:` with a tuple subject, a sequence never equals a scalar
+                    stack.append(ast.Constant(value=symbol == "!="))
+                else:
+                    stack.append(
+                        ast.Compare(left=left, ops=[COMPARE_OPERATORS[symbol]], comparators=[right])
+                    )
+            elif op in ("IS_OP", "CONTAINS_OP"):
+                right, left = stack.pop(), stack.pop()
+                cmp_op: ast.cmpop
+                if op == "IS_OP":
+                    cmp_op = ast.IsNot() if arg else ast.Is()
+                else:
+                    cmp_op = ast.NotIn() if arg else ast.In()
+                stack.append(ast.Compare(left=left, ops=[cmp_op], comparators=[right]))
+
+            # calls
+            elif op == "KW_NAMES":
+                kw_names = self.code.co_consts[arg]
+            elif op in ("CALL", "CALL_KW", "CALL_FUNCTION", "CALL_FUNCTION_KW", "CALL_METHOD"):
+                if op in ("CALL_KW", "CALL_FUNCTION_KW"):
+                    names = stack.pop()
+                    assert isinstance(names, ast.Constant)
+                    kw_names = tuple(names.value)  # type: ignore[arg-type]
+                args = [stack.pop() for _ in range(arg)][::-1]
+                n_callables = 1 if op in ("CALL_FUNCTION", "CALL_FUNCTION_KW") else 2
+                callables = [stack.pop() for _ in range(n_callables)]
+                func = next(c for c in callables if c is not NULL)
+                n_positional = len(args) - len(kw_names)
+                stack.append(
+                    ast.Call(
+                        func=func,
+                        args=args[:n_positional],
+                        keywords=[
+                            ast.keyword(arg=name, value=value)
+                            for name, value in zip(kw_names, args[n_positional:])
+                        ],
+                    )
+                )
+                kw_names = ()
+
+            # containers
+            elif op in ("BUILD_TUPLE", "BUILD_LIST", "BUILD_SET"):
+                elts = [stack.pop() for _ in range(arg)][::-1]
+                if op == "BUILD_TUPLE":
+                    stack.append(ast.Tuple(elts=elts, ctx=ast.Load()))
+                elif op == "BUILD_LIST":
+                    stack.append(ast.List(elts=elts, ctx=ast.Load()))
+                else:
+                    stack.append(ast.Set(elts=elts))
+            elif op in ("LIST_EXTEND", "SET_UPDATE"):
+                extension = stack.pop()
+                if not (isinstance(extension, ast.Constant) and isinstance(extension.value, tuple)):
+                    raise ValueError("Unpacking in list or set displays is not supported")
+                stack[-arg].elts.extend(ast.Constant(value=v) for v in extension.value)
+            elif op == "LIST_TO_TUPLE":
+                stack.append(ast.Tuple(elts=stack.pop().elts, ctx=ast.Load()))
+            elif op == "UNPACK_SEQUENCE":
+                sequence = stack.pop()
+                if isinstance(sequence, ast.Constant) and isinstance(sequence.value, tuple):
+                    elts = [ast.Constant(value=v) for v in sequence.value]
+                elif isinstance(sequence, (ast.Tuple, ast.List)):
+                    elts = sequence.elts
+                else:
+                    raise ValueError(f"Unsupported unpacking of {type(sequence)}")
+                if len(elts) != arg:
+                    raise ValueError("Unpacking a sequence of the wrong length")
+                stack.extend(reversed(elts))
+
+            # sequence patterns in match statements, only tuple subjects are supported
+            elif op == "MATCH_SEQUENCE":
+                if not isinstance(stack[-1], (ast.Tuple, ast.List)):
+                    raise ValueError("Matching lists is not supported.")
+                stack.append(ast.Constant(value=True))
+            elif op == "GET_LEN":
+                if not isinstance(stack[-1], (ast.Tuple, ast.List)):
+                    raise ValueError("Matching lists is not supported.")
+                stack.append(ast.Constant(value=len(stack[-1].elts)))
+
+            # string formatting
+            elif op == "FORMAT_VALUE":
+                spec = stack.pop() if arg & 0x04 else None
+                stack.append(self.formatted_value(stack.pop(), CONVERSIONS[arg & 0x03], spec))
+            elif op == "CONVERT_VALUE":
+                stack.append(self.formatted_value(stack.pop(), CONVERSIONS[arg], None))
+            elif op == "FORMAT_SIMPLE":
+                value = stack.pop()
+                if not isinstance(value, ast.JoinedStr):
+                    value = self.formatted_value(value, -1, None)
+                stack.append(value)
+            elif op == "FORMAT_WITH_SPEC":
+                spec, value = stack.pop(), stack.pop()
+                if isinstance(value, ast.JoinedStr):
+                    formatted = value.values[0]
+                    assert isinstance(formatted, ast.FormattedValue)
+                    value = self.formatted_value(formatted.value, formatted.conversion, spec)
+                else:
+                    value = self.formatted_value(value, -1, spec)
+                stack.append(value)
+            elif op == "BUILD_STRING":
+                parts = [stack.pop() for _ in range(arg)][::-1]
+                values: list[ast.expr] = []
+                for part in parts:
+                    values.extend(part.values if isinstance(part, ast.JoinedStr) else [part])
+                stack.append(ast.JoinedStr(values=values))
+
+            # control flow
+            elif op in ("RETURN_VALUE", "RETURN_CONST"):
+                value = self.constant(ins.argval) if op == "RETURN_CONST" else stack.pop()
+                return State(ReturnState(expr=self.finalize(value)))
+            elif op in UNCONDITIONAL_JUMPS:
+                index = self.jump(ins)
+            elif "JUMP" in op and "_IF_" in op:
+                return self.branch(ins, index, stack, variables)
+            else:
+                raise ValueError(f"Unsupported bytecode instruction: {op}")
+
+    def constant(self, value: Any) -> ast.Constant:
+        literal = as_literal(value)
+        if literal is None:
+            raise ValueError(f"Unsupported constant: {value!r}")
+        return literal
+
+    @staticmethod
+    def formatted_value(value: ast.expr, conversion: int, spec: Any) -> ast.JoinedStr:
+        return ast.JoinedStr(
+            values=[
+                ast.FormattedValue(
+                    value=value,
+                    conversion=conversion,
+                    format_spec=None if spec is None else ast.JoinedStr(values=[spec]),
+                )
+            ]
+        )
+
+    def jump(self, ins: dis.Instruction) -> int:
+        if ins.argval <= ins.offset:
+            raise ValueError("Loops are not supported")
+        return self.index_by_offset[ins.argval]
+
+    def branch(
+        self, ins: dis.Instruction, index: int, stack: list[Any], variables: dict[str, ast.expr]
+    ) -> State:
+        """
+        Fork the execution at a conditional jump.
+        """
+        op = ins.opname
+        target = self.jump(ins)
+        if op.endswith("_OR_POP"):
+            # the condition stays on the stack if the jump is taken
+            condition = stack[-1]
+            jump_stack, next_stack = stack, stack[:-1]
+        else:
+            condition = stack.pop()
+            jump_stack, next_stack = stack, stack
+        if op.endswith(("IF_NONE", "IF_NOT_NONE")):
+            condition = ast.Compare(
+                left=condition, ops=[ast.Is()], comparators=[ast.Constant(value=None)]
+            )
+        jump_if_true = op.endswith(("IF_TRUE", "IF_TRUE_OR_POP", "IF_NONE"))
+
+        test = self.finalize(condition)
+        if isinstance(test, ast.Constant):
+            # the condition is known at transpile time, only follow the branch that is taken
+            if bool(test.value) == jump_if_true:
+                return self.execute(target, copy(jump_stack), copy(variables))
+            return self.execute(index, copy(next_stack), copy(variables))
+
+        jump_state = self.execute(target, copy(jump_stack), copy(variables))
+        next_state = self.execute(index, copy(next_stack), copy(variables))
+        then_state, else_state = (
+            (jump_state, next_state) if jump_if_true else (next_state, jump_state)
+        )
+        return State(ConditionalState(body=[UnresolvedCase(test, then_state)], orelse=else_state))
+
+
+def parse_bytecode(func: Callable, inline_constants: bool = False) -> State:
+    """
+    Build the `State` tree of `func` from its bytecode.
+    """
+    return BytecodeParser(func, inline_constants=inline_constants).parse()
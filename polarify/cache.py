@@ -0,0 +1,162 @@
+"""
+Process-wide cache of the functions compiled by `polarify`.
+
+Functions created by a factory share their code object and only differ in their closure,
+so the code generated for them is compiled once and bound to the cells of every closure.
+"""
+
+from __future__ import annotations
+
+import ast
+import threading
+import types
+from collections import OrderedDict
+from collections.abc import Hashable, Iterator, Mapping
+from contextlib import contextmanager
+from typing import Any, Callable, NamedTuple
+
+from .main import ConstantInliner, as_literal, inlined_constants
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class TranspileCache:
+    """
+    A least recently used cache of the code objects generated by `polarify`, the
+    `CompilationStats` of their compilation and the constants they inline, see `cache_key`.
+    A `maxsize` of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable | None, valid: Callable[[Any], bool] | None = None) -> Any | None:
+        """
+        The entry of `key`, entries for which `valid` is false are removed and count as misses.
+        """
+        with self._lock:
+            entry = None if key is None else self._entries.get(key)
+            if entry is not None and valid is not None and not valid(entry):
+                del self._entries[key]
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable | None, value: Any):
+        if key is None or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+TRANSPILE_CACHE = TranspileCache()
+
+
+def cache_key(func: Any, options: Mapping[str, Any]) -> Hashable | None:
+    """
+    The code object of `func` together with everything else the generated code depends on:
+    the options of `polarify`, the annotations of `func` and, if constants are inlined,
+    the literal values of the globals and closure variables it references.
+    Attributes of other values, e.g. of modules, are checked by `inlined_unchanged`.
+    Returns None if any of them is not hashable.
+    """
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return None
+    schema = options.get("schema")
+    key: tuple = (
+        code,
+        *((name, value) for name, value in options.items() if name != "schema"),
+        None if schema is None else tuple(schema.items()),
+        tuple(getattr(func, "__annotations__", {}).items()),
+    )
+    if options.get("inline_constants"):
+        namespace = ConstantInliner.from_function(func).namespace
+        key += tuple(
+            (name, type(value), value)
+            for name, value in sorted(namespace.items())
+            if as_literal(value) is not None
+        )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+@contextmanager
+def record_inlined() -> Iterator[dict[str, str]]:
+    """
+    Record the constants inlined by the compilation running in this context.
+    """
+    constants: dict[str, str] = {}
+    token = inlined_constants.set(constants)
+    try:
+        yield constants
+    finally:
+        inlined_constants.reset(token)
+
+
+def inlined_unchanged(func: Any, constants: Mapping[str, str]) -> bool:
+    """
+    Check that the constants recorded by `record_inlined` still resolve to the same literals,
+    e.g. that the attribute of a module hasn't been reassigned.
+    """
+    inliner = ConstantInliner.from_function(func)
+    for source, literal in constants.items():
+        value = as_literal(inliner.resolve(ast.parse(source, mode="eval").body))
+        if value is None or ast.dump(value) != literal:
+            return False
+    return True
+
+
+def find_code(code: types.CodeType, name: str) -> types.CodeType | None:
+    """
+    Find the code object of the function `name` defined in `code`.
+    """
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            found = const if const.co_name == name else find_code(const, name)
+            if found is not None:
+                return found
+    return None
+
+
+def bind(code: types.CodeType, func: Any) -> types.FunctionType:
+    """
+    Create a function from the generated `code` with the globals, defaults and closure of `func`.
+    """
+    cells = dict(zip(func.__code__.co_freevars, func.__closure__ or ()))
+    new_func = types.FunctionType(
+        code,
+        func.__globals__,
+        code.co_name,
+        func.__defaults__,
+        tuple(cells[name] for name in code.co_freevars),
+    )
+    new_func.__kwdefaults__ = func.__kwdefaults__
+    return new_func
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import ast
+import struct
+import typing
+from collections.abc import Iterator, Mapping
+from typing import Any, Callable
+
+import polars as pl
+
+from .main import is_lit_call
+
+PYTHON_TYPE_TO_DTYPE = {
+    bool: pl.Boolean,
+    int: pl.Int64,
+    float: pl.Float64,
+    str: pl.Utf8,
+}
+
+INTEGER_BOUNDS = {
+    "Int8": (-(2**7), 2**7 - 1),
+    "Int16": (-(2**15), 2**15 - 1),
+    "Int32": (-(2**31), 2**31 - 1),
+    "Int64": (-(2**63), 2**63 - 1),
+    "UInt8": (0, 2**8 - 1),
+    "UInt16": (0, 2**16 - 1),
+    "UInt32": (0, 2**32 - 1),
+    "UInt64": (0, 2**64 - 1),
+}
+FLOAT_DTYPES = {"Float32", "Float64"}
+STRING_DTYPES = {"String", "Utf8", "Categorical", "Enum"}
+
+
+def dtype_name(dtype: Any) -> str:
+    return dtype.__name__ if isinstance(dtype, type) else type(dtype).__name__
+
+
+def resolve_dtype(annotation: Any) -> Any | None:
+    """
+    Map a type annotation to a polars dtype.
+    Supports polars dtypes as well as the python builtins `bool`, `int`, `float` and `str`.
+    """
+    if isinstance(annotation, pl.DataType) or (
+        isinstance(annotation, type) and issubclass(annotation, pl.DataType)
+    ):
+        return annotation
+    if isinstance(annotation, type):
+        return PYTHON_TYPE_TO_DTYPE.get(annotation)
+    return None
+
+
+def annotated_dtypes(func: Callable) -> dict[str, Any]:
+    """
+    Collect the polars dtypes of the annotated parameters (and the return value under "return").
+    """
+    try:
+        hints = typing.get_type_hints(func)
+    except Exception:
+        # unresolvable forward references, fall back to the raw annotations
+        hints = getattr(func, "__annotations__", {})
+    dtypes = {name: resolve_dtype(hint) for name, hint in hints.items()}
+    return {name: dtype for name, dtype in dtypes.items() if dtype is not None}
+
+
+class _PrefixPolars(ast.NodeTransformer):
+    def visit_Name(self, node: ast.Name) -> ast.Attribute:
+        return ast.Attribute(value=ast.Name(id="pl", ctx=ast.Load()), attr=node.id, ctx=ast.Load())
+
+
+def dtype_to_ast(dtype: Any) -> ast.expr | None:
+    """
+    Build the AST of a polars dtype, e.g. `pl.Int32` or `pl.List(pl.Int64)`.
+    Returns None for dtypes whose repr isn't a python expression, e.g. `list[i64]` in polars < 0.20.
+    """
+    if isinstance(dtype, type):
+        # the repr of a dtype class is `<class 'polars.datatypes.Int64'>` in polars < 0.20
+        return ast.Attribute(
+            value=ast.Name(id="pl", ctx=ast.Load()), attr=dtype.__name__, ctx=ast.Load()
+        )
+    try:
+        expr = ast.parse(repr(dtype), mode="eval").body
+    except SyntaxError:
+        return None
+    names = [node.id for node in ast.walk(expr) if isinstance(node, ast.Name)]
+    if not all(resolve_dtype(getattr(pl, name, None)) is not None for name in names):
+        return None
+    return _PrefixPolars().visit(expr)
+
+
+def is_branch_call(node: ast.expr) -> bool:
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr in ("then", "otherwise")
+        and isinstance(node.func.value, ast.Call)
+    )
+
+
+def branch_calls(expr: ast.Call) -> Iterator[ast.Call]:
+    """
+    Yield the `then` / `otherwise` calls of a when-then-otherwise chain.
+    """
+    node: ast.expr = expr
+    while isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        if node.func.attr in ("then", "otherwise"):
+            yield node
+        node = node.func.value
+
+
+def is_lookup_call(node: ast.expr) -> bool:
+    """
+    Check whether `node` is a lookup built by `LookupTableBuilder`.
+    """
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "replace_strict"
+        and len(node.args) > 1
+        and isinstance(node.args[1], ast.List)
+    )
+
+
+def lookup_default(node: ast.Call) -> ast.keyword:
+    return next(keyword for keyword in node.keywords if keyword.arg == "default")
+
+
+# arithmetic operators that preserve the dtype of their operands
+DTYPE_PRESERVING_OPS = (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod)
+
+
+def branch_leaves(expr: ast.expr) -> Iterator[ast.expr]:
+    """
+    Yield the values that determine the dtype of `expr`, i.e. the branch values
+    of (nested) when-then-otherwise chains, looking through dtype-preserving arithmetic.
+    """
+    if isinstance(expr, ast.BinOp) and isinstance(expr.op, DTYPE_PRESERVING_OPS):
+        yield from branch_leaves(expr.left)
+        yield from branch_leaves(expr.right)
+        return
+    if isinstance(expr, ast.UnaryOp) and isinstance(expr.op, ast.USub):
+        yield from branch_leaves(expr.operand)
+        return
+    if isinstance(expr, ast.Call) and is_branch_call(expr):
+        for call in branch_calls(expr):
+            yield from branch_leaves(call.args[0])
+        return
+    if isinstance(expr, ast.Call) and is_lookup_call(expr):
+        yield from expr.args[1].elts  # type: ignore[attr-defined]
+        yield from branch_leaves(lookup_default(expr).value)
+        return
+    yield expr
+
+
+def literal_fits(value: Any, dtype: Any) -> bool:
+    name = dtype_name(dtype)
+    if value is None:
+        return True
+    if isinstance(value, bool):
+        return name == "Boolean"
+    if isinstance(value, int) and name in INTEGER_BOUNDS:
+        lower, upper = INTEGER_BOUNDS[name]
+        return lower <= value <= upper
+    if isinstance(value, (int, float)):
+        return name in FLOAT_DTYPES
+    return isinstance(value, str) and name in STRING_DTYPES
+
+
+def expression_dtype(expr: ast.expr, param_dtypes: Mapping[str, Any]) -> Any | None:
+    """
+    The dtype of a parameter with a known dtype, looking through dtype-preserving arithmetic
+    with literals that fit the dtype, e.g. `x % 3`. None for other expressions.
+    """
+    if isinstance(expr, ast.Name):
+        return param_dtypes.get(expr.id)
+    if isinstance(expr, ast.UnaryOp) and isinstance(expr.op, ast.USub):
+        return expression_dtype(expr.operand, param_dtypes)
+    if not (isinstance(expr, ast.BinOp) and isinstance(expr.op, DTYPE_PRESERVING_OPS)):
+        return None
+    operands = [expr.left, expr.right]
+    dtypes = [
+        expression_dtype(operand, param_dtypes)
+        for operand in operands
+        if not isinstance(operand, ast.Constant)
+    ]
+    if not dtypes or any(dtype is None or dtype != dtypes[0] for dtype in dtypes):
+        return None
+    literals = [operand.value for operand in operands if isinstance(operand, ast.Constant)]
+    if not all(value is not None and literal_fits(value, dtypes[0]) for value in literals):
+        return None
+    return dtypes[0]
+
+
+def is_float32(value: float) -> bool:
+    try:
+        return struct.unpack("f", struct.pack("f", value))[0] == value
+    except OverflowError:
+        return False
+
+
+def lookup_key_fits(subject: ast.expr, value: Any, param_dtypes: Mapping[str, Any]) -> bool:
+    """
+    Check whether `subject` can be looked up by the key `value` in a `replace_strict` table.
+    The keys are cast to the dtype of the subject, so the dtype must be known
+    and represent the key exactly. Boolean subjects are never looked up.
+    """
+    dtype = expression_dtype(subject, param_dtypes)
+    if dtype is None or isinstance(value, bool):
+        return False
+    name = dtype_name(dtype)
+    if isinstance(value, int) and name in INTEGER_BOUNDS:
+        lower, upper = INTEGER_BOUNDS[name]
+        return lower <= value <= upper
+    if isinstance(value, (int, float)) and name in FLOAT_DTYPES:
+        return is_float32(value) if name == "Float32" else float(value) == value
+    return isinstance(value, str) and name in ("String", "Utf8")
+
+
+def infer_dtype(expr: ast.expr, param_dtypes: Mapping[str, Any]) -> Any | None:
+    """
+    Infer the dtype of the literal branch values in `expr`.
+    This is only possible if every branch is either a literal or a parameter with a known dtype.
+    All parameters that are returned must share the same dtype, if no parameter is returned
+    directly, all typed parameters must share the same dtype.
+    """
+    candidates = []
+    literals = []
+    for leaf in branch_leaves(expr):
+        if isinstance(leaf, ast.Constant):
+            literals.append(leaf.value)
+        elif isinstance(leaf, ast.Call) and is_lit_call(leaf):
+            literals.append(leaf.args[0].value)  # type: ignore[attr-defined]
+        elif isinstance(leaf, ast.Name) and leaf.id in param_dtypes:
+            candidates.append(param_dtypes[leaf.id])
+        else:
+            return None
+    if not candidates:
+        candidates = list(param_dtypes.values())
+    if not candidates or any(c != candidates[0] for c in candidates):
+        return None
+    dtype = candidates[0]
+    if not all(literal_fits(value, dtype) for value in literals):
+        return None
+    return dtype
+
+
+def build_typed_literal(value: ast.Constant, dtype: ast.expr) -> ast.Call:
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id="pl", ctx=ast.Load()), attr="lit", ctx=ast.Load()),
+        args=[value],
+        keywords=[ast.keyword(arg="dtype", value=dtype)],
+    )
+
+
+def type_branch_literals(expr: ast.expr, dtype: Any) -> ast.expr:
+    """
+    Wrap every literal branch value in `pl.lit(value, dtype=dtype)`
+    so that the output has a predictable dtype.
+    """
+    dtype_ast = dtype_to_ast(dtype)
+    if dtype_ast is None:
+        return expr
+
+    def visit(node: ast.expr, is_branch: bool) -> ast.expr:
+        if isinstance(node, ast.Constant):
+            return build_typed_literal(node, dtype_ast) if is_branch else node
+        if isinstance(node, ast.Call) and is_lit_call(node):
+            return build_typed_literal(node.args[0], dtype_ast) if is_branch else node  # type: ignore[arg-type]
+        if isinstance(node, ast.BinOp) and isinstance(node.op, DTYPE_PRESERVING_OPS):
+            node.left = visit(node.left, is_branch=False)
+            node.right = visit(node.right, is_branch=False)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            node.operand = visit(node.operand, is_branch=False)
+        elif isinstance(node, ast.Call) and is_branch_call(node):
+            for call in branch_calls(node):
+                call.args[0] = visit(call.args[0], is_branch=True)
+        elif isinstance(node, ast.Call) and is_lookup_call(node):
+            # the values of the table are cast to `return_dtype`
+            default = lookup_default(node)
+            default.value = visit(default.value, is_branch=True)
+            node.keywords.append(ast.keyword(arg="return_dtype", value=dtype_ast))
+        return node
+
+    return visit(expr, is_branch=True)
+
+
+def determine_return_dtype(
+    func: Callable,
+    expr: ast.expr,
+    schema: Mapping[str, Any] | None = None,
+    return_dtype: Any | None = None,
+) -> Any | None:
+    """
+    Determine the dtype of the literals returned by `func`.
+    An explicit `return_dtype` takes precedence over the return annotation,
+    which takes precedence over the dtype inferred from the parameter dtypes.
+    """
+    if return_dtype is not None:
+        return resolve_dtype(return_dtype)
+    dtypes = annotated_dtypes(func)
+    if "return" in dtypes:
+        return dtypes["return"]
+    return infer_dtype(expr, parameter_dtypes(func, schema))
+
+
+def parameter_dtypes(func: Callable, schema: Mapping[str, Any] | None = None) -> dict[str, Any]:
+    """
+    The dtypes of the parameters of `func` from its annotations, overridden by `schema`.
+    """
+    dtypes = {name: dtype for name, dtype in annotated_dtypes(func).items() if name != "return"}
+    if schema is not None:
+        dtypes.update({name: resolve_dtype(dtype) for name, dtype in schema.items()})
+    return {name: dtype for name, dtype in dtypes.items() if dtype is not None}
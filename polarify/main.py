@@ -1,14 +1,32 @@
 from __future__ import annotations
 
 import ast
+import dataclasses
+import string
 import sys
+import types
+from abc import ABC, abstractmethod
+from collections import Counter
 from collections.abc import Sequence
+from contextlib import suppress
+from contextvars import ContextVar
 from copy import copy, deepcopy
 from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable
 
-PY_39 = sys.version_info <= (3, 9)
+PY_39 = sys.version_info < (3, 10)
 
-# TODO: make walrus throw ValueError
+# Types whose values can be safely embedded as literals in the generated source.
+# We intentionally compare exact types so that subclasses with custom behaviour
+# (e.g. numpy scalars) are not inlined.
+LITERAL_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+# counts how often the value of every variable is inlined, see `polarify.stats`
+inlined_variables: ContextVar[Counter[str] | None] = ContextVar("inlined_variables", default=None)
+# the dumped literals inlined by `ConstantInliner` by their source, e.g. `config.LIMIT`,
+# see `polarify.cache`
+inlined_constants: ContextVar[dict[str, str] | None] = ContextVar("inlined_constants", default=None)
 
 
 @dataclass
@@ -63,19 +81,302 @@ def build_polars_when_then_otherwise(body: Sequence[ResolvedCase], orelse: ast.e
         )
         then_node = ast.Call(
             func=ast.Attribute(value=when_node, attr="then", ctx=ast.Load()),
-            args=[then],
+            args=[build_branch_value(then)],
             keywords=[],
         )
         nodes.append(then_node)
     final_node = ast.Call(
         func=ast.Attribute(value=nodes[-1], attr="otherwise", ctx=ast.Load()),
-        args=[orelse],
+        args=[build_branch_value(orelse)],
         keywords=[],
     )
     return final_node
 
 
+def build_branch_value(value: ast.expr) -> ast.expr:
+    # polars interprets strings passed to `then` / `otherwise` as column names
+    if isinstance(value, ast.Constant) and isinstance(value.value, str):
+        return build_polars_lit(value)
+    return value
+
+
+def build_polars_is_in(left: ast.expr, values: ast.expr, negate: bool = False) -> ast.expr:
+    is_in_node = ast.Call(
+        func=ast.Attribute(value=left, attr="is_in", ctx=ast.Load()),
+        args=[values],
+        keywords=[],
+    )
+    if negate:
+        return ast.UnaryOp(op=ast.Invert(), operand=is_in_node)
+    return is_in_node
+
+
+def build_list_call(
+    subject: ast.expr,
+    method: str,
+    args: Sequence[ast.expr] = (),
+    keywords: Sequence[ast.keyword] = (),
+) -> ast.Call:
+    # every call gets its own copy of the subject, inlining modifies the calls in place
+    return ast.Call(
+        func=ast.Attribute(
+            value=ast.Attribute(value=deepcopy(subject), attr="list", ctx=ast.Load()),
+            attr=method,
+            ctx=ast.Load(),
+        ),
+        args=list(args),
+        keywords=list(keywords),
+    )
+
+
+def merge_string_parts(parts: Sequence[str | ast.expr]) -> list[str | ast.expr]:
+    """
+    Merge adjacent literal parts and drop empty ones.
+    """
+    merged: list[str | ast.expr] = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    return merged
+
+
+def build_joined_str(parts: Sequence[str | ast.expr]) -> ast.expr:
+    """
+    Build an f-string without conversions and format specifications from literal parts
+    and expressions. Returns a constant if all parts are literals.
+    """
+    merged = merge_string_parts(parts)
+    if all(isinstance(part, str) for part in merged):
+        return ast.Constant(value="".join(str(part) for part in merged))
+    return ast.JoinedStr(
+        values=[
+            ast.Constant(value=part)
+            if isinstance(part, str)
+            else ast.FormattedValue(value=part, conversion=-1, format_spec=None)
+            for part in merged
+        ]
+    )
+
+
+def build_polars_format(parts: Sequence[str | ast.expr]) -> ast.expr:
+    """
+    Build a string from literal parts and expressions using `pl.format`.
+    Falls back to `pl.concat_str` if a literal part contains a placeholder.
+    """
+    merged = merge_string_parts(parts)
+    exprs = [part for part in merged if isinstance(part, ast.expr)]
+    if not exprs:
+        return ast.Constant(value="".join(str(part) for part in merged))
+    if any(isinstance(part, str) and "{}" in part for part in merged):
+        return ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id="pl", ctx=ast.Load()), attr="concat_str", ctx=ast.Load()
+            ),
+            args=[
+                ast.List(
+                    elts=[
+                        build_polars_lit(ast.Constant(value=part))
+                        if isinstance(part, str)
+                        else part
+                        for part in merged
+                    ],
+                    ctx=ast.Load(),
+                )
+            ],
+            keywords=[],
+        )
+    template = "".join(part if isinstance(part, str) else "{}" for part in merged)
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id="pl", ctx=ast.Load()), attr="format", ctx=ast.Load()),
+        args=[ast.Constant(value=template), *exprs],
+        keywords=[],
+    )
+
+
+def build_polars_lit(value: ast.expr) -> ast.Call:
+    return ast.Call(
+        func=ast.Attribute(value=ast.Name(id="pl", ctx=ast.Load()), attr="lit", ctx=ast.Load()),
+        args=[value],
+        keywords=[],
+    )
+
+
+def string_parts(node: ast.expr) -> list[str | ast.expr] | None:
+    """
+    Split a string-valued expression into literal parts and expressions.
+    Returns None if the expression is not known to be a string.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.JoinedStr):
+        # only f-strings built by `build_joined_str` are left after inlining
+        return [
+            str(value.value) if isinstance(value, ast.Constant) else value.value  # type: ignore[attr-defined]
+            for value in node.values
+        ]
+    return None
+
+
+def is_lit_call(node: ast.Call) -> bool:
+    """
+    Check whether `node` is an untyped string literal like `pl.lit("a")`.
+    """
+    return (
+        isinstance(node.func, ast.Attribute)
+        and node.func.attr == "lit"
+        and len(node.args) == 1
+        and not node.keywords
+        and isinstance(node.args[0], ast.Constant)
+        and isinstance(node.args[0].value, str)
+    )
+
+
+def as_literal(value: Any) -> ast.Constant | None:
+    """
+    Convert an immutable python value into a literal AST node.
+    Returns None if the value cannot be represented as a literal.
+    """
+    if isinstance(value, Enum) and isinstance(value, (int, str)):
+        # IntEnum / StrEnum members behave like their values
+        value = value.value
+    if type(value) in LITERAL_TYPES:
+        return ast.Constant(value=value)
+    if type(value) in (tuple, frozenset) and all(as_literal(v) is not None for v in value):
+        return ast.Constant(value=value)
+    return None
+
+
+# limits of the constant folding, the same as those of CPython's AST optimizer:
+# larger results are computed by the generated code instead of at transpile time
+MAX_INT_SIZE = 128  # bits
+MAX_COLLECTION_SIZE = 256
+MAX_STR_SIZE = 4096
+
+
+def fold_size_ok(node: ast.expr) -> bool:
+    """
+    Check that folding the binary operation `node` doesn't produce a huge value,
+    e.g. `2 ** 10**8` or `"a" * 10**9`.
+    """
+    if not isinstance(node, ast.BinOp):
+        return True
+    left = node.left.value  # type: ignore[attr-defined]
+    right = node.right.value  # type: ignore[attr-defined]
+    both_ints = isinstance(left, int) and isinstance(right, int)
+    if isinstance(node.op, ast.Pow) and both_ints and right > 0:
+        return left.bit_length() * right <= MAX_INT_SIZE
+    if isinstance(node.op, ast.LShift) and both_ints:
+        return right <= MAX_INT_SIZE - left.bit_length()
+    if isinstance(node.op, ast.Mult):
+        if both_ints:
+            return left.bit_length() + right.bit_length() <= MAX_INT_SIZE
+        sequence, count = (right, left) if isinstance(left, int) else (left, right)
+        if isinstance(sequence, (str, bytes, tuple)) and isinstance(count, int) and count > 0:
+            limit = MAX_COLLECTION_SIZE if isinstance(sequence, tuple) else MAX_STR_SIZE
+            return len(sequence) * count <= limit
+    return True
+
+
+def fold_constants(node: ast.expr) -> ast.expr:
+    """
+    Evaluate an expression that only consists of constants at transpile time.
+    Returns the original node if it cannot be folded.
+    """
+    operands = [child for child in ast.iter_child_nodes(node) if isinstance(child, ast.expr)]
+    if not all(isinstance(operand, ast.Constant) for operand in operands):
+        return node
+    if not fold_size_ok(node):
+        return node
+    try:
+        expr = ast.fix_missing_locations(ast.Expression(body=node))
+        value = eval(compile(expr, "<polarify>", "eval"), {"__builtins__": {}})
+    except Exception:
+        return node
+    literal = as_literal(value)
+    return node if literal is None else ast.copy_location(literal, node)
+
+
+def has_fixed_attributes(value: Any) -> bool:
+    """
+    Check whether the attributes of `value` can be inlined: those of modules, enum classes,
+    enum members, frozen dataclasses, named tuples and literals.
+    Attributes of other objects, e.g. mutable config instances, are looked up at runtime.
+    """
+    if isinstance(value, (types.ModuleType, Enum)) or as_literal(value) is not None:
+        return True
+    if isinstance(value, type):
+        return issubclass(value, Enum)
+    if isinstance(value, tuple):
+        # named tuples
+        return hasattr(value, "_fields")
+    return dataclasses.is_dataclass(value) and value.__dataclass_params__.frozen  # type: ignore[union-attr]
+
+
 # ruff: noqa: N802
+class ConstantInliner(ast.NodeTransformer):
+    """
+    Replaces references to immutable globals and closure variables with literals.
+    Attribute chains like `Status.ACTIVE.value` are resolved as well.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, namespace: dict[str, Any]):
+        self.namespace = namespace
+
+    @classmethod
+    def from_function(cls, func: Callable) -> ConstantInliner:
+        code = func.__code__
+        local_names = set(code.co_varnames) | set(code.co_cellvars)
+        namespace = {
+            name: func.__globals__[name]
+            for name in code.co_names
+            if name in func.__globals__ and name not in local_names
+        }
+        for name, cell in zip(code.co_freevars, func.__closure__ or ()):
+            # empty cells (unbound variables) raise a ValueError
+            with suppress(ValueError):
+                namespace[name] = cell.cell_contents
+        return cls(namespace)
+
+    def resolve(self, node: ast.expr) -> Any:
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            return self.namespace.get(node.id, self._MISSING)
+        if isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Load):
+            value = self.resolve(node.value)
+            if value is self._MISSING or not has_fixed_attributes(value):
+                return self._MISSING
+            try:
+                return getattr(value, node.attr)
+            except Exception:
+                return self._MISSING
+        return self._MISSING
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        return self._inline(node) or node
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.AST:
+        return self._inline(node) or self.generic_visit(node)
+
+    def _inline(self, node: ast.expr) -> ast.expr | None:
+        value = self.resolve(node)
+        if value is self._MISSING:
+            return None
+        literal = as_literal(value)
+        if literal is None:
+            return None
+        constants = inlined_constants.get()
+        if constants is not None:
+            constants[ast.unparse(node)] = ast.dump(literal)
+        return ast.copy_location(literal, node)
+
+    def visit_Lambda(self, node: ast.Lambda) -> ast.Lambda:
+        # nested scopes may shadow names, leave them untouched
+        return node
+
+
 class InlineTransformer(ast.NodeTransformer):
     def __init__(self, assignments: dict[str, ast.expr]):
         self.assignments = assignments
@@ -88,44 +389,180 @@ class InlineTransformer(ast.NodeTransformer):
 
     def visit_Name(self, node: ast.Name) -> ast.expr:
         if node.id in self.assignments:
-            return self.visit(self.assignments[node.id])
+            counter = inlined_variables.get()
+            if counter is not None:
+                counter[node.id] += 1
+            return self.assignments[node.id]
         else:
             return node
 
-    def visit_BinOp(self, node: ast.BinOp) -> ast.BinOp:
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
         node.left = self.visit(node.left)
         node.right = self.visit(node.right)
-        return node
+        folded = fold_constants(node)
+        if folded is not node or not isinstance(node.op, ast.Add):
+            return folded
+        # string concatenation
+        left, right = string_parts(node.left), string_parts(node.right)
+        if left is None and right is None:
+            return node
+        return build_joined_str([*(left or [node.left]), *(right or [node.right])])
 
-    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.UnaryOp:
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
         node.operand = self.visit(node.operand)
+        return fold_constants(node)
+
+    def visit_Attribute(self, node: ast.Attribute) -> ast.expr:
+        node.value = self.visit(node.value)
         return node
 
-    def visit_Call(self, node: ast.Call) -> ast.Call:
+    def visit_Call(self, node: ast.Call) -> ast.expr:
+        if (
+            isinstance(node.func, ast.Attribute)
+            and node.func.attr == "format"
+            and isinstance(node.func.value, ast.Constant)
+            and isinstance(node.func.value.value, str)
+        ):
+            return self.visit_str_format(node.func.value.value, node.args, node.keywords)
+        if isinstance(node.func, ast.Attribute):
+            # the receiver of a method call, e.g. `y` in `y.str.len_chars()`
+            node.func = self.visit(node.func)
         node.args = [self.visit(arg) for arg in node.args]
         node.keywords = [ast.keyword(arg=k.arg, value=self.visit(k.value)) for k in node.keywords]
         return node
 
-    def visit_IfExp(self, node: ast.IfExp) -> ast.Call:
-        test = self.visit(node.test)
-        body = self.visit(node.body)
-        orelse = self.visit(node.orelse)
-        return build_polars_when_then_otherwise([ResolvedCase(test, body)], orelse)
+    def visit_str_format(
+        self, template: str, args: list[ast.expr], keywords: list[ast.keyword]
+    ) -> ast.expr:
+        if any(isinstance(arg, ast.Starred) for arg in args) or any(
+            k.arg is None for k in keywords
+        ):
+            raise ValueError("Unpacking arguments in str.format is not supported")
+        named = {k.arg: k.value for k in keywords}
+        parts: list[str | ast.expr] = []
+        auto_index = 0
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            parts.append(literal)
+            if field is None:
+                continue
+            if field == "":
+                value = args[auto_index]
+                auto_index += 1
+            elif field.isdigit():
+                value = args[int(field)]
+            elif field in named:
+                value = named[field]  # type: ignore[index]
+            else:
+                raise ValueError(f"Unsupported field in str.format: {field}")
+            parts.append(self.format_value(value, conversion, spec))
+        return build_joined_str(parts)
+
+    def visit_JoinedStr(self, node: ast.JoinedStr) -> ast.expr:
+        parts: list[str | ast.expr] = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(str(value.value))
+            elif isinstance(value, ast.FormattedValue):
+                spec: str | None = None
+                if value.format_spec is not None:
+                    spec_node = self.visit(value.format_spec)
+                    if not isinstance(spec_node, ast.Constant):
+                        raise ValueError("Format specifications must be constant")
+                    spec = str(spec_node.value)
+                conversion = None if value.conversion == -1 else chr(value.conversion)
+                parts.append(self.format_value(value.value, conversion, spec))
+        return build_joined_str(parts)
+
+    def format_value(
+        self, value: ast.expr, conversion: str | None, spec: str | None
+    ) -> str | ast.expr:
+        value = self.visit(value)
+        if isinstance(value, ast.Constant):
+            # constants can be formatted at transpile time
+            converters: dict[str, Callable[[Any], str]] = {"r": repr, "s": str, "a": ascii}
+            converted = value.value if conversion is None else converters[conversion](value.value)
+            return format(converted, spec or "")
+        if conversion is not None or spec:
+            raise ValueError("Conversions and format specifications are not supported")
+        return value
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.expr:
+        node.test = self.visit(node.test)
+        if isinstance(node.test, ast.Constant):
+            # the condition is known at transpile time
+            return self.visit(node.body if node.test.value else node.orelse)
+        node.body = self.visit(node.body)
+        node.orelse = self.visit(node.orelse)
+        return node
 
     def visit_Constant(self, node: ast.Constant) -> ast.Constant:
         return node
 
-    def visit_Compare(self, node: ast.Compare) -> ast.Compare:
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
         if len(node.comparators) > 1:
             raise ValueError("Polars can't handle chained comparisons")
         node.left = self.visit(node.left)
-        node.comparators = [self.visit(c) for c in node.comparators]
+        comparator = node.comparators[0]
+        if isinstance(node.ops[0], (ast.In, ast.NotIn)) and isinstance(
+            comparator, (ast.Tuple, ast.List, ast.Set)
+        ):
+            comparator.elts = [self.visit(e) for e in comparator.elts]
+        else:
+            node.comparators = [self.visit(comparator)]
+        folded = fold_constants(node)
+        if folded is not node:
+            return folded
+        if isinstance(node.ops[0], (ast.In, ast.NotIn)):
+            # backends lower `in` checks against a list of literals
+            values = self.literal_collection(node.comparators[0])
+            if values is not None:
+                node.comparators = [values]
         return node
 
+    @staticmethod
+    def literal_collection(node: ast.expr) -> ast.List | None:
+        """
+        Returns the elements of a literal collection as a list node, e.g. for `x in (1, 2)`.
+        """
+        if isinstance(node, ast.Constant) and isinstance(node.value, (tuple, frozenset)):
+            elts: list[ast.expr] = [ast.Constant(value=v) for v in node.value]
+        elif isinstance(node, (ast.Tuple, ast.List, ast.Set)) and all(
+            isinstance(e, ast.Constant) for e in node.elts
+        ):
+            elts = node.elts
+        else:
+            return None
+        return ast.List(elts=elts, ctx=ast.Load())
+
     def generic_visit(self, node):
         raise ValueError(f"Unsupported expression type: {type(node)}")
 
 
+def balanced_binop(values: Sequence[ast.expr], op: ast.operator) -> ast.expr:
+    """
+    Combine values with an associative operator in a balanced tree of logarithmic depth.
+    """
+    layer = list(values)
+    while len(layer) > 1:
+        layer = [
+            ast.BinOp(left=layer[i], op=op, right=layer[i + 1]) if i + 1 < len(layer) else layer[i]
+            for i in range(0, len(layer), 2)
+        ]
+    return layer[0]
+
+
+def is_elif(body: list[ast.stmt]) -> bool:
+    """
+    Check whether the else branch of an if statement is an elif (or an else with a single if).
+    Walrus operators in the test must be handled by `parse_body`.
+    """
+    return (
+        len(body) == 1
+        and isinstance(body[0], ast.If)
+        and not any(isinstance(node, ast.NamedExpr) for node in ast.walk(body[0].test))
+    )
+
+
 @dataclass
 class UnresolvedState:
     """
@@ -161,9 +598,11 @@ class UnresolvedState:
 class ReturnState:
     """
     The expression of a return statement.
+    `lineno` is the line of the return statement relative to the parsed source, if known.
     """
 
     expr: ast.expr
+    lineno: int | None = None
 
 
 @dataclass
@@ -185,6 +624,10 @@ class State:
     """
 
     node: UnresolvedState | ReturnState | ConditionalState
+    # if statements without return are merged into conditional expressions, see `merge_if`
+    compact: bool = dataclasses.field(default=False, compare=False)
+    # the leaves found by the last call of `leaves`, only their subtrees can have changed since
+    _leaves: list[State] | None = dataclasses.field(default=None, repr=False, compare=False)
 
     def translate_match(
         self,
@@ -225,78 +668,210 @@ class State:
                 )
             return guard
         elif isinstance(pattern, ast.MatchOr):
-            return ast.BinOp(
-                left=self.translate_match(subj, pattern.patterns[0], guard),
-                op=ast.BitOr(),
-                right=(
-                    self.translate_match(subj, ast.MatchOr(patterns=pattern.patterns[1:]))
-                    if pattern.patterns[2:]
-                    else self.translate_match(subj, pattern.patterns[1])
-                ),
+            alternatives = [self.translate_match(subj, p) for p in pattern.patterns]
+            if any(alternative is None for alternative in alternatives):
+                # one of the alternatives always matches, e.g. a capture pattern
+                return guard
+            # combine the alternatives in a balanced tree, a chain would be as deep
+            # as the number of alternatives
+            matches = balanced_binop(alternatives, ast.BitOr())
+            return (
+                matches if guard is None else ast.BinOp(left=guard, op=ast.BitAnd(), right=matches)
             )
         elif isinstance(pattern, ast.MatchSequence):
-            if isinstance(pattern.patterns[-1], ast.MatchStar):
-                raise ValueError("starred patterns are not supported.")
-
-            if isinstance(subj, ast.Tuple):
-                # TODO: Use polars list operations in the future
-                left = self.translate_match(subj.elts[0], pattern.patterns[0], guard)
-                right = (
-                    self.translate_match(
-                        ast.Tuple(elts=subj.elts[1:]),
-                        ast.MatchSequence(patterns=pattern.patterns[1:]),
-                    )
-                    if pattern.patterns[2:]
-                    else self.translate_match(subj.elts[1], pattern.patterns[1])
-                )
-
-                return (
-                    left or right
-                    if left is None or right is None
-                    else ast.BinOp(left=left, op=ast.BitAnd(), right=right)
-                )
-            raise ValueError("Matching lists is not supported.")
+            assert isinstance(subj, ast.expr)
+            # a tuple subject matches several expressions, any other subject is a list column
+            return (
+                self.translate_tuple_match(subj, pattern, guard)
+                if isinstance(subj, ast.Tuple)
+                else self.translate_list_match(subj, pattern, guard)
+            )
         else:
             raise ValueError(
                 f"Incompatible match and subject types: {type(pattern)} and {type(subj)}."
             )
 
-    def handle_assign(self, expr: ast.Assign | ast.AnnAssign):
+    def translate_tuple_match(
+        self, subj: ast.Tuple, pattern: ast.MatchSequence, guard: ast.expr | None
+    ) -> ast.expr | None:
+        if isinstance(pattern.patterns[-1], ast.MatchStar):
+            raise ValueError("starred patterns are not supported.")
+
+        left = self.translate_match(subj.elts[0], pattern.patterns[0], guard)
+        right = (
+            self.translate_match(
+                ast.Tuple(elts=subj.elts[1:]),
+                ast.MatchSequence(patterns=pattern.patterns[1:]),
+            )
+            if pattern.patterns[2:]
+            else self.translate_match(subj.elts[1], pattern.patterns[1])
+        )
+
+        return (
+            left or right
+            if left is None or right is None
+            else ast.BinOp(left=left, op=ast.BitAnd(), right=right)
+        )
+
+    def translate_list_match(
+        self, subj: ast.expr, pattern: ast.MatchSequence, guard: ast.expr | None
+    ) -> ast.expr:
+        """
+        Translate a sequence pattern matched against a list column, e.g. `case [first, *rest]`.
+        The length of the list is checked with `list.len()`, the elements are matched
+        by `list.get(i)` and a starred capture is bound to a `list.slice`.
+        """
+        patterns = pattern.patterns
+        star = next((i for i, p in enumerate(patterns) if isinstance(p, ast.MatchStar)), None)
+        length = build_list_call(subj, "len")
+        if star is None:
+            conditions: list[ast.expr] = [
+                ast.Compare(left=length, ops=[ast.Eq()], comparators=[ast.Constant(len(patterns))])
+            ]
+        else:
+            # the starred pattern matches the remaining elements, possibly none
+            minimum = len(patterns) - 1
+            conditions = [
+                ast.Compare(left=length, ops=[ast.GtE()], comparators=[ast.Constant(minimum)])
+            ]
+            name = patterns[star].name  # type: ignore[attr-defined]
+            if name is not None:
+                args: list[ast.expr] = [ast.Constant(star)]
+                if star < minimum:
+                    rest = ast.BinOp(
+                        left=build_list_call(subj, "len"),
+                        op=ast.Sub(),
+                        right=ast.Constant(minimum),
+                    )
+                    args.append(rest)
+                self.handle_assign(
+                    ast.Assign(
+                        targets=[ast.Name(id=name, ctx=ast.Store())],
+                        value=build_list_call(subj, "slice", args),
+                    )
+                )
+        for i, element_pattern in enumerate(patterns):
+            if i == star:
+                continue
+            # the elements after the starred pattern are indexed from the end of the list
+            index = i if star is None or i < star else i - len(patterns)
+            element = build_list_call(
+                subj,
+                "get",
+                [ast.Constant(index)],
+                [ast.keyword(arg="null_on_oob", value=ast.Constant(True))],
+            )
+            condition = self.translate_match(element, element_pattern)
+            if condition is not None:
+                conditions.append(condition)
+        if guard is not None:
+            conditions.insert(0, guard)
+        return balanced_binop(conditions, ast.BitAnd())
+
+    def handle_assign(self, expr: ast.Assign | ast.AnnAssign | ast.AugAssign):
         if isinstance(expr, ast.AnnAssign):
             expr = ast.Assign(targets=[expr.target], value=expr.value)
+        elif isinstance(expr, ast.AugAssign):
+            if not isinstance(expr.target, ast.Name):
+                raise ValueError(
+                    f"Unsupported expression type inside assignment target: {type(expr.target)}"
+                )
+            expr = ast.Assign(
+                targets=[ast.Name(id=expr.target.id, ctx=ast.Store())],
+                value=ast.BinOp(
+                    left=ast.Name(id=expr.target.id, ctx=ast.Load()), op=expr.op, right=expr.value
+                ),
+            )
 
-        if isinstance(self.node, UnresolvedState):
-            self.node.handle_assign(expr)
-        elif isinstance(self.node, ConditionalState):
-            for case in self.node.body:
-                case.state.handle_assign(expr)
-            self.node.orelse.handle_assign(expr)
+        for leaf in self.leaves():
+            leaf.node.handle_assign(expr)  # type: ignore[union-attr]
+
+    def leaves(self) -> list[State]:
+        """
+        The states whose execution flow is not finished yet.
+        Sequential if statements create trees as deep as the number of statements,
+        so the tree is traversed with an explicit stack instead of recursively.
+        """
+        leaves = []
+        stack = [self] if self._leaves is None else self._leaves[::-1]
+        while stack:
+            state = stack.pop()
+            if isinstance(state.node, UnresolvedState):
+                leaves.append(state)
+            elif isinstance(state.node, ConditionalState):
+                stack.append(state.node.orelse)
+                stack.extend(reversed([case.state for case in state.node.body]))
+        self._leaves = leaves
+        return leaves
 
     def handle_if(self, stmt: ast.If):
-        if isinstance(self.node, UnresolvedState):
-            self.node = ConditionalState(
-                body=[
+        for leaf in self.leaves():
+            leaf._handle_if(stmt)
+
+    def _handle_if(self, stmt: ast.If):
+        assert isinstance(self.node, UnresolvedState)
+        assignments = self.node.assignments
+        cases: list[UnresolvedCase] = []
+        # elif chains are handled in a loop, every elif becomes another case
+        while True:
+            test = InlineTransformer.inline_expr(stmt.test, assignments)
+            if isinstance(test, ast.Constant) and test.value:
+                # the condition is known at transpile time, the remaining branches are never taken
+                orelse = stmt.body
+                break
+            if not isinstance(test, ast.Constant):
+                cases.append(
                     UnresolvedCase(
-                        InlineTransformer.inline_expr(stmt.test, self.node.assignments),
-                        parse_body(stmt.body, copy(self.node.assignments)),
+                        test, parse_body(stmt.body, copy(assignments), compact=self.compact)
                     )
-                ],
-                orelse=parse_body(stmt.orelse, copy(self.node.assignments)),
+                )
+            if not is_elif(stmt.orelse):
+                orelse = stmt.orelse
+                break
+            stmt = stmt.orelse[0]  # type: ignore[assignment]
+        if not cases:
+            self.node = parse_body(orelse, assignments, compact=self.compact).node
+        else:
+            self.node = ConditionalState(
+                body=cases, orelse=parse_body(orelse, copy(assignments), compact=self.compact)
             )
-        elif isinstance(self.node, ConditionalState):
-            for case in self.node.body:
-                case.state.handle_if(stmt)
-            self.node.orelse.handle_if(stmt)
+
+    def merge_if(self, stmt: ast.If):
+        for leaf in self.leaves():
+            leaf._merge_if(stmt)
+
+    def _merge_if(self, stmt: ast.If):
+        """
+        Merge the assignments of both branches of an if statement without return
+        into conditional expressions, e.g. `if a: s = 1` becomes `s = 1 if a else s`.
+        This avoids duplicating the rest of the function into both branches.
+        """
+        assert isinstance(self.node, UnresolvedState)
+        assignments = self.node.assignments
+        test = InlineTransformer.inline_expr(stmt.test, assignments)
+        body = parse_body(stmt.body, copy(assignments), compact=True).node
+        orelse = parse_body(stmt.orelse, copy(assignments), compact=True).node
+        if (
+            isinstance(test, ast.Constant)
+            or not isinstance(body, UnresolvedState)
+            or not isinstance(orelse, UnresolvedState)
+            or body.assignments.keys() != orelse.assignments.keys()
+        ):
+            # e.g. a variable is only defined in one of the branches
+            self._handle_if(stmt)
+            return
+        for name, value in body.assignments.items():
+            if value is not orelse.assignments[name]:
+                assignments[name] = ast.IfExp(
+                    test=test, body=value, orelse=orelse.assignments[name]
+                )
 
     def handle_return(self, value: ast.expr):
-        if isinstance(self.node, UnresolvedState):
-            self.node = ReturnState(
-                expr=InlineTransformer.inline_expr(value, self.node.assignments)
+        for leaf in self.leaves():
+            leaf.node = ReturnState(
+                expr=InlineTransformer.inline_expr(value, leaf.node.assignments),  # type: ignore[union-attr]
+                lineno=getattr(value, "lineno", None),
             )
-        elif isinstance(self.node, ConditionalState):
-            for case in self.node.body:
-                case.state.handle_return(value)
-            self.node.orelse.handle_return(value)
 
     def handle_match(self, stmt: ast.Match):
         def is_catch_all(case: ast.match_case) -> bool:
@@ -316,6 +891,15 @@ class State:
                 and len(stmt.subject.elts) != len(case.pattern.patterns)
             ) or (isinstance(case.pattern, ast.MatchValue) and isinstance(stmt.subject, ast.Tuple))
 
+        for leaf in self.leaves():
+            leaf._handle_match(stmt, is_catch_all, ignore_case)
+
+    def _handle_match(
+        self,
+        stmt: ast.Match,
+        is_catch_all: Callable[[ast.match_case], bool],
+        ignore_case: Callable[[ast.match_case], bool],
+    ):
         if isinstance(self.node, UnresolvedState):
             # We can always rewrite catch-all patterns to orelse since python throws a SyntaxError if the catch-all pattern is not the last case.
             orelse = next(
@@ -325,13 +909,8 @@ class State:
             self.node = ConditionalState(
                 body=[
                     UnresolvedCase(
-                        # translate_match transforms the match statement case into regular AST expressions so that the InlineTransformer can handle assignments correctly
-                        # Note that by the time parse_body is called this has mutated the assignments
-                        InlineTransformer.inline_expr(
-                            self.translate_match(stmt.subject, case.pattern, case.guard),
-                            self.node.assignments,
-                        ),
-                        parse_body(case.body, copy(self.node.assignments)),
+                        self._case_test(stmt.subject, case),
+                        parse_body(case.body, copy(self.node.assignments), compact=self.compact),
                     )
                     for case in stmt.cases
                     if not is_catch_all(case) and not ignore_case(case)
@@ -339,50 +918,675 @@ class State:
                 orelse=parse_body(
                     orelse,
                     copy(self.node.assignments),
+                    compact=self.compact,
                 ),
             )
-        elif isinstance(self.node, ConditionalState):
-            for case in self.node.body:
-                case.state.handle_match(stmt)
-            self.node.orelse.handle_match(stmt)
+
+    def _case_test(self, subject: ast.expr, case: ast.match_case) -> ast.expr:
+        assert isinstance(self.node, UnresolvedState)
+        # translate_match transforms the match statement case into regular AST expressions so that the InlineTransformer can handle assignments correctly
+        # Note that by the time parse_body is called this has mutated the assignments
+        test = InlineTransformer.inline_expr(
+            self.translate_match(subject, case.pattern, case.guard), self.node.assignments
+        )
+        if not hasattr(test, "lineno"):
+            # the built test has the line of its case, e.g. for `profile_branches`
+            ast.copy_location(test, case.pattern)
+        return test
 
 
-def parse_body(full_body: list[ast.stmt], assignments: dict[str, ast.expr] | None = None) -> State:
+class NamedExprExtractor(ast.NodeTransformer):
+    """
+    Replaces walrus operators (`y := x + 1`) by their target
+    and collects the corresponding assignments in evaluation order.
+    """
+
+    def __init__(self):
+        self.assignments: list[ast.Assign] = []
+
+    @classmethod
+    def extract(cls, expr: ast.expr) -> tuple[ast.expr, list[ast.Assign]]:
+        extractor = cls()
+        expr = extractor.visit(deepcopy(expr))
+        return expr, extractor.assignments
+
+    def visit_NamedExpr(self, node: ast.NamedExpr) -> ast.Name:
+        value = self.visit(node.value)
+        self.assignments.append(
+            ast.Assign(targets=[ast.Name(id=node.target.id, ctx=ast.Store())], value=value)
+        )
+        return ast.Name(id=node.target.id, ctx=ast.Load())
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.IfExp:
+        node.test = self.visit(node.test)
+        # the branches are only evaluated conditionally, so we can't hoist assignments from them
+        if any(
+            isinstance(n, ast.NamedExpr)
+            for branch in (node.body, node.orelse)
+            for n in ast.walk(branch)
+        ):
+            raise ValueError("Walrus operator inside a conditional expression is not supported")
+        return node
+
+    def visit_Lambda(self, node: ast.Lambda) -> ast.Lambda:
+        return node
+
+
+def extract_named_exprs(stmt: ast.stmt, state: State) -> ast.stmt:
+    """
+    Hoist walrus operators out of the expression evaluated by a statement
+    (e.g. the test of an if statement) and handle them as regular assignments.
+    """
+    field = {
+        ast.Assign: "value",
+        ast.AnnAssign: "value",
+        ast.AugAssign: "value",
+        ast.If: "test",
+        ast.Return: "value",
+    }.get(type(stmt))
+    if field is None and not PY_39 and isinstance(stmt, ast.Match):
+        field = "subject"
+    if field is None or getattr(stmt, field) is None:
+        return stmt
+    expr, assignments = NamedExprExtractor.extract(getattr(stmt, field))
+    if not assignments:
+        return stmt
+    for assignment in assignments:
+        state.handle_assign(assignment)
+    # copy the statement since it may be parsed multiple times in different branches
+    stmt = copy(stmt)
+    setattr(stmt, field, expr)
+    return stmt
+
+
+def contains_return(stmt: ast.stmt) -> bool:
+    return any(isinstance(node, ast.Return) for node in ast.walk(stmt))
+
+
+def parse_body(
+    full_body: list[ast.stmt],
+    assignments: dict[str, ast.expr] | None = None,
+    *,
+    compact: bool = False,
+    on_statement: Callable[[ast.stmt, State], None] | None = None,
+) -> State:
+    """
+    Build the state tree of a function body.
+    With `compact`, if statements without return are merged into conditional expressions
+    instead of duplicating the rest of the body into both branches.
+    `on_statement` is called with every statement and the state after it has been handled.
+    """
     if assignments is None:
         assignments = {}
-    state = State(UnresolvedState(assignments))
-    for stmt in full_body:
-        if isinstance(stmt, (ast.Assign, ast.AnnAssign)):
+    state = State(UnresolvedState(assignments), compact=compact)
+    for body_stmt in full_body:
+        stmt = extract_named_exprs(body_stmt, state)
+        if isinstance(stmt, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
             state.handle_assign(stmt)
         elif isinstance(stmt, ast.If):
-            state.handle_if(stmt)
+            if compact and not contains_return(stmt):
+                state.merge_if(stmt)
+            else:
+                state.handle_if(stmt)
         elif isinstance(stmt, ast.Return):
             if stmt.value is None:
                 raise ValueError("return needs a value")
             state.handle_return(stmt.value)
+            if on_statement is not None:
+                on_statement(body_stmt, state)
             break
-        elif isinstance(stmt, ast.Match):
-            assert not PY_39
+        elif not PY_39 and isinstance(stmt, ast.Match):
             state.handle_match(stmt)
         else:
             raise ValueError(f"Unsupported statement type: {type(stmt)}")
+        if on_statement is not None:
+            on_statement(body_stmt, state)
     return state
 
 
-def transform_tree_into_expr(node: State) -> ast.expr:
-    if isinstance(node.node, ReturnState):
-        return node.node.expr
-    elif isinstance(node.node, ConditionalState):
-        if not node.node.body:
-            # this happens if none of the cases will ever match or exist
-            # in these cases we just need to return the orelse body
-            return transform_tree_into_expr(node.node.orelse)
-        return build_polars_when_then_otherwise(
-            [
-                ResolvedCase(case.test, transform_tree_into_expr(case.state))
-                for case in node.node.body
-            ],
-            transform_tree_into_expr(node.node.orelse),
+def prune_cases(
+    body: Sequence[UnresolvedCase], orelse: State
+) -> tuple[list[UnresolvedCase], State]:
+    """
+    Remove cases whose test is a constant.
+    Cases that can never match are dropped, a case that always matches becomes the new orelse.
+    """
+    cases: list[UnresolvedCase] = []
+    for case in body:
+        if isinstance(case.test, ast.Constant):
+            if case.test.value:
+                return cases, case.state
+            continue
+        cases.append(case)
+    return cases, orelse
+
+
+def chain_cases(node: ConditionalState) -> tuple[list[UnresolvedCase], State]:
+    """
+    Collect the (pruned) cases of a conditional state and of the conditional states in its orelse,
+    `if a: ... else: if b: ...` behaves like `if a: ... elif b: ...`.
+    """
+    cases: list[UnresolvedCase] = []
+    while True:
+        body, orelse = prune_cases(node.body, node.orelse)
+        cases += body
+        if not isinstance(orelse.node, ConditionalState):
+            return cases, orelse
+        node = orelse.node
+
+
+def flatten_returns(node: State) -> list[tuple[tuple[ast.expr, ...], ReturnState]]:
+    """
+    Flatten a state tree into a list of cases, the first case whose conditions all hold is taken.
+    Each case consists of the tests on the path to a return statement and the return statement.
+    The last case is the one without conditions.
+    """
+    cases = []
+    # depth-first with an explicit stack, the tree is as deep as the number of if statements
+    stack: list[tuple[State, tuple[ast.expr, ...]]] = [(node, ())]
+    while stack:
+        state, conditions = stack.pop()
+        if isinstance(state.node, ReturnState):
+            cases.append((conditions, state.node))
+        elif isinstance(state.node, ConditionalState):
+            body, orelse = prune_cases(state.node.body, state.node.orelse)
+            stack.append((orelse, conditions))
+            stack.extend((case.state, (*conditions, case.test)) for case in reversed(body))
+        else:
+            raise ValueError("Not all branches return")
+    return cases
+
+
+def flatten_tree(node: State) -> list[tuple[tuple[ast.expr, ...], ast.expr]]:
+    """
+    Like `flatten_returns`, with the returned expressions.
+    """
+    return [(conditions, returned.expr) for conditions, returned in flatten_returns(node)]
+
+
+# expressions that can't be replaced by a variable, e.g. `in` checks are lowered for literal lists
+NOT_HOISTED = (
+    ast.Name,
+    ast.Constant,
+    ast.List,
+    ast.Tuple,
+    ast.Set,
+    ast.Dict,
+    ast.Starred,
+    ast.FormattedValue,
+    ast.Lambda,
+)
+
+
+def expression_slots(node: State) -> list[tuple[ReturnState | UnresolvedCase, str]]:
+    """
+    The objects and attributes holding the tests and returned expressions of a state tree.
+    """
+    slots: list[tuple[ReturnState | UnresolvedCase, str]] = []
+    stack = [node]
+    while stack:
+        state = stack.pop()
+        if isinstance(state.node, ReturnState):
+            slots.append((state.node, "expr"))
+        elif isinstance(state.node, ConditionalState):
+            for case in state.node.body:
+                slots.append((case, "test"))
+                stack.append(case.state)
+            stack.append(state.node.orelse)
+    return slots
+
+
+def count_references(roots: Sequence[ast.AST]) -> tuple[dict[int, int], list[ast.AST]]:
+    """
+    Count how often every node is referenced from the roots and their descendants.
+    Also returns every node once, children before their parents. Lambdas are not entered.
+    """
+    references: dict[int, int] = {}
+    order: list[ast.AST] = []
+    pending: list[tuple[ast.AST, bool]] = [(root, False) for root in roots]
+    while pending:
+        node, expanded = pending.pop()
+        if expanded:
+            order.append(node)
+            continue
+        references[id(node)] = references.get(id(node), 0) + 1
+        if references[id(node)] == 1:
+            pending.append((node, True))
+            if not isinstance(node, ast.Lambda):
+                pending.extend((child, False) for child in ast.iter_child_nodes(node))
+    return references, order
+
+
+def hoist_shared_expressions(node: State) -> list[tuple[str, ast.expr]]:
+    """
+    Replace the expressions that occur more than once in the state tree by variables.
+    Inlining shares the value of a variable between all its uses, e.g. the value of `s`
+    in `s = s + s`, without hoisting the generated expression grows exponentially.
+    Returns the names and values of the variables in the order they must be assigned.
+    """
+    slots = expression_slots(node)
+    references, order = count_references([getattr(owner, attr) for owner, attr in slots])
+    shared = [
+        expr
+        for expr in order
+        if references[id(expr)] > 1
+        and isinstance(expr, ast.expr)
+        and not isinstance(expr, NOT_HOISTED)
+    ]
+    names = {id(expr): f"_shared{i}" for i, expr in enumerate(shared)}
+
+    def replace(value: Any) -> Any:
+        if isinstance(value, ast.AST) and id(value) in names:
+            return ast.Name(id=names[id(value)], ctx=ast.Load())
+        return value
+
+    for expr in order:
+        if not isinstance(expr, ast.Lambda):
+            for field, value in ast.iter_fields(expr):
+                new_value = (
+                    [replace(v) for v in value] if isinstance(value, list) else replace(value)
+                )
+                setattr(expr, field, new_value)
+    for owner, attr in slots:
+        setattr(owner, attr, replace(getattr(owner, attr)))
+    return [(names[id(expr)], expr) for expr in shared]
+
+
+class Backend(ast.NodeTransformer, ABC):
+    """
+    Generates the code of a polarified function from the `State` tree built by `parse_body`.
+
+    The expressions in the tree are python expressions, backends lower the constructs
+    that don't map to operators of the target library:
+    conditional expressions, `in` checks against a list of literals and f-strings.
+    """
+
+    name: str
+    # modules imported by the generated code and their aliases, e.g. `import polars as pl`
+    imports: tuple[tuple[str, str], ...] = ()
+    # the names bound when the generated function runs: the parameters of the function
+    # and the variables assigned by `hoist_shared_expressions`
+    bound_names: frozenset[str] = frozenset()
+
+    def generate(self, node: State) -> tuple[list[ast.stmt], ast.expr]:
+        """
+        Returns the statements preceding the return statement of the generated function
+        and the returned expression.
+        """
+        return [], self.transform_tree(node)
+
+    def transform_tree(self, node: State) -> ast.expr:
+        # post-order traversal with an explicit stack, the tree is as deep as
+        # the number of if statements
+        results: dict[int, ast.expr] = {}
+        chains: dict[int, tuple[list[UnresolvedCase], State]] = {}
+        stack = [node]
+        while stack:
+            state = stack[-1]
+            if isinstance(state.node, ReturnState):
+                results[id(state)] = self.lower(state.node.expr)
+                stack.pop()
+            elif isinstance(state.node, ConditionalState):
+                if id(state) not in chains:
+                    chains[id(state)] = body, orelse = chain_cases(state.node)
+                    stack.extend([orelse, *reversed([case.state for case in body])])
+                    continue
+                body, orelse = chains[id(state)]
+                # if none of the cases will ever match, we just need to return the orelse body
+                results[id(state)] = (
+                    self.build_conditional(
+                        [
+                            ResolvedCase(self.lower(case.test), results[id(case.state)])
+                            for case in body
+                        ],
+                        results[id(orelse)],
+                    )
+                    if body
+                    else results[id(orelse)]
+                )
+                stack.pop()
+            else:
+                raise ValueError("Not all branches return")
+        return results[id(node)]
+
+    def build_masks(
+        self, cases: Sequence[tuple[ast.expr, ...]]
+    ) -> tuple[list[ast.stmt], list[ast.expr]]:
+        """
+        Assign the conditions of flattened cases (see `flatten_tree`) to variables.
+        The mask of every condition is computed once and combined with the masks
+        of the cases nested below it. Returns the assignments and the mask of every case.
+        """
+        statements: list[ast.stmt] = []
+        masks: dict[tuple[int, ...], ast.Name] = {}
+
+        def mask(conditions: tuple[ast.expr, ...]) -> ast.Name:
+            # nested cases share the test nodes of their parents
+            key = tuple(map(id, conditions))
+            if key not in masks:
+                value = self.lower(conditions[-1])
+                if len(conditions) > 1:
+                    value = self.build_and(mask(conditions[:-1]), value)
+                name = f"_mask{len(masks)}"
+                statements.append(
+                    ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=value)
+                )
+                masks[key] = ast.Name(id=name, ctx=ast.Load())
+            return masks[key]
+
+        return statements, [mask(conditions) for conditions in cases]
+
+    def build_and(self, left: ast.expr, right: ast.expr) -> ast.expr:
+        return ast.BinOp(left=left, op=ast.BitAnd(), right=right)
+
+    def lower(self, expr: ast.expr) -> ast.expr:
+        # expressions may be shared between branches, so we must not modify them in place
+        lowered = self.visit(deepcopy(expr))
+        assert isinstance(lowered, ast.expr)
+        return lowered
+
+    def lower_value(self, expr: ast.expr) -> ast.expr:
+        """
+        Lower an expression assigned to a variable of the generated function,
+        see `hoist_shared_expressions`.
+        """
+        return self.lower(expr)
+
+    @abstractmethod
+    def build_conditional(self, body: Sequence[ResolvedCase], orelse: ast.expr) -> ast.expr:
+        """
+        Select the value of the first case whose test holds, `orelse` if none holds.
+        """
+
+    @abstractmethod
+    def build_is_in(self, left: ast.expr, values: ast.List, negate: bool) -> ast.expr:
+        """
+        Check whether `left` is (or with `negate`, is not) one of the literals in `values`.
+        """
+
+    @abstractmethod
+    def build_format(self, parts: Sequence[str | ast.expr]) -> ast.expr:
+        """
+        Concatenate literal strings and the string representation of expressions.
+        """
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.expr:
+        return self.build_conditional(
+            [ResolvedCase(self.visit(node.test), self.visit(node.body))], self.visit(node.orelse)
         )
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        self.generic_visit(node)
+        values = node.comparators[0]
+        if (
+            isinstance(node.ops[0], (ast.In, ast.NotIn))
+            and isinstance(values, ast.List)
+            and all(isinstance(e, ast.Constant) for e in values.elts)
+        ):
+            return self.build_is_in(node.left, values, negate=isinstance(node.ops[0], ast.NotIn))
+        return node
+
+    def visit_JoinedStr(self, node: ast.JoinedStr) -> ast.expr:
+        parts = string_parts(node)
+        assert parts is not None
+        return self.build_format([self.visit(p) if isinstance(p, ast.expr) else p for p in parts])
+
+
+class PolarsBackend(Backend):
+    name = "polars"
+    imports = (("polars", "pl"),)
+
+    def build_conditional(self, body: Sequence[ResolvedCase], orelse: ast.expr) -> ast.expr:
+        return build_polars_when_then_otherwise(body, orelse)
+
+    def build_is_in(self, left: ast.expr, values: ast.List, negate: bool) -> ast.expr:
+        return build_polars_is_in(left, values, negate)
+
+    def build_format(self, parts: Sequence[str | ast.expr]) -> ast.expr:
+        return build_polars_format(parts)
+
+
+# `ast.unparse` and `compile` recurse once per link of a when-then chain,
+# longer chains are split into nested chains assigned to variables
+MAX_CHAIN_LENGTH = 32
+
+
+def unchain_when_then_otherwise(node: ast.expr) -> tuple[list[ResolvedCase], ast.expr] | None:
+    """
+    Returns the cases and the otherwise value of a `pl.when(...).then(...)...otherwise(...)` chain.
+    """
+    if not (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "otherwise"
+    ):
+        return None
+    body = []
+    then: ast.expr = node.func.value
+    while isinstance(then, ast.Call) and isinstance(then.func, ast.Attribute):
+        when = then.func.value
+        if not (
+            then.func.attr == "then"
+            and isinstance(when, ast.Call)
+            and isinstance(when.func, ast.Attribute)
+            and when.func.attr == "when"
+        ):
+            return None
+        body.append(ResolvedCase(when.args[0], then.args[0]))
+        then = when.func.value
+    if not (body and isinstance(then, ast.Name) and then.id == "pl"):
+        return None
+    return body[::-1], node.args[0]
+
+
+class WhenChainSplitter(ast.NodeTransformer):
+    """
+    Splits when-then chains with more than `MAX_CHAIN_LENGTH` cases.
+    The last cases are assigned to a variable which is the otherwise value of the preceding cases,
+    this also keeps building the expression in polars linear in the number of cases.
+    """
+
+    def __init__(self):
+        self.statements: list[ast.stmt] = []
+
+    @classmethod
+    def split(cls, expr: ast.expr) -> tuple[list[ast.stmt], ast.expr]:
+        splitter = cls()
+        expr = splitter.visit(expr)
+        return splitter.statements, expr
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        chain = unchain_when_then_otherwise(node)
+        if chain is None:
+            return self.generic_visit(node)
+        body = [ResolvedCase(self.visit(test), self.visit(then)) for test, then in chain[0]]
+        orelse = self.visit(chain[1])
+        while len(body) > MAX_CHAIN_LENGTH:
+            body, tail = body[:-MAX_CHAIN_LENGTH], body[-MAX_CHAIN_LENGTH:]
+            name = f"_when{len(self.statements)}"
+            self.statements.append(
+                ast.Assign(
+                    targets=[ast.Name(id=name, ctx=ast.Store())],
+                    value=build_polars_when_then_otherwise(tail, orelse),
+                )
+            )
+            orelse = ast.Name(id=name, ctx=ast.Load())
+        return build_polars_when_then_otherwise(body, orelse)
+
+
+# runs of literal cases with at least this many keys are lowered to a lookup
+MIN_LOOKUP_KEYS = 8
+
+
+def lookup_value(node: ast.expr) -> ast.Constant | None:
+    """
+    Returns the literal of a key or value of a lookup table, e.g. `1`, `"a"` or `pl.lit("a")`.
+    """
+    if isinstance(node, ast.Call) and is_lit_call(node):
+        node = node.args[0]
+    if not isinstance(node, ast.Constant):
+        return None
+    return node
+
+
+def lookup_keys(test: ast.expr) -> list[dict[str, tuple[ast.expr, Any]]] | None:
+    """
+    Returns the keys matched by a condition of equality checks against literals,
+    e.g. `(a == 1) & b.is_in([2, 3])` matches `{a: 1, b: 2}` and `{a: 1, b: 3}`.
+    The subjects of the keys are identified by their dumped AST.
+    """
+    if isinstance(test, ast.Compare) and isinstance(test.ops[0], ast.Eq):
+        key = lookup_value(test.comparators[0])
+        # null never equals a value and NaN never equals itself
+        valid = (
+            key is not None
+            and isinstance(key.value, (bool, int, float, str))
+            and key.value == key.value
+        )
+        return [{ast.dump(test.left): (test.left, key.value)}] if valid else None  # type: ignore[union-attr]
+    if (
+        isinstance(test, ast.Call)
+        and isinstance(test.func, ast.Attribute)
+        and test.func.attr == "is_in"
+        and isinstance(test.args[0], ast.List)
+    ):
+        alternatives = [
+            lookup_keys(ast.Compare(left=test.func.value, ops=[ast.Eq()], comparators=[value]))
+            for value in test.args[0].elts
+        ]
+        if any(keys is None for keys in alternatives):
+            return None
+        return [key for keys in alternatives for key in keys]  # type: ignore[union-attr]
+    if isinstance(test, ast.BinOp) and isinstance(test.op, (ast.BitAnd, ast.BitOr)):
+        return combine_keys(test.op, lookup_keys(test.left), lookup_keys(test.right))
+    return None
+
+
+def combine_keys(
+    op: ast.operator,
+    left: list[dict[str, tuple[ast.expr, Any]]] | None,
+    right: list[dict[str, tuple[ast.expr, Any]]] | None,
+) -> list[dict[str, tuple[ast.expr, Any]]] | None:
+    if not left or not right:
+        return None
+    if isinstance(op, ast.BitOr):
+        # the alternatives of a table must all check the same subjects
+        return left + right if left[0].keys() == right[0].keys() else None
+    if left[0].keys() & right[0].keys():
+        return None
+    return [{**a, **b} for a in left for b in right]
+
+
+def build_polars_lookup(
+    subjects: Sequence[ast.expr], table: dict[tuple, ast.expr], default: ast.expr
+) -> ast.Call:
+    """
+    Build `subject.replace_strict(keys, values, default=default)`,
+    multiple subjects are combined into a struct.
+    """
+    if len(subjects) == 1:
+        subject = subjects[0]
+        keys: list[ast.expr] = [ast.Constant(value=key[0]) for key in table]
     else:
-        raise ValueError("Not all branches return")
+        names = [f"k{i}" for i in range(len(subjects))]
+        subject = ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id="pl", ctx=ast.Load()), attr="struct", ctx=ast.Load()
+            ),
+            args=[],
+            keywords=[ast.keyword(arg=name, value=s) for name, s in zip(names, subjects)],
+        )
+        keys = [
+            ast.Dict(
+                keys=[ast.Constant(value=name) for name in names],
+                values=[ast.Constant(value=v) for v in key],
+            )
+            for key in table
+        ]
+    return ast.Call(
+        func=ast.Attribute(value=subject, attr="replace_strict", ctx=ast.Load()),
+        args=[
+            ast.List(elts=keys, ctx=ast.Load()),
+            ast.List(elts=list(table.values()), ctx=ast.Load()),
+        ],
+        keywords=[ast.keyword(arg="default", value=default)],
+    )
+
+
+class LookupTableBuilder(ast.NodeTransformer):
+    """
+    Lowers runs of when-then cases that compare the same subjects against literals and return
+    literals into a single `replace_strict`, e.g. a `match (country, product)` pricing table.
+    Every row is looked up once instead of being compared against every case.
+    `replace_strict` casts the keys to the dtype of the subject and the values to one dtype,
+    so a table is only built if `key_fits(subject, key)` holds for every key
+    and all values have the same type.
+    """
+
+    def __init__(self, key_fits: Callable[[ast.expr, Any], bool]):
+        self.key_fits = key_fits
+
+    @classmethod
+    def build(cls, expr: ast.expr, key_fits: Callable[[ast.expr, Any], bool]) -> ast.expr:
+        expr = cls(key_fits).visit(expr)
+        assert isinstance(expr, ast.expr)
+        return expr
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        chain = unchain_when_then_otherwise(node)
+        if chain is None:
+            return self.generic_visit(node)
+        body = [ResolvedCase(self.visit(test), self.visit(then)) for test, then in chain[0]]
+        # consecutive cases with the same subjects and literal values form a table
+        runs: list[tuple[list[ResolvedCase], list[str] | None]] = []
+        for case in body:
+            keys = lookup_keys(case.test) if lookup_value(case.state) is not None else None
+            names = list(keys[0]) if keys is not None else None
+            if (
+                names is not None
+                and runs
+                and runs[-1][1] is not None
+                and set(runs[-1][1]) == set(names)
+            ):
+                runs[-1][0].append(case)
+            else:
+                runs.append(([case], names))
+        expr = self.visit(chain[1])
+        cases: list[ResolvedCase] = []
+        for run, names in reversed(runs):
+            table = self.table(run, names) if names is not None else None
+            if table is None:
+                cases = run + cases
+                continue
+            if cases:
+                expr = build_polars_when_then_otherwise(cases, expr)
+                cases = []
+            subjects = lookup_keys(run[0].test)[0]  # type: ignore[index]
+            expr = build_polars_lookup([subjects[name][0] for name in names], table, expr)  # type: ignore[union-attr]
+        return build_polars_when_then_otherwise(cases, expr) if cases else expr
+
+    def table(self, run: list[ResolvedCase], names: list[str]) -> dict[tuple, ast.expr] | None:
+        table: dict[tuple, ast.expr] = {}
+        # python considers 1, 1.0 and True equal, polars doesn't cast between them
+        types: dict[str, type] = {}
+        value_types = set()
+        for case in run:
+            value = lookup_value(case.state)
+            assert value is not None
+            if value.value is not None:
+                value_types.add(type(value.value))
+            if len(value_types) > 1:
+                return None
+            for key in lookup_keys(case.test) or []:
+                if any(
+                    types.setdefault(name, type(v)) is not type(v) or not self.key_fits(subject, v)
+                    for name, (subject, v) in key.items()
+                ):
+                    return None
+                # the first case that matches a key wins
+                table.setdefault(tuple(key[name][1] for name in names), value)  # type: ignore[arg-type]
+        return table if len(table) >= MIN_LOOKUP_KEYS else None
+
+
+def transform_tree_into_expr(node: State) -> ast.expr:
+    return PolarsBackend().transform_tree(node)
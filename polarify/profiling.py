@@ -0,0 +1,168 @@
+"""
+Count how often each branch of a polarified function is taken on a sample frame.
+"""
+
+from __future__ import annotations
+
+import ast
+import inspect
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any
+
+import polars as pl
+
+from . import _compile_bound, _parse_function
+from .main import (
+    PolarsBackend,
+    ResolvedCase,
+    WhenChainSplitter,
+    balanced_binop,
+    build_polars_when_then_otherwise,
+    flatten_returns,
+)
+
+
+@dataclass
+class BranchProfile:
+    """
+    A return statement reached under `conditions`.
+    `lineno` is the line of the last condition, i.e. of the if statement or case selecting
+    the branch, and the line of the return statement for the branch without conditions.
+    `evaluated` counts the rows for which the conditions were checked,
+    i.e. the rows that didn't take one of the earlier branches.
+    """
+
+    lineno: int | None
+    conditions: tuple[str, ...]
+    value: str
+    hits: int
+    evaluated: int
+
+    @property
+    def dead(self) -> bool:
+        return self.hits == 0
+
+
+@dataclass
+class BranchReport:
+    name: str
+    rows: int
+    branches: list[BranchProfile]
+
+    @property
+    def dead_branches(self) -> list[BranchProfile]:
+        return [branch for branch in self.branches if branch.dead]
+
+    def __str__(self) -> str:
+        lines = [f"{self.name}: {len(self.branches)} branches on {self.rows} rows"]
+        for branch in self.branches:
+            share = branch.hits / self.rows if self.rows else 0.0
+            location = f"line {branch.lineno}" if branch.lineno is not None else "line ?"
+            condition = " and ".join(branch.conditions) or "else"
+            lines.append(
+                f"  {location:<10}{branch.hits:>10} hits ({share:6.1%}) "
+                f"{branch.evaluated:>10} evaluated  {condition} -> {branch.value}"
+            )
+        return "\n".join(lines)
+
+
+def _branch_index(cases) -> tuple[list[ast.stmt], ast.expr]:
+    """
+    The statements and the expression computing the index of the branch taken by every row.
+    """
+    backend = PolarsBackend()
+    body = [
+        ResolvedCase(backend.lower(balanced_binop(conditions, ast.BitAnd())), ast.Constant(value=i))
+        for i, (conditions, _) in enumerate(cases[:-1])
+    ]
+    if not body:
+        return [], ast.Constant(value=0)
+    return WhenChainSplitter.split(
+        build_polars_when_then_otherwise(body, ast.Constant(value=len(body)))
+    )
+
+
+def _compile_function(
+    func, func_def: ast.FunctionDef, name: str, statements: list[ast.stmt], expr: ast.expr
+) -> Any:
+    """
+    Compile a function with the parameters of `func_def` returning `expr`,
+    bound to the globals and closure of `func`.
+    """
+    func_def.name = name
+    func_def.decorator_list = []
+    func_def.returns = None
+    func_def.body = [
+        ast.Import(names=[ast.alias(name="polars", asname="pl")]),
+        *statements,
+        ast.Return(value=expr),
+    ]
+    return _compile_bound(func_def, func)
+
+
+def _arguments(
+    func, columns: Mapping[str, pl.Expr | str] | None
+) -> tuple[list[pl.Expr], dict[str, pl.Expr]]:
+    """
+    The positional and keyword arguments passing every parameter of `func`
+    the column with the same name, or the column or expression it is mapped to in `columns`.
+    """
+    columns = dict(columns or {})
+    args, kwargs = [], {}
+    for name, parameter in inspect.signature(func).parameters.items():
+        if parameter.kind is inspect.Parameter.VAR_KEYWORD:
+            continue
+        value = columns.get(name, name)
+        expr = pl.col(value) if isinstance(value, str) else value
+        if parameter.kind is inspect.Parameter.KEYWORD_ONLY:
+            kwargs[name] = expr
+        elif parameter.kind is not inspect.Parameter.VAR_POSITIONAL:
+            args.append(expr)
+    return args, kwargs
+
+
+def profile_branches(
+    func,
+    df: pl.DataFrame,
+    columns: Mapping[str, pl.Expr | str] | None = None,
+    *,
+    inline_constants: bool = False,
+) -> BranchReport:
+    """
+    Evaluate which branch of `func` every row of `df` takes and count the hits per branch.
+
+    The branches are the return statements of `func` together with the conditions under which
+    they are reached, in the order in which polarify checks them.
+    The parameters of `func` are passed the columns with the same name,
+    `columns` maps parameter names to other column names or expressions.
+    """
+    func_def, state, _ = _parse_function(func, inline_constants=inline_constants, budget=None)
+    cases = flatten_returns(state)
+    branch_index = _compile_function(func, func_def, "branch_index", *_branch_index(cases))
+
+    args, kwargs = _arguments(func, columns)
+    if len(cases) == 1:
+        counts = {0: df.height}
+    else:
+        indices = df.select(branch_index(*args, **kwargs).alias("branch")).get_column("branch")
+        counts = dict(indices.value_counts().rows())
+
+    # line numbers of the source code are relative to the function definition
+    line_offset = func.__code__.co_firstlineno - 1
+    branches = []
+    evaluated = df.height
+    for i, (conditions, returned) in enumerate(cases):
+        hits = counts.get(i, 0)
+        lineno = getattr(conditions[-1], "lineno", None) if conditions else returned.lineno
+        branches.append(
+            BranchProfile(
+                lineno=None if lineno is None else lineno + line_offset,
+                conditions=tuple(ast.unparse(condition) for condition in conditions),
+                value=ast.unparse(returned.expr),
+                hits=hits,
+                evaluated=evaluated,
+            )
+        )
+        evaluated -= hits
+    return BranchReport(name=func.__qualname__, rows=df.height, branches=branches)
@@ -0,0 +1,189 @@
+"""
+Compile many polarified functions that are applied to the same frame into one transformation
+which computes the predicates they share only once.
+"""
+
+from __future__ import annotations
+
+import ast
+import inspect
+from collections import Counter
+from collections.abc import Callable, Mapping
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import polars as pl
+
+from . import _build_polarified_def, _compile_bound
+from .budget import DEFAULT_BUDGET, ExpressionBudget
+
+FrameT = TypeVar("FrameT", pl.DataFrame, pl.LazyFrame)
+
+PREDICATE_PREFIX = "_polarify_predicate"
+
+
+@dataclass
+class RuleSet:
+    """
+    The outputs of a collection of rules, see `compile_rules`.
+    `predicates` maps the names of boolean helper columns to the predicates used by more than
+    one condition, `exprs` are the outputs of the rules, which read the helper columns.
+    """
+
+    predicates: dict[str, pl.Expr]
+    exprs: list[pl.Expr]
+
+    def apply(self, frame: FrameT) -> FrameT:
+        """
+        Add the outputs of the rules to `frame`, the helper columns are dropped again.
+        """
+        return (
+            frame.with_columns(list(self.predicates.values()))
+            .with_columns(self.exprs)
+            .drop(list(self.predicates))
+        )
+
+
+def predicates(condition: ast.expr) -> list[ast.expr]:
+    """
+    The comparisons and `is_in` checks combined by `&`, `|` and `~` into `condition`.
+    """
+    if isinstance(condition, ast.BinOp) and isinstance(condition.op, (ast.BitAnd, ast.BitOr)):
+        return predicates(condition.left) + predicates(condition.right)
+    if isinstance(condition, ast.UnaryOp) and isinstance(condition.op, ast.Invert):
+        return predicates(condition.operand)
+    if isinstance(condition, ast.Compare) or (
+        isinstance(condition, ast.Call)
+        and isinstance(condition.func, ast.Attribute)
+        and condition.func.attr == "is_in"
+    ):
+        return [condition]
+    return []
+
+
+def conditions(func_def: ast.FunctionDef) -> list[ast.expr]:
+    """
+    The conditions of all `pl.when` calls in the generated function.
+    """
+    return [
+        node.args[0]
+        for node in ast.walk(func_def)
+        if isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "when"
+    ]
+
+
+class _Rule:
+    def __init__(self, name: str, func: Callable, func_def: ast.FunctionDef, inputs: list[str]):
+        self.name = name
+        self.func = func
+        self.func_def = func_def
+        self.params = [arg.arg for arg in func_def.args.args]
+        # the parameters of the rule renamed to the inputs they are bound to
+        self.renames = dict(zip(self.params, inputs))
+
+    def key(self, predicate: ast.expr) -> str | None:
+        """
+        Identifies a predicate across rules, None if it depends on anything but the inputs,
+        e.g. on a closure variable or a variable of the generated function.
+        """
+        renamed = deepcopy(predicate)
+        for node in ast.walk(renamed):
+            if isinstance(node, ast.Name):
+                if node.id not in self.renames and node.id != "pl":
+                    return None
+                node.id = self.renames.get(node.id, node.id)
+        return ast.dump(renamed)
+
+
+def compile_rules(  # noqa: PLR0913
+    rules: Mapping[str, Callable],
+    columns: Mapping[str, pl.Expr | str] | None = None,
+    *,
+    inline_constants: bool = False,
+    schema=None,
+    budget: ExpressionBudget | None = DEFAULT_BUDGET,
+) -> RuleSet:
+    """
+    Transpile `rules`, a mapping of output names to (polarified) functions, into one `RuleSet`.
+
+    The parameters of every rule are passed the columns with the same name,
+    `columns` maps parameter names to other column names or expressions.
+    Predicates like `x > 0` that occur in more than one condition of the rules are computed once
+    as boolean helper columns, so the work grows with the number of distinct predicates instead
+    of the number of rules. The other arguments are passed to `polarify`.
+    """
+    bindings: dict[str, pl.Expr] = {}
+    inputs: dict[str, str] = {}
+    for name, value in (columns or {}).items():
+        bindings[name] = pl.col(value) if isinstance(value, str) else value
+
+    compiled = []
+    for name, function in rules.items():
+        # polarified functions keep the original function as `__wrapped__`
+        func = inspect.unwrap(function)
+        func_def = _build_polarified_def(
+            func, inline_constants=inline_constants, schema=schema, budget=budget
+        )
+        params = [arg.arg for arg in func_def.args.args]
+        for param in params:
+            bindings.setdefault(param, pl.col(param))
+            # parameters bound to the same expression are the same input
+            inputs.setdefault(str(bindings[param]), f"_input{len(inputs)}")
+        compiled.append(
+            _Rule(name, func, func_def, [inputs[str(bindings[param])] for param in params])
+        )
+
+    keyed = [
+        (rule, predicate, rule.key(predicate))
+        for rule in compiled
+        for condition in conditions(rule.func_def)
+        for predicate in predicates(condition)
+    ]
+    counts = Counter(key for _, _, key in keyed if key is not None)
+    helpers: dict[str, str] = {}
+    helper_exprs: dict[str, pl.Expr] = {}
+    replacements: dict[int, str] = {}
+    for rule, predicate, key in keyed:
+        if key is None or counts[key] < 2:  # noqa: PLR2004
+            continue
+        if key not in helpers:
+            helpers[key] = f"{PREDICATE_PREFIX}{len(helpers)}"
+            helper_exprs[helpers[key]] = _evaluate(rule, predicate, bindings).alias(helpers[key])
+        replacements[id(predicate)] = helpers[key]
+
+    exprs = []
+    for rule in compiled:
+        _ReplacePredicates(replacements).visit(rule.func_def)
+        polarified = _compile(rule)
+        exprs.append(polarified(*(bindings[param] for param in rule.params)).alias(rule.name))
+    return RuleSet(helper_exprs, exprs)
+
+
+class _ReplacePredicates(ast.NodeTransformer):
+    def __init__(self, replacements: Mapping[int, str]):
+        self.replacements = replacements
+
+    def visit(self, node: ast.AST) -> Any:
+        if id(node) in self.replacements:
+            return ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id="pl", ctx=ast.Load()), attr="col", ctx=ast.Load()
+                ),
+                args=[ast.Constant(value=self.replacements[id(node)])],
+                keywords=[],
+            )
+        return super().visit(node)
+
+
+def _evaluate(rule: _Rule, predicate: ast.expr, bindings: Mapping[str, pl.Expr]) -> pl.Expr:
+    expr = ast.fix_missing_locations(ast.Expression(body=predicate))
+    namespace = {"pl": pl, **{param: bindings[param] for param in rule.params}}
+    return eval(compile(expr, "<polarify rules>", "eval"), rule.func.__globals__, namespace)
+
+
+def _compile(rule: _Rule) -> Callable:
+    rule.func_def.decorator_list = []
+    return _compile_bound(rule.func_def, rule.func)
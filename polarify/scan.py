@@ -0,0 +1,314 @@
+"""
+Find functions passed to `map_elements`, `map_rows` and `apply` in a source tree
+and check whether they can be transpiled by polarify, without executing them.
+
+Row-wise UDFs, passed to `map_rows` or to `DataFrame.apply` of polars < 0.19, are called
+with a tuple of the values of a row instead of one value per parameter. They are transpiled
+if they only index the row with integer literals, `row[i]` is the column at position `i`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import random
+import timeit
+import warnings
+from collections.abc import Iterator, Sequence
+from copy import deepcopy
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+
+from .bytecode import PY_312
+from .main import parse_body, transform_tree_into_expr
+
+UDF_METHODS = ("map_elements", "map_rows", "apply")
+# keyword names of the function argument of the UDF methods in polars
+UDF_KEYWORDS = ("function", "f", "func")
+# `apply` is row-wise on frames, and elementwise on expressions built by these functions
+EXPRESSION_FUNCTIONS = ("col", "lit", "struct")
+
+
+@dataclass
+class Candidate:
+    """
+    A function passed to one of the `UDF_METHODS`.
+    `error` is the reason why it can't be transpiled, or None if it can.
+    """
+
+    path: Path
+    lineno: int
+    method: str
+    name: str
+    func_def: ast.FunctionDef | None
+    error: str | None = None
+    expr: ast.expr | None = None
+    row_wise: bool = False
+
+    @property
+    def convertible(self) -> bool:
+        return self.error is None
+
+    @property
+    def location(self) -> str:
+        return f"{self.path}:{self.lineno}"
+
+
+def iter_python_files(paths: Sequence[Path]) -> Iterator[Path]:
+    for path in paths:
+        if path.is_dir():
+            for file in sorted(path.rglob("*.py")):
+                # skip hidden directories like .git or .venv
+                if not any(part.startswith(".") for part in file.relative_to(path).parts):
+                    yield file
+        else:
+            yield path
+
+
+def lambda_to_function_def(node: ast.Lambda) -> ast.FunctionDef:
+    func_def = ast.FunctionDef(
+        name="lambda",
+        args=node.args,
+        body=[ast.copy_location(ast.Return(value=node.body), node.body)],
+        decorator_list=[],
+        returns=None,
+        type_comment=None,
+    )
+    if PY_312:
+        func_def.type_params = []  # type: ignore[attr-defined]
+    return ast.copy_location(func_def, node)
+
+
+def is_row_wise(call: ast.Call) -> bool:
+    """
+    Whether the UDF of `call` is passed the rows of a frame, `map_rows` always is.
+    `apply` is elementwise on expressions and series, e.g. `pl.col("x").apply(...)`
+    or `df["x"].apply(...)`, other receivers are assumed to be frames.
+    """
+    assert isinstance(call.func, ast.Attribute)
+    if call.func.attr != "apply":
+        return call.func.attr == "map_rows"
+    return not any(
+        isinstance(node, ast.Subscript)
+        or (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in EXPRESSION_FUNCTIONS
+        )
+        for node in ast.walk(call.func.value)
+    )
+
+
+class _RowFields(ast.NodeTransformer):
+    def __init__(self, row: str):
+        self.row = row
+        self.fields: set[int] = set()
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        index = node.slice
+        if (
+            isinstance(node.value, ast.Name)
+            and node.value.id == self.row
+            and isinstance(index, ast.Constant)
+            and type(index.value) is int
+            and index.value >= 0
+        ):
+            self.fields.add(index.value)
+            return ast.copy_location(ast.Name(id=f"field_{index.value}", ctx=ast.Load()), node)
+        return self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        if node.id == self.row:
+            raise ValueError(
+                f"Row-wise UDFs must only index the row with integer literals, e.g. {self.row}[0]"
+            )
+        return node
+
+
+def row_fields(func_def: ast.FunctionDef) -> ast.FunctionDef:
+    """
+    Rewrite a row-wise UDF into a function with one parameter `field_i` per column,
+    replacing `row[i]` with `field_i`.
+    """
+    args = func_def.args
+    if len(args.posonlyargs) + len(args.args) != 1 or args.vararg or args.kwonlyargs or args.kwarg:
+        raise ValueError("Row-wise UDFs must take the row as their only parameter")
+    (row,) = [*args.posonlyargs, *args.args]
+    transformer = _RowFields(row.arg)
+    new_def = transformer.visit(deepcopy(func_def))
+    n_fields = max(transformer.fields, default=0) + 1
+    new_def.args = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg(arg=f"field_{i}") for i in range(n_fields)],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[],
+    )
+    return new_def
+
+
+def udf_argument(call: ast.Call) -> ast.expr | None:
+    if call.args:
+        return call.args[0]
+    return next((kw.value for kw in call.keywords if kw.arg in UDF_KEYWORDS), None)
+
+
+def find_candidates(path: Path, source: str) -> list[Candidate]:
+    tree = ast.parse(source, filename=str(path))
+    # functions are resolved by name within the same file, later definitions shadow earlier ones
+    func_defs = {node.name: node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)}
+    candidates = []
+    for node in ast.walk(tree):
+        if not (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in UDF_METHODS
+        ):
+            continue
+        argument = udf_argument(node)
+        if argument is None:
+            continue
+        method = node.func.attr
+        row_wise = is_row_wise(node)
+        if isinstance(argument, ast.Lambda):
+            candidate = Candidate(
+                path, node.lineno, method, "lambda", lambda_to_function_def(argument)
+            )
+        elif isinstance(argument, ast.Name) and argument.id in func_defs:
+            candidate = Candidate(path, node.lineno, method, argument.id, func_defs[argument.id])
+        else:
+            candidate = Candidate(
+                path,
+                node.lineno,
+                method,
+                ast.unparse(argument),
+                None,
+                error="function is not defined in this file",
+            )
+        candidate.row_wise = row_wise
+        candidates.append(candidate)
+    return sorted(candidates, key=lambda c: c.lineno)
+
+
+def check_candidate(candidate: Candidate) -> Candidate:
+    """
+    Try to transpile the function of `candidate`, sets `expr` or `error`.
+    """
+    if candidate.func_def is None:
+        return candidate
+    try:
+        func_def = polarified_def(candidate)
+        # parse_body modifies the statements in place
+        candidate.expr = transform_tree_into_expr(parse_body(deepcopy(func_def.body)))
+    except ValueError as e:
+        candidate.error = str(e)
+    return candidate
+
+
+def polarified_def(candidate: Candidate) -> ast.FunctionDef:
+    """
+    The function to transpile, with one parameter per column.
+    """
+    assert candidate.func_def is not None
+    return row_fields(candidate.func_def) if candidate.row_wise else candidate.func_def
+
+
+def scan(paths: Sequence[Path]) -> list[Candidate]:
+    candidates: list[Candidate] = []
+    for path in iter_python_files(paths):
+        try:
+            found = find_candidates(path, path.read_text(encoding="utf-8"))
+        except (SyntaxError, UnicodeDecodeError) as e:
+            warnings.warn(f"Could not parse {path}: {e}", stacklevel=2)
+            continue
+        candidates.extend(check_candidate(candidate) for candidate in found)
+    return candidates
+
+
+def compile_candidate(candidate: Candidate) -> tuple:
+    """
+    Build the original function and the polarified function of a convertible candidate.
+    Only the function definition itself is executed, references to other names in its module
+    are not available.
+    """
+    assert candidate.func_def is not None and candidate.expr is not None
+    original = deepcopy(candidate.func_def)
+    original.name = "original"
+    original.decorator_list = []
+    polarified = deepcopy(polarified_def(candidate))
+    polarified.name = "polarified"
+    polarified.decorator_list = []
+    polarified.body = [
+        ast.Import(names=[ast.alias(name="polars", asname="pl")]),
+        ast.Return(value=candidate.expr),
+    ]
+    module = ast.fix_missing_locations(ast.Module(body=[original, polarified], type_ignores=[]))
+    namespace: dict = {}
+    exec(compile(module, str(candidate.path), "exec"), namespace)
+    return namespace["original"], namespace["polarified"]
+
+
+def benchmark_candidate(candidate: Candidate, n_rows: int, repeat: int = 3) -> tuple[float, float]:
+    """
+    Time the UDF and the polarified expression on `n_rows` rows of random Int64 data,
+    one column per parameter of the polarified function. Returns the best timings in seconds.
+    """
+    original, polarified = compile_candidate(candidate)
+    names = [arg.arg for arg in polarified_def(candidate).args.args]
+    rng = random.Random(0)
+    df = pl.DataFrame({name: [rng.randint(-100, 100) for _ in range(n_rows)] for name in names})
+    # `map_rows` was called `apply` in polars < 0.19
+    map_rows = getattr(df, "map_rows", None) or df.apply  # type: ignore[attr-defined]
+
+    def run_udf():
+        with warnings.catch_warnings():
+            # polars warns that the UDF could be replaced with a native expression
+            warnings.simplefilter("ignore")
+            if candidate.row_wise:
+                map_rows(original)
+            else:
+                map_rows(lambda row: original(*row))
+
+    def run_polarified():
+        df.select(polarified(*[pl.col(name) for name in names]))
+
+    udf = min(timeit.repeat(run_udf, number=1, repeat=repeat))
+    native = min(timeit.repeat(run_polarified, number=1, repeat=repeat))
+    return udf, native
+
+
+def format_candidate(candidate: Candidate) -> str:
+    status = "ok" if candidate.convertible else f"blocked: {candidate.error}"
+    row_wise = ", row-wise" if candidate.row_wise else ""
+    return f"{candidate.location} {candidate.method}({candidate.name}{row_wise}): {status}"
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m polarify")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scan_parser = subparsers.add_parser("scan", help="find UDFs that can be replaced with polarify")
+    scan_parser.add_argument("paths", nargs="+", type=Path)
+    scan_parser.add_argument(
+        "--benchmark", action="store_true", help="benchmark convertible UDFs on synthetic data"
+    )
+    scan_parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    candidates = scan(args.paths)
+    for candidate in candidates:
+        line = format_candidate(candidate)
+        if args.benchmark and candidate.convertible:
+            try:
+                udf, native = benchmark_candidate(candidate, args.rows)
+            except Exception as e:
+                line += f" (benchmark failed: {type(e).__name__}: {e})"
+            else:
+                line += (
+                    f", {udf / native:.1f}x faster ({native * 1e3:.1f} ms vs {udf * 1e3:.1f} ms)"
+                )
+        print(line)
+    n_convertible = sum(candidate.convertible for candidate in candidates)
+    print(f"{n_convertible} of {len(candidates)} UDFs can be transpiled")
+    return 0
@@ -0,0 +1,264 @@
+"""
+Evaluate expensive branches of a polarified function only on the rows that take them.
+
+`pl.when(...).then(...).otherwise(...)` evaluates the value of every branch on every row
+and keeps the value of the branch each row takes, so a regex or a string build in a branch
+that only 1% of the rows take is wasted work on the other 99%.
+"""
+
+from __future__ import annotations
+
+import ast
+import logging
+from collections.abc import Mapping
+from typing import Any, TypeVar
+
+import polars as pl
+
+from . import _parse_function
+from .main import PolarsBackend, build_polars_lit, flatten_returns
+from .profiling import _arguments, _branch_index, _compile_function
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the methods that are considerably slower per row than arithmetic, with their estimated cost
+EXPENSIVE_METHODS = {
+    "contains": 50,
+    "extract": 50,
+    "extract_all": 50,
+    "replace": 50,
+    "replace_all": 50,
+    "split": 20,
+    "strptime": 50,
+    "to_datetime": 50,
+    "json_decode": 100,
+    "format": 20,
+    "concat_str": 20,
+    "map_elements": 1000,
+}
+# the methods whose value for a row depends on other rows, e.g. aggregations and window functions
+NON_ELEMENTWISE_METHODS = {
+    "all",
+    "any",
+    "arg_max",
+    "arg_min",
+    "backward_fill",
+    "count",
+    "diff",
+    "first",
+    "forward_fill",
+    "gather",
+    "head",
+    "implode",
+    "interpolate",
+    "is_duplicated",
+    "is_first_distinct",
+    "is_last_distinct",
+    "is_unique",
+    "last",
+    "len",
+    "map_batches",
+    "max",
+    "mean",
+    "median",
+    "min",
+    "mode",
+    "n_unique",
+    "null_count",
+    "over",
+    "pct_change",
+    "product",
+    "quantile",
+    "rank",
+    "reverse",
+    "sample",
+    "shift",
+    "shuffle",
+    "sort",
+    "sort_by",
+    "std",
+    "sum",
+    "tail",
+    "unique",
+    "var",
+}
+NON_ELEMENTWISE_PREFIXES = ("cum", "ewm_", "rolling")
+# the methods of these namespaces operate on the elements of every row, e.g. `x.list.sum()`
+ELEMENTWISE_NAMESPACES = {"arr", "bin", "cat", "dt", "list", "name", "str", "struct"}
+MIN_SPLIT_COST = 50
+MAX_SPLIT_SHARE = 0.5
+
+ROW_COLUMN = "_polarify_row"
+BRANCH_COLUMN = "_polarify_branch"
+VALUE_COLUMN = "_polarify_value"
+
+
+def expensive(value: T) -> T:
+    """
+    Mark the returned value of a branch as expensive, `split_branches` always evaluates it
+    only on the rows that take the branch. Returns `value` unchanged.
+    """
+    return value
+
+
+def expression_cost(node: ast.AST) -> int:
+    """
+    Estimate the cost per row of a lowered expression: one for every node,
+    calls of the methods in `EXPENSIVE_METHODS` add their cost.
+    """
+    cost = 0
+    for child in ast.walk(node):
+        cost += 1
+        if isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute):
+            cost += EXPENSIVE_METHODS.get(child.func.attr, 0)
+    return cost
+
+
+def is_elementwise(node: ast.AST) -> bool:
+    """
+    Check that the value of a lowered expression for a row only depends on that row,
+    i.e. that it doesn't call aggregations or window functions like `x.mean()` or `x.over(g)`.
+    Methods of the namespaces in `ELEMENTWISE_NAMESPACES` are elementwise.
+    """
+    for child in ast.walk(node):
+        if not (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)):
+            continue
+        method = child.func.attr
+        namespace = child.func.value
+        if isinstance(namespace, ast.Attribute) and namespace.attr in ELEMENTWISE_NAMESPACES:
+            continue
+        if method in NON_ELEMENTWISE_METHODS or method.startswith(NON_ELEMENTWISE_PREFIXES):
+            return False
+        # filling with a strategy copies the values of other rows, filling with a value doesn't
+        if method == "fill_null" and (len(child.args) > 1 or child.keywords):
+            return False
+    return True
+
+
+def _unwrap_marker(node: ast.expr, namespace: Mapping[str, Any]) -> ast.expr | None:
+    """
+    The argument of `expensive(...)` or `module.expensive(...)`, None for other expressions.
+    """
+    if not (isinstance(node, ast.Call) and len(node.args) == 1 and not node.keywords):
+        return None
+    if isinstance(node.func, ast.Name):
+        marker = namespace.get(node.func.id)
+    elif isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+        marker = getattr(namespace.get(node.func.value.id), node.func.attr, None)
+    else:
+        return None
+    return node.args[0] if marker is expensive else None
+
+
+def split_branches(  # noqa: PLR0913
+    func,
+    df: pl.DataFrame,
+    columns: Mapping[str, pl.Expr | str] | None = None,
+    *,
+    inline_constants: bool = False,
+    min_cost: int = MIN_SPLIT_COST,
+    max_share: float = MAX_SPLIT_SHARE,
+) -> pl.Series:
+    """
+    Evaluate `func` on `df` like `polarify`, but evaluate the value of expensive branches
+    only on the rows that take them.
+
+    A branch is split off if its value is wrapped in `expensive(...)`, or if the
+    `expression_cost` of its value is at least `min_cost` and at most `max_share` of the rows
+    take it. The rows of a split branch are selected by filtering on the index of the branch
+    every row takes, the values are scattered back into the result in row order.
+    The other branches are evaluated together in one when-then chain.
+    Values evaluated on a subset of the rows must be elementwise, if the value of any branch
+    calls an aggregation or a window function (see `is_elementwise`), e.g. `x - x.mean()`,
+    no branch is split and `func` is evaluated like `polarify` does.
+    The parameters of `func` are passed the columns with the same name,
+    `columns` maps parameter names to other column names or expressions.
+    """
+    func_def, state, _ = _parse_function(func, inline_constants=inline_constants, budget=None)
+    cases = flatten_returns(state)
+
+    backend = PolarsBackend()
+    marked = []
+    values: list[ast.expr] = []
+    for _, returned in cases:
+        unwrapped = _unwrap_marker(returned.expr, func.__globals__)
+        marked.append(unwrapped is not None)
+        value = backend.lower(returned.expr if unwrapped is None else unwrapped)
+        values.append(build_polars_lit(value) if isinstance(value, ast.Constant) else value)
+    costs = [expression_cost(value) for value in values]
+    statements, index = _branch_index(cases)
+    if isinstance(index, ast.Constant):
+        index = build_polars_lit(index)
+    evaluate = _compile_function(
+        func,
+        func_def,
+        "branch_values",
+        statements,
+        ast.Tuple(elts=[index, *values], ctx=ast.Load()),
+    )
+
+    args, kwargs = _arguments(func, columns)
+    branch_index, *exprs = evaluate(*args, **kwargs)
+    # `with_row_count` was renamed to `with_row_index` in polars 0.20
+    with_row_index = getattr(df, "with_row_index", None) or df.with_row_count
+    indexed = with_row_index(ROW_COLUMN).with_columns(branch_index.alias(BRANCH_COLUMN))
+    counts = dict(indexed.get_column(BRANCH_COLUMN).value_counts().rows())
+
+    # the values of the branches that aren't split are evaluated on the remaining rows as well
+    elementwise = all(is_elementwise(value) for value in values)
+    split = [
+        i
+        for i in range(len(cases))
+        if elementwise
+        and counts.get(i, 0) > 0
+        and (marked[i] or (costs[i] >= min_cost and counts[i] <= max_share * df.height))
+    ]
+    if not elementwise:
+        logger.debug("Not splitting %s, its values aren't elementwise", func.__qualname__)
+    logger.debug("Splitting the branches %s of %s on %d rows", split, func.__qualname__, df.height)
+    name = func.__name__
+    if not split:
+        expr = _chain(exprs, list(range(len(cases)))).alias(name)
+        # `with_columns` broadcasts literals to the height of the frame
+        return indexed.with_columns(expr).get_column(name)
+
+    parts = [
+        indexed.filter(pl.col(BRANCH_COLUMN) == i).select(
+            [pl.col(ROW_COLUMN), exprs[i].alias(VALUE_COLUMN)]
+        )
+        for i in split
+    ]
+    rest = [i for i in range(len(cases)) if i not in split]
+    if rest:
+        parts.append(
+            indexed.filter(~pl.col(BRANCH_COLUMN).is_in(split)).select(
+                [pl.col(ROW_COLUMN), _chain(exprs, rest).alias(VALUE_COLUMN)]
+            )
+        )
+    # the dtype of the unsplit when-then chain, the common type of the values of all branches
+    chain = _chain(exprs, list(range(len(cases)))).alias(VALUE_COLUMN)
+    dtype = indexed.head(0).select(chain).schema[VALUE_COLUMN]
+    result = indexed.with_columns(pl.lit(None).cast(dtype).alias(name)).get_column(name)
+    # `set_at_idx` was renamed to `scatter` in polars 0.19.14
+    scatter_name = "scatter" if hasattr(result, "scatter") else "set_at_idx"
+    # filtering keeps the rows of every part sorted, which some polars versions require
+    for part in parts:
+        result = getattr(result, scatter_name)(
+            part.get_column(ROW_COLUMN), part.get_column(VALUE_COLUMN).cast(dtype)
+        )
+    return result
+
+
+def _chain(exprs: list[pl.Expr], branches: list[int]) -> pl.Expr:
+    """
+    Select the value of the branch in the branch index column, out of `branches`.
+    """
+    *body, last = branches
+    if not body:
+        return exprs[last]
+    chain = pl.when(pl.col(BRANCH_COLUMN) == body[0]).then(exprs[body[0]])
+    for i in body[1:]:
+        chain = chain.when(pl.col(BRANCH_COLUMN) == i).then(exprs[i])  # type: ignore[assignment]
+    return chain.otherwise(exprs[last])
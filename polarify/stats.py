@@ -0,0 +1,103 @@
+"""
+Instrumentation of the compilation of polarified functions.
+"""
+
+from __future__ import annotations
+
+import ast
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from .budget import ExpressionSize
+from .main import inlined_variables
+
+# the phases in the order they run, functions without source code are parsed from bytecode
+PHASES = ("getsource", "ast_parse", "parse_body", "parse_bytecode", "transform", "unparse", "exec")
+
+
+@dataclass
+class CompilationStats:
+    """
+    Timings of the compilation phases of a polarified function in seconds
+    and metrics of the generated code.
+    `nodes` counts the expression nodes of the generated function, `max_depth` is the depth of its
+    most deeply nested expression and `inlined` counts how often the value of every variable
+    was inlined, i.e. duplicated, into the expression.
+    """
+
+    name: str
+    timings: dict[str, float] = field(default_factory=dict)
+    nodes: int = 0
+    when_count: int = 0
+    max_depth: int = 0
+    inlined: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def total_time(self) -> float:
+        return sum(self.timings.values())
+
+    def measure(self, func_def: ast.FunctionDef):
+        size = ExpressionSize()
+        for stmt in func_def.body:
+            nodes, depth = size(stmt)
+            self.nodes += nodes
+            self.max_depth = max(self.max_depth, depth)
+        self.when_count = sum(
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "when"
+            for node in ast.walk(func_def)
+        )
+
+    def explain(self) -> str:
+        lines = [f"{self.name}: compiled in {self.total_time * 1e3:.2f} ms"]
+        lines += [
+            f"  {phase:<15}{self.timings[phase] * 1e3:8.2f} ms"
+            for phase in PHASES
+            if phase in self.timings
+        ]
+        lines.append(f"nodes: {self.nodes}, when: {self.when_count}, max depth: {self.max_depth}")
+        if self.inlined:
+            inlined = ", ".join(f"{name} x{count}" for name, count in self.inlined.most_common())
+            lines.append(f"inlined: {inlined}")
+        return "\n".join(lines)
+
+
+_current_stats: ContextVar[CompilationStats | None] = ContextVar("current_stats", default=None)
+
+
+@contextmanager
+def collect_stats(name: str) -> Iterator[CompilationStats]:
+    """
+    Record the phases and inlined variables of the compilation running in this context.
+    """
+    stats = CompilationStats(name)
+    stats_token = _current_stats.set(stats)
+    inlined_token = inlined_variables.set(stats.inlined)
+    try:
+        yield stats
+    finally:
+        inlined_variables.reset(inlined_token)
+        _current_stats.reset(stats_token)
+
+
+def current_stats() -> CompilationStats | None:
+    return _current_stats.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Add the time spent in this context to the phase `name` of the current stats, if any.
+    """
+    stats = _current_stats.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.timings[name] = stats.timings.get(name, 0.0) + time.perf_counter() - start
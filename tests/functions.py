@@ -114,6 +114,35 @@ def walrus_expr(x):
     return s * y
 
 
+def walrus_return(x):
+    return (y := x * 2) + y
+
+
+def walrus_conditional_expr(x):
+    s = 1 if x > 0 else (y := 2)
+    return s
+
+
+def aug_assign(x):
+    s = 1
+    s += x
+    if x > 0:
+        s *= 2
+    s -= 1
+    return s
+
+
+def aug_assign_accumulator(x):
+    score = 0
+    weight = 3
+    score += weight * x
+    if x > 5:
+        score += 10
+    elif x < -5:
+        score -= 10
+    return score
+
+
 def return_nothing(x):
     if x > 0:
         return
@@ -277,6 +306,59 @@ def global_variable(x):
     return x + a
 
 
+def f_string(x):
+    return f"{x}!"
+
+
+def f_string_branches(x):
+    if x > 0:
+        s = f"pos {x}"
+    else:
+        s = "neg"
+    return s + "."
+
+
+def f_string_constant_spec(x):
+    n = 3
+    return f"{x}:{n:03d}"
+
+
+def str_format(x):
+    return "{}/{y}".format(x, y=x * 2)
+
+
+def string_concat(x):
+    return f"{x}" + "-" + f"{-x}"
+
+
+def f_string_spec(x):
+    return f"{x:.2f}"
+
+
+def elif_lookup_table(x):
+    if x == 0:
+        return "zero"
+    elif x > 90:
+        return "large"
+    elif x == 1:
+        return "one"
+    elif x in (2, 3):
+        return "two or three"
+    elif x == 4:
+        return "four"
+    elif x in (5, -5):
+        return "five"
+    elif x == 6:
+        return "six"
+    elif x == 7:
+        return "seven"
+    elif x == 8:
+        return "eight"
+    elif x == 1:
+        return "unreachable"
+    return "other"
+
+
 functions = [
     signum,
     early_return,
@@ -304,11 +386,20 @@ functions = [
     multiple_if,
     return_unconditional_constant,
     return_conditional_constant,
+    walrus_expr,
+    walrus_return,
+    aug_assign,
+    aug_assign_accumulator,
+    f_string,
+    f_string_branches,
+    f_string_constant_spec,
+    str_format,
+    string_concat,
+    elif_lookup_table,
     *functions_310,
 ]
 
 xfail_functions = [
-    walrus_expr,
     # our test setup does not work with literal expressions
     return_constant,
     return_constant_2,
@@ -325,5 +416,7 @@ unsupported_functions = [
     (return_end, "return needs a value"),
     (no_return, "Not all branches return"),
     (return_nothing, "return needs a value"),
+    (f_string_spec, "format specifications are not supported"),
+    (walrus_conditional_expr, "Walrus operator inside a conditional expression"),
     *unsupported_functions_310,
 ]
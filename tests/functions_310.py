@@ -29,22 +29,22 @@ def match_sequence(x):
     match x:
         case 0, 1:
             return 0
-        case 2:
-            return 2 * x
-        case 3:
-            return 3 * x
-    return x
+        case a, b:
+            return 2 * a + b
+        case 3, _, _:
+            return 3
+    return -1
 
 
 def match_sequence_with_brackets(x):
     match x:
         case [0, 1]:
             return 0
-        case 2:
-            return 2 * x
-        case 3:
-            return 3 * x
-    return x
+        case [a] if a > 2:
+            return 2 * a
+        case []:
+            return 3
+    return -1
 
 
 def match_assignments_inside_branch(x):
@@ -110,10 +110,37 @@ def match_sequence_star(x):
     match x:
         case 0, *other:
             return other
-        case 1:
-            return 1
-        case 2:
-            return 2
+        case [*start, 1, 2]:
+            return start
+        case [first, *middle, last] if first == last:
+            return middle
+    return x
+
+
+def match_sequence_first_last(x):
+    match x:
+        case [first]:
+            return first
+        case [first, *_, last]:
+            return first - last
+    return 0
+
+
+def match_sequence_local_subject(x):
+    values = x
+    match values:
+        case [first, *_] if first > 0:
+            return first
+        case [_, second, *_]:
+            return second
+    return 0
+
+
+def match_tuple_sequence_star(x):
+    y = 1
+    match x, y:
+        case 0, *other:
+            return 0
     return x
 
 
@@ -134,6 +161,14 @@ def match_with_guard(x):
             return 5
 
 
+def match_or_with_guard(x):
+    match x:
+        case 1 | 2 | 3 if x > 1:
+            return 1
+        case _:
+            return 5
+
+
 def match_with_guard_variable(x):
     match x:
         case y if y > 5:
@@ -288,6 +323,49 @@ def match_guard_no_assignation(x):
             return 2
 
 
+def match_lookup_table(x):
+    match x:
+        case 0:
+            return 10
+        case 1 | -1:
+            return 20
+        case 2:
+            return 30
+        case 3:
+            return 40
+        case 4:
+            return 50
+        case 5:
+            return 60
+        case 6:
+            return 70
+        case 7:
+            return 80
+        case _:
+            return x
+
+
+def match_tuple_lookup_table(x):
+    # old polars versions truncate the modulo of negative numbers instead of flooring it,
+    # 120 is a multiple of 3 and 4, the shifted operands are non-negative for x >= -120
+    match (x + 120) % 3, (x + 120) % 4:
+        case 0, 0:
+            return 1
+        case 0, 1:
+            return 2
+        case 1, 0:
+            return 3
+        case 1, 1:
+            return 4
+        case 2, 0:
+            return 5
+        case (2, 1) | (2, 2) | (0, 3):
+            return 6
+        case 0, 1:
+            return 7
+    return 0
+
+
 functions_310 = [
     nested_match,
     match_assignments_inside_branch,
@@ -298,6 +376,7 @@ functions_310 = [
     match_with_or,
     match_multiple_variables,
     match_with_guard,
+    match_or_with_guard,
     match_with_guard_variable,
     match_with_guard_multiple_variable,
     match_sequence_incomplete,
@@ -311,12 +390,21 @@ functions_310 = [
     match_sequence_unmatchable_case_smaller,
     match_sequence_unmatchable_case_smaller_return,
     match_sequence_unmatchable_case_larger,
+    match_lookup_table,
+    match_tuple_lookup_table,
+]
+
+# functions matching sequence patterns against a list column
+list_functions_310 = [
+    match_sequence,
+    match_sequence_with_brackets,
+    match_sequence_star,
+    match_sequence_first_last,
+    match_sequence_local_subject,
 ]
 
 unsupported_functions_310 = [
     (match_mapping, "ast.MatchMapping"),
-    (match_sequence_star, "starred patterns are not supported."),
-    (match_sequence, "Matching lists is not supported."),
-    (match_sequence_with_brackets, "Matching lists is not supported."),
+    (match_tuple_sequence_star, "starred patterns are not supported."),
     (match_guarded_match_as_no_return, "Not all branches return"),
 ]
@@ -0,0 +1,203 @@
+import inspect
+
+import polars as pl
+import pytest
+
+from polarify import polarify, transform_func_to_new_source
+from polarify.main import Backend
+
+from .functions import functions, nested_partial_return_with_assignments, signum
+
+VALUES = list(range(-12, 12))
+
+requires_sql_context = pytest.mark.skipif(
+    "frames" not in inspect.signature(pl.SQLContext).parameters,
+    reason="requires SQLContext(frames=...)",
+)
+
+# old polars versions truncate the modulo of negative numbers instead of flooring it
+requires_floored_modulo = pytest.mark.skipif(
+    pl.DataFrame({"x": [-7]}).select(pl.col("x") % 3).to_series()[0] != 2,  # noqa: PLR2004
+    reason="requires floored modulo",
+)
+
+
+def floor_division(x):
+    if x > 0:
+        return x // 3
+    return x // -5
+
+
+def modulo(x):
+    if x > 0:
+        return x % 3
+    return x % -5
+
+
+@pytest.fixture
+def np():
+    return pytest.importorskip("numpy")
+
+
+def evaluate_numpy(func):
+    np = pytest.importorskip("numpy")
+    result = polarify(func, backend="numpy")(np.array(VALUES))
+    # functions returning a constant return a scalar
+    return np.broadcast_to(result, len(VALUES)).tolist()
+
+
+def evaluate_pyarrow(func):
+    pa = pytest.importorskip("pyarrow")
+    result = polarify(func, backend="pyarrow")(pa.array(VALUES))
+    if isinstance(result, pa.Scalar):
+        return [result.as_py()] * len(VALUES)
+    return result.to_pylist()
+
+
+def evaluate_sql(func):
+    sql = polarify(func, backend="sql")("x")
+    ctx = pl.SQLContext(frames={"df": pl.DataFrame({"x": VALUES})})
+    return ctx.execute(f"SELECT {sql} AS result FROM df", eager=True).to_series().to_list()
+
+
+@pytest.mark.parametrize(
+    "evaluate",
+    [evaluate_numpy, evaluate_pyarrow, pytest.param(evaluate_sql, marks=requires_sql_context)],
+)
+@pytest.mark.parametrize(
+    "func",
+    [
+        *functions,
+        pytest.param(floor_division, marks=requires_floored_modulo),
+        pytest.param(modulo, marks=requires_floored_modulo),
+    ],
+)
+def test_backend_matches_polars(func, evaluate):
+    expected = pl.DataFrame({"x": VALUES}).select(polarify(func)(pl.col("x"))).to_series()
+    result = evaluate(func)
+    assert result == expected.to_list()
+    # `3.0 == 3`, the results must have the dtype of the polars result as well
+    assert [type(value) for value in result] == [type(value) for value in expected.to_list()]
+
+
+def test_numpy_select_over_masks():
+    source = transform_func_to_new_source(nested_partial_return_with_assignments, backend="numpy")
+    assert "import numpy as np" in source
+    assert "_mask0 = x > 0" in source
+    # the nested mask reuses the mask of the outer condition
+    assert "_mask1 = _mask0 & (x > 1)" in source
+    assert "np.select([_mask1, _mask0]" in source
+
+
+def test_numpy_conditional_expression(np):
+    func = polarify(
+        lambda x: "positive" if x > 0 else ("zero" if x == 0 else "negative"), backend="numpy"
+    )
+    assert func(np.array([-1, 0, 1])).tolist() == ["negative", "zero", "positive"]
+
+
+def test_numpy_scalar_arguments(np):
+    assert polarify(signum, backend="numpy")(np.int64(-3)) == -1
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend: cobol"):
+        polarify(signum, backend="cobol")
+
+
+def test_incomplete_backend():
+    class IncompleteBackend(Backend):
+        name = "incomplete"
+
+        def build_conditional(self, body, orelse):  # noqa: ARG002
+            return orelse
+
+    with pytest.raises(TypeError, match="abstract"):
+        IncompleteBackend()
+
+
+def test_dtypes_only_for_polars():
+    with pytest.raises(ValueError, match="only supported by the polars backend"):
+        polarify(signum, backend="numpy", schema={"x": pl.Int8})
+
+
+@pytest.mark.parametrize("func", functions)
+def test_sql_duckdb(func):
+    duckdb = pytest.importorskip("duckdb")
+    df = pl.DataFrame({"x": VALUES})  # noqa: F841, used by duckdb
+    expected = [func(x) for x in VALUES]
+    sql = polarify(func, backend="sql")("x")
+    assert [row[0] for row in duckdb.sql(f"SELECT {sql} FROM df").fetchall()] == expected
+
+
+def test_sql_flattened_case():
+    source = transform_func_to_new_source(nested_partial_return_with_assignments, backend="sql")
+    assert "import" not in source
+    assert (
+        "CASE WHEN ({x} > 0) AND ({x} > 1) THEN (2 + {x}) WHEN ({x} > 0) THEN (-1 * {x})"
+        " ELSE (-5 - {x}) END"
+    ) in source
+
+
+def test_sql_string_literals():
+    func = polarify(lambda x: "it's {big}" if x > 0 else "small", backend="sql")
+    assert func('"x"') == """CASE WHEN ("x" > 0) THEN 'it''s {big}' ELSE 'small' END"""
+
+
+LIMIT = 3
+
+
+def global_name(x):
+    return x + LIMIT
+
+
+def method_call(x):
+    return x.str.len_chars()
+
+
+@pytest.mark.parametrize("func", [global_name, method_call])
+def test_sql_unsupported_expressions(func):
+    with pytest.raises(ValueError, match="Unsupported (name|call) in SQL"):
+        polarify(func, backend="sql")
+
+
+def test_sql_inlined_constants():
+    assert polarify(global_name, backend="sql", inline_constants=True)("x") == "(x + 3)"
+
+
+@requires_sql_context
+def test_sql_floor_division():
+    duckdb = pytest.importorskip("duckdb")
+    df = pl.DataFrame({"x": [7, -7, 7, -7, 6], "y": [2, 2, -2, -2, 3]})
+    sql = polarify(lambda x, y: x // y, backend="sql")("x", "y")
+    expected = [3, -4, -4, 3, 2]
+    assert duckdb.sql(f"SELECT {sql} FROM df").fetchall() == [(v,) for v in expected]
+    # the division keeps integers integers
+    assert duckdb.sql(f"SELECT typeof({sql}) FROM df").fetchone() == ("BIGINT",)
+    ctx = pl.SQLContext(frames={"df": df})
+    result = ctx.execute(f"SELECT {sql} AS result FROM df", eager=True).to_series()
+    assert result.dtype == pl.Int64
+    assert result.to_list() == expected
+
+
+def test_pyarrow_case_when_over_masks():
+    source = transform_func_to_new_source(nested_partial_return_with_assignments, backend="pyarrow")
+    assert "import pyarrow.compute as pc" in source
+    assert "_mask1 = pc.and_kleene(_mask0, pc.greater(x, 1))" in source
+    assert "pc.case_when(pc.make_struct(_mask1, _mask0, field_names=['0', '1'])" in source
+
+
+def test_pyarrow_chunked_array():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({"x": [-2, 0, 3]})
+    assert polarify(signum, backend="pyarrow")(table["x"]).to_pylist() == [-1, 0, 1]
+
+
+def test_pyarrow_integer_division():
+    pa = pytest.importorskip("pyarrow")
+    values = [7, -7, 6, -6, 2**60 + 1, None]
+    for func in [floor_division, modulo, lambda x: x // 2]:
+        result = polarify(func, backend="pyarrow")(pa.array(values))
+        # the values beyond 2**53 aren't exact as floats
+        assert result.type == pa.int64()
+        assert result.to_pylist() == [None if x is None else func(x) for x in values]
@@ -0,0 +1,115 @@
+# ruff: noqa: PLR2004
+import inspect
+import logging
+
+import polars as pl
+import pytest
+
+from polarify import ExpressionBudget, polarify, transform_func_to_new_source
+from polarify.budget import ExpressionBudgetError
+
+VALUES = list(range(-2, 10))
+
+SMALL = {"max_nodes": 500, "max_depth": None, "max_duplication": None}
+
+
+def sequential_assignments(x):
+    s = x
+    if x > 0:
+        s = s + 1
+    if x > 1:
+        s = s + 1
+    if x > 2:
+        s = s + 1
+    if x > 3:
+        s = s * 2
+    if x > 4:
+        s = s + 1
+    if x > 5:
+        s = s - 3
+    if x > 6:
+        s = s + 1
+    return s
+
+
+def repeated_doubling(x):
+    y = x + 1
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    y = y + y
+    return y
+
+
+def evaluate(func) -> list:
+    return pl.DataFrame({"x": VALUES}).select(func(pl.col("x"))).to_series().to_list()
+
+
+def test_default_budget_is_not_exceeded():
+    assert "_shared" not in transform_func_to_new_source(sequential_assignments)
+
+
+@pytest.mark.parametrize("func", [sequential_assignments, repeated_doubling])
+def test_raise(func):
+    with pytest.raises(ExpressionBudgetError, match="nodes > max_nodes=500") as e:
+        polarify(func, budget=ExpressionBudget(**SMALL, on_exceed="raise"))
+    assert e.value.stats.nodes > SMALL["max_nodes"]
+    # the report points to the statements that contribute the most nodes
+    lines = str(e.value).splitlines()
+    assert lines[1] == "Largest statements:"
+    assert "line " in lines[2]
+
+
+def test_raise_reports_statements():
+    with pytest.raises(ExpressionBudgetError) as e:
+        polarify(repeated_doubling, budget=ExpressionBudget(**SMALL, on_exceed="raise"))
+    line = repeated_doubling.__code__.co_firstlineno + 8
+    assert f"  line {line}: y = y + y (511 nodes)" in str(e.value)
+
+
+@pytest.mark.parametrize("func", [sequential_assignments, repeated_doubling])
+def test_compact(func, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        compact = polarify(func, budget=ExpressionBudget(**SMALL))
+    assert "Using the compact lowering" in caplog.text
+    assert evaluate(compact) == [func(x) for x in VALUES]
+    source = transform_func_to_new_source(func, budget=ExpressionBudget(**SMALL))
+    assert "_shared0 = " in source
+    assert len(source) < len(transform_func_to_new_source(func)) / 10
+
+
+def test_compact_exceeded():
+    with pytest.raises(ExpressionBudgetError):
+        polarify(repeated_doubling, budget=ExpressionBudget(max_nodes=10))
+
+
+@pytest.mark.skipif(
+    "frames" not in inspect.signature(pl.SQLContext).parameters,
+    reason="requires SQLContext(frames=...)",
+)
+def test_compact_sql():
+    sql = polarify(repeated_doubling, backend="sql", budget=ExpressionBudget(**SMALL))("x")
+    ctx = pl.SQLContext(frames={"df": pl.DataFrame({"x": VALUES})})
+    result = ctx.execute(f"SELECT {sql} AS result FROM df", eager=True).to_series().to_list()
+    assert result == [repeated_doubling(x) for x in VALUES]
+
+
+def test_warn():
+    with pytest.warns(UserWarning, match="Expression budget exceeded"):
+        func = polarify(repeated_doubling, budget=ExpressionBudget(**SMALL, on_exceed="warn"))
+    assert evaluate(func) == [repeated_doubling(x) for x in VALUES]
+
+
+def test_no_budget():
+    source = transform_func_to_new_source(repeated_doubling, budget=None)
+    assert "_shared" not in source
+
+
+def test_invalid_on_exceed():
+    with pytest.raises(ValueError, match="on_exceed must be one of"):
+        ExpressionBudget(on_exceed="ignore")  # type: ignore[arg-type]
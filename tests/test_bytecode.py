@@ -0,0 +1,93 @@
+import functools
+import inspect
+import textwrap
+
+import polars as pl
+import pytest
+
+import polarify
+from polarify import transform_func_to_new_source
+
+from . import functions as functions_module
+from .functions import bool_op, chained_compare_expr, functions
+
+MAX_VALUE = 5
+
+
+def without_source(func):
+    """
+    Recreate `func` with `exec` so that its source code can't be retrieved.
+    """
+    namespace = dict(vars(inspect.getmodule(func)))
+    source = textwrap.dedent(inspect.getsource(func))
+    exec(compile(source, "<exec>", "exec"), namespace)
+    new_func = namespace[func.__name__]
+    with pytest.raises(OSError):
+        inspect.getsource(new_func)
+    return new_func
+
+
+def assert_matches_python(transformed_func, original_func):
+    values = list(range(-12, 12))
+    result = pl.DataFrame({"x": values}).select(transformed_func(pl.col("x")))
+    assert result.to_series().to_list() == [original_func(x) for x in values]
+
+
+# the bytecode front end supports chained comparisons and boolean operators
+@pytest.mark.parametrize("func", [*functions, chained_compare_expr, bool_op])
+def test_bytecode_front_end(func):
+    assert_matches_python(polarify.polarify(without_source(func)), func)
+
+
+def test_lambda():
+    func = polarify.polarify(lambda x: 1 if x > 0 else (-1 if x < 0 else 0))
+    assert_matches_python(func, functions_module.signum)
+    source = transform_func_to_new_source(lambda x: x * 2 if x > 0 else x)
+    assert source.startswith("def lambda_polarified(x):")
+
+
+def test_default_values():
+    def add(x, y=3, *, z=2):
+        if x > 0:
+            return x + y
+        return x * z
+
+    func = polarify.polarify(without_source(add))
+    df = pl.DataFrame({"x": [-1, 2]})
+    assert df.select(func(pl.col("x"))).to_series().to_list() == [-2, 5]
+
+
+def clip_max(x):
+    return 1 if x > MAX_VALUE else 0
+
+
+def test_inline_constants():
+    func = without_source(clip_max)
+    source = transform_func_to_new_source(func, inline_constants=True)
+    assert "x > 5" in source
+
+
+def loop(x):  # noqa: ARG001
+    s = 0
+    for i in range(3):
+        s = s + i
+    return s
+
+
+def generator(x):
+    yield x
+
+
+@pytest.mark.parametrize(
+    ("func", "match"),
+    [(loop, "Unsupported bytecode instruction"), (generator, "Generators")],
+)
+def test_unsupported_bytecode(func, match):
+    with pytest.raises(ValueError, match=match):
+        polarify.polarify(without_source(func))
+
+
+@pytest.mark.parametrize("func", [abs, str.upper, functools.partial(chained_compare_expr)])
+def test_callables_without_bytecode(func):
+    with pytest.raises(ValueError, match="has no Python bytecode"):
+        polarify.polarify(func)
@@ -0,0 +1,101 @@
+import logging
+import types
+
+import polars as pl
+import pytest
+
+from polarify import ExpressionBudget, cache_clear, cache_info, polarify
+from polarify.cache import TRANSPILE_CACHE
+
+from .functions import signum
+
+
+def make_rule(threshold, inline_constants=False):
+    @polarify(inline_constants=inline_constants)
+    def rule(x):
+        if x > threshold:
+            return 1
+        return 0
+
+    return rule
+
+
+def evaluate(func) -> list:
+    return pl.DataFrame({"x": [1, 5, 10]}).select(func(pl.col("x"))).to_series().to_list()
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache_clear()
+    yield
+    TRANSPILE_CACHE.maxsize = 256
+
+
+def test_closures():
+    rules = [make_rule(threshold) for threshold in (0, 3, 7)]
+    assert cache_info() == (2, 1, 256, 1)
+    assert [evaluate(rule) for rule in rules] == [[1, 1, 1], [0, 1, 1], [0, 0, 1]]
+    assert rules[1].stats is rules[2].stats
+
+
+def test_closures_inline_constants():
+    rules = [make_rule(threshold, inline_constants=True) for threshold in (0, 3, 3)]
+    # inlined values are part of the key
+    assert cache_info() == (1, 2, 256, 2)
+    assert [evaluate(rule) for rule in rules] == [[1, 1, 1], [0, 1, 1], [0, 1, 1]]
+
+
+settings = types.ModuleType("settings")
+settings.THRESHOLD = 3  # type: ignore[attr-defined]
+
+
+def module_rule(x):
+    if x > settings.THRESHOLD:
+        return 1
+    return 0
+
+
+def test_module_attributes():
+    assert evaluate(polarify(module_rule, inline_constants=True)) == [0, 1, 1]
+    assert evaluate(polarify(module_rule, inline_constants=True)) == [0, 1, 1]
+    assert cache_info() == (1, 1, 256, 1)
+    settings.THRESHOLD = 7  # type: ignore[attr-defined]
+    try:
+        # the inlined attribute changed, so the function is compiled again
+        assert evaluate(polarify(module_rule, inline_constants=True)) == [0, 0, 1]
+        assert cache_info() == (1, 2, 256, 1)
+    finally:
+        settings.THRESHOLD = 3  # type: ignore[attr-defined]
+
+
+def test_options():
+    polarify(signum)
+    polarify(signum, backend="numpy")
+    polarify(signum, schema={"x": pl.Int32})
+    polarify(signum, schema={"x": pl.Int32})
+    polarify(signum, budget=ExpressionBudget(max_nodes=1000))
+    assert cache_info() == (1, 4, 256, 4)
+
+
+def test_logging(caplog):
+    polarify(signum)
+    with caplog.at_level(logging.DEBUG, logger="polarify"):
+        func = polarify(signum)
+    (record,) = caplog.records
+    assert record.getMessage() == "Using the cached compilation of signum"
+    assert record.stats is func.stats
+
+
+def test_eviction():
+    TRANSPILE_CACHE.maxsize = 1
+    polarify(signum)
+    polarify(signum, backend="numpy")
+    polarify(signum)
+    assert cache_info() == (0, 3, 1, 1)
+
+
+def test_disabled():
+    TRANSPILE_CACHE.maxsize = 0
+    polarify(signum)
+    polarify(signum)
+    assert cache_info() == (0, 2, 0, 0)
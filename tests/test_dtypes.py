@@ -0,0 +1,87 @@
+import ast
+
+import polars as pl
+import pytest
+from packaging.version import Version
+from polars.testing import assert_frame_equal
+
+from polarify import polarify, transform_func_to_new_source
+from polarify.dtypes import dtype_to_ast, infer_dtype
+
+from .functions import functions, signum
+
+pl_version = Version(pl.__version__)
+
+
+def typed_signum(x: pl.Int16) -> pl.Int16:
+    if x > 0:
+        return 1
+    elif x < 0:
+        return -1
+    return 0
+
+
+def large_literal(x):
+    if x > 0:
+        return 1000
+    return x
+
+
+@pytest.mark.skipif(pl_version < Version("0.20"), reason="literal dtypes differ in old polars")
+@pytest.mark.parametrize("func", functions)
+def test_schema_matches_python_dtypes(func):
+    df = pl.DataFrame({"x": list(range(-12, 12))})
+    transformed_func = polarify(func, schema={"x": pl.Int64})
+    assert_frame_equal(
+        df.select(transformed_func(pl.col("x")).alias("map")),
+        df.map_rows(lambda r: func(r[0])),
+    )
+
+
+@pytest.mark.parametrize("dtype", [pl.Int8, pl.Int16, pl.Int32, pl.Float32])
+def test_schema_preserves_input_dtype(dtype):
+    df = pl.DataFrame({"x": pl.Series([-2, 0, 3], dtype=dtype)})
+    result = df.select(polarify(signum, schema={"x": dtype})(pl.col("x")))
+    assert result.dtypes == [dtype]
+
+
+def test_annotations():
+    df = pl.DataFrame({"x": [-2, 0, 3]})
+    result = df.select(polarify(typed_signum)(pl.col("x")))
+    assert result.dtypes == [pl.Int16]
+    assert result.to_series().to_list() == [-1, 0, 1]
+
+
+def test_return_dtype():
+    source = transform_func_to_new_source(signum, return_dtype=float)
+    assert "pl.lit(1, dtype=pl.Float64)" in source
+    assert "pl.lit(0, dtype=pl.Float64)" in source
+
+
+def test_literal_out_of_range_is_not_typed():
+    source = transform_func_to_new_source(large_literal, schema={"x": pl.Int8})
+    assert "pl.lit" not in source
+    source = transform_func_to_new_source(large_literal, schema={"x": pl.Int16})
+    assert "pl.lit(1000, dtype=pl.Int16)" in source
+
+
+def test_no_typing_without_dtypes():
+    assert "pl.lit" not in transform_func_to_new_source(signum)
+
+
+def test_infer_dtype_conflicting_params():
+    expr = ast.parse("pl.when(x > y).then(x).otherwise(y)", mode="eval").body
+    assert infer_dtype(expr, {"x": pl.Int32, "y": pl.Int64}) is None
+    assert infer_dtype(expr, {"x": pl.Int32, "y": pl.Int32}) == pl.Int32
+
+
+@pytest.mark.parametrize(
+    "dtype", [pl.Int32, pl.Datetime("ms"), pl.List(pl.Int64), pl.Struct({"a": pl.Utf8})]
+)
+def test_dtype_to_ast_roundtrip(dtype):
+    if pl_version < Version("0.20") and not isinstance(dtype, type):
+        # e.g. `list[i64]`
+        assert dtype_to_ast(dtype) is None
+        return
+    source = ast.unparse(dtype_to_ast(dtype))
+    assert eval(source, {"pl": pl}) == dtype
@@ -0,0 +1,174 @@
+# ruff: noqa: PLR2004
+from dataclasses import dataclass
+from enum import Enum, IntEnum
+
+import polars as pl
+import pytest
+from polars.testing import assert_series_equal
+
+from polarify import polarify, transform_func_to_new_source
+
+MAX_AGE = 10
+CODES = (1, 3, 5)
+DEBUG = False
+
+
+class Status(Enum):
+    ACTIVE = 1
+    INACTIVE = 0
+
+
+class Level(IntEnum):
+    HIGH = 7
+
+
+@dataclass
+class Config:
+    threshold: int = 3
+
+
+@dataclass(frozen=True)
+class FrozenConfig:
+    threshold: int = 3
+
+
+CONFIG = Config()
+FROZEN_CONFIG = FrozenConfig()
+
+
+def threshold(x):
+    if x > MAX_AGE:
+        return 1
+    return 0
+
+
+def enum_value(x):
+    if x == Status.ACTIVE.value:
+        return Level.HIGH
+    return 0
+
+
+def pruned_branch(x):
+    s = x
+    if DEBUG:
+        s = x * 100
+    return s
+
+
+def folded_condition(x):
+    limit = MAX_AGE * 2
+    if limit > 5:
+        return x + limit
+    return x
+
+
+def membership(x):
+    if x in CODES:
+        return 1
+    elif x not in (2, 4):
+        return 2
+    return 3
+
+
+def config_threshold(x):
+    if x > CONFIG.threshold:
+        return 1
+    return 0
+
+
+def frozen_config_threshold(x):
+    if x > FROZEN_CONFIG.threshold:
+        return 1
+    return 0
+
+
+def huge_constants(x):
+    if x > 2**10**8:
+        return "a" * 10**9
+    return "b" * 3
+
+
+def shadowed_global(x, MAX_AGE):  # noqa: N803
+    return x + MAX_AGE
+
+
+def make_closure(offset):
+    def closure(x):
+        return x + offset
+
+    return closure
+
+
+@pytest.fixture
+def df():
+    return pl.DataFrame({"x": list(range(-3, 15))})
+
+
+def evaluate(func, df: pl.DataFrame, **kwargs) -> pl.Series:
+    transformed = polarify(inline_constants=True)(func)
+    return df.select(transformed(pl.col("x"), **kwargs).alias("x")).to_series()
+
+
+@pytest.mark.parametrize(
+    "func", [threshold, enum_value, pruned_branch, folded_condition, membership]
+)
+def test_inline_constants_matches_python(func, df):
+    assert evaluate(func, df).to_list() == [func(x) for x in df["x"]]
+
+
+def test_constants_are_inlined():
+    source = transform_func_to_new_source(threshold, inline_constants=True)
+    assert "MAX_AGE" not in source
+    assert "x > 10" in source
+
+
+def test_enum_values_are_inlined():
+    source = transform_func_to_new_source(enum_value, inline_constants=True)
+    assert "Status" not in source
+    assert "Level" not in source
+    assert "pl.when(x == 1).then(7)" in source
+
+
+def test_constant_branches_are_pruned():
+    source = transform_func_to_new_source(pruned_branch, inline_constants=True)
+    assert "when" not in source
+    source = transform_func_to_new_source(folded_condition, inline_constants=True)
+    assert "when" not in source
+    assert "x + 20" in source
+
+
+def test_membership_is_lowered_to_is_in():
+    source = transform_func_to_new_source(membership, inline_constants=True)
+    assert "x.is_in([1, 3, 5])" in source
+    assert "~x.is_in([2, 4])" in source
+
+
+def test_parameters_shadow_globals():
+    source = transform_func_to_new_source(shadowed_global, inline_constants=True)
+    assert "x + MAX_AGE" in source
+
+
+def test_closure_variables_are_inlined(df):
+    closure = make_closure(5)
+    source = transform_func_to_new_source(closure, inline_constants=True)
+    assert "x + 5" in source
+    assert_series_equal(evaluate(closure, df), df["x"] + 5)
+
+
+def test_constants_are_not_inlined_by_default():
+    source = transform_func_to_new_source(threshold)
+    assert "x > MAX_AGE" in source
+
+
+def test_attributes_of_mutable_objects_are_not_inlined():
+    source = transform_func_to_new_source(config_threshold, inline_constants=True)
+    assert "x > CONFIG.threshold" in source
+    source = transform_func_to_new_source(frozen_config_threshold, inline_constants=True)
+    assert "x > 3" in source
+
+
+def test_huge_constants_are_not_folded():
+    source = transform_func_to_new_source(huge_constants, inline_constants=True)
+    assert "2 ** 100000000" in source
+    assert "'a' * 1000000000" in source
+    assert "'bbb'" in source
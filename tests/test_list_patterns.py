@@ -0,0 +1,52 @@
+import inspect
+import sys
+
+import polars as pl
+import pytest
+from hypothesis import given
+from hypothesis.strategies import integers, lists, none, one_of
+
+from polarify import polarify, transform_func_to_new_source
+
+if sys.version_info >= (3, 10):
+    from .functions_310 import (
+        list_functions_310,
+        match_sequence_local_subject,
+        match_sequence_star,
+    )
+else:
+    list_functions_310 = []
+
+# `Expr.list` is a method instead of a namespace in polars < 0.18
+list_get = getattr(pl.col("x").list, "get", None)
+
+pytestmark = [
+    pytest.mark.skipif(sys.version_info < (3, 10), reason="requires python3.10"),
+    pytest.mark.skipif(
+        list_get is None or "null_on_oob" not in inspect.signature(list_get).parameters,
+        reason="requires list.get(null_on_oob=...)",
+    ),
+]
+
+
+@pytest.mark.parametrize("func", list_functions_310)
+@given(values=lists(one_of(none(), lists(integers(-3, 3), max_size=4)), min_size=1))
+def test_list_patterns(func, values):
+    df = pl.DataFrame({"x": values}, schema={"x": pl.List(pl.Int64)})
+    result = df.select(polarify(func)(pl.col("x"))).to_series()
+    assert result.to_list() == [func(value) for value in values]
+
+
+def test_list_operations():
+    source = transform_func_to_new_source(match_sequence_star)
+    assert "x.list.len() >= 1" in source
+    assert "x.list.slice(1)" in source
+    # the elements after the starred pattern are indexed from the end
+    assert "x.list.get(-2, null_on_oob=True) == 1" in source
+    assert "x.list.slice(0, x.list.len() - 2)" in source
+
+
+def test_subject_is_inlined():
+    source = transform_func_to_new_source(match_sequence_local_subject)
+    assert "values" not in source
+    assert "x.list.get(1, null_on_oob=True)" in source
@@ -0,0 +1,254 @@
+# ruff: noqa: PLR0911, PLR2004, SIM116
+import sys
+
+import polars as pl
+import pytest
+from polars.testing import assert_series_equal
+
+from polarify import polarify, transform_func_to_new_source
+from polarify.main import MIN_LOOKUP_KEYS
+
+from .functions import elif_lookup_table, signum
+
+if sys.version_info >= (3, 10):
+    from .functions_310 import match_tuple_lookup_table
+
+# lookup tables are only built if polars has `Expr.replace_strict`
+requires_replace_strict = pytest.mark.skipif(
+    not hasattr(pl.Expr, "replace_strict"), reason="requires Expr.replace_strict"
+)
+
+
+def price(country, product):
+    if (country == "DE") & (product == "a"):
+        return 1.0
+    elif (country == "DE") & (product == "b"):
+        return 2.0
+    elif (country == "FR") & (product == "a"):
+        return 3.0
+    elif (country == "FR") & (product == "b"):
+        return 4.0
+    elif (product == "a") & (country == "US"):
+        return 5.0
+    elif (country == "US") & (product == "b"):
+        return 6.0
+    elif (country == "IT") & (product == "a"):
+        return 7.0
+    elif (country == "IT") & (product == "b"):
+        return 8.0
+    elif (country == "DE") & (product == "a"):
+        return 9.0
+    return 0.0
+
+
+def mixed_key_types(x):
+    if x == 1:
+        return 1
+    elif x == 2.5:
+        return 2
+    elif x == 3:
+        return 3
+    elif x == 4:
+        return 4
+    elif x == 5:
+        return 5
+    elif x == 6:
+        return 6
+    elif x == 7:
+        return 7
+    elif x == 8:
+        return 8
+    return 0
+
+
+def int8_table(x: pl.Int8):
+    if x in [1, 2]:
+        return 1
+    elif x in [3, 4]:
+        return 2
+    elif x in [5, 6]:
+        return 3
+    elif x in [7, 300]:
+        return 4
+    return 0
+
+
+def float_keys(x: int):
+    if x in [1.0, 1.5]:
+        return 1
+    elif x in [2.0, 2.5]:
+        return 2
+    elif x in [3.0, 3.5]:
+        return 3
+    elif x in [4.0, 4.5]:
+        return 4
+    return 0
+
+
+def bool_subject(flag: bool, y: int):
+    if (flag == True) & (y in [1, 2]):  # noqa: E712
+        return 1
+    elif (flag == True) & (y in [3, 4]):  # noqa: E712
+        return 2
+    elif (flag == False) & (y in [1, 2]):  # noqa: E712
+        return 3
+    elif (flag == False) & (y in [3, 4]):  # noqa: E712
+        return 4
+    return 0
+
+
+def mixed_value_types(x: int):
+    if x in [1, 2]:
+        return 1
+    elif x in [3, 4]:
+        return "two"
+    elif x in [5, 6]:
+        return 3
+    elif x in [7, 8]:
+        return 4
+    return 0
+
+
+def sum_table(x, y):
+    if x + y in [1, 2]:
+        return 1
+    elif x + y in [3, 4]:
+        return 2
+    elif x + y in [5, 6]:
+        return 3
+    elif x + y in [7, 8]:
+        return 4
+    return 0
+
+
+def tenths(x):
+    if x in [0.1, 0.2]:
+        return 1
+    elif x in [0.3, 0.4]:
+        return 2
+    elif x in [0.5, 0.6]:
+        return 3
+    elif x in [0.7, 0.8]:
+        return 4
+    return 0
+
+
+STRING_SCHEMA = {"country": pl.Utf8, "product": pl.Utf8}
+
+
+@requires_replace_strict
+def test_multiple_subjects():
+    source = transform_func_to_new_source(price, schema=STRING_SCHEMA)
+    assert "pl.struct(k0=country, k1=product).replace_strict(" in source
+    assert "pl.when" not in source
+    # the first case that matches a key wins
+    assert "9.0" not in source
+    df = pl.DataFrame(
+        {
+            "country": ["DE", "DE", "FR", "US", "IT", "XX", None, "US"],
+            "product": ["a", "b", "b", "a", "b", "a", "a", None],
+        }
+    )
+    result = df.select(
+        polarify(price, schema=STRING_SCHEMA)(pl.col("country"), pl.col("product"))
+    ).to_series()
+    assert result.to_list() == [price(*row) for row in df.rows()]
+
+
+@requires_replace_strict
+def test_runs_of_cases():
+    source = transform_func_to_new_source(elif_lookup_table, schema={"x": pl.Int64})
+    # the cases before the comparison `x > 90` stay in the when-then chain
+    assert source.count(".when(") == 2
+    assert "x.replace_strict([1, 2, 3, 4, 5, -5, 6, 7, 8]" in source
+    assert "unreachable" not in source
+
+
+def test_null_subject():
+    df = pl.DataFrame({"x": pl.Series([None, 1, 100], dtype=pl.Int64)})
+    result = df.select(polarify(elif_lookup_table, schema={"x": pl.Int64})(pl.col("x")))
+    result = result.to_series()
+    # python can't compare None, polars falls through to the default
+    assert result.to_list() == ["other", "one", "large"]
+
+
+def test_small_tables_stay_when_then():
+    assert MIN_LOOKUP_KEYS > 3
+    assert "replace_strict" not in transform_func_to_new_source(signum)
+
+
+@requires_replace_strict
+def test_unknown_dtypes_stay_when_then():
+    assert "replace_strict" not in transform_func_to_new_source(price)
+    assert "replace_strict" not in transform_func_to_new_source(elif_lookup_table)
+    # the subject `x + y` has no dtype if the dtype of `y` is unknown
+    source = transform_func_to_new_source(sum_table, schema={"x": pl.Int64})
+    assert "replace_strict" not in source
+    source = transform_func_to_new_source(sum_table, schema={"x": pl.Int64, "y": pl.Int64})
+    assert "(x + y).replace_strict([1, 2, 3, 4, 5, 6, 7, 8]" in source
+
+
+def test_mixed_key_types():
+    source = transform_func_to_new_source(mixed_key_types, schema={"x": pl.Float64})
+    assert "replace_strict" not in source
+
+
+@pytest.mark.parametrize(
+    ("func", "schema", "values"),
+    [
+        # old polars versions match nulls against the keys that overflow the dtype
+        pytest.param(
+            int8_table,
+            None,
+            {"x": pl.Series([1, 3, 5, 7, None], dtype=pl.Int8)},
+            marks=requires_replace_strict,
+        ),
+        (float_keys, None, {"x": [1, 2, 3, 4, None]}),
+        (
+            bool_subject,
+            None,
+            {"flag": [True, True, False, False, None], "y": [1, 3, 1, 3, 1]},
+        ),
+    ],
+    ids=["out-of-range", "float-on-int", "bool"],
+)
+def test_keys_and_values_must_fit(func, schema, values):
+    assert "replace_strict" not in transform_func_to_new_source(func, schema=schema)
+    df = pl.DataFrame(values)
+    result = df.select(polarify(func, schema=schema)(*map(pl.col, df.columns)).alias("result"))
+    assert result.height == df.height
+    assert result.to_series().to_list() == [
+        func(*row) if None not in row else 0 for row in df.rows()
+    ]
+
+
+def test_mixed_value_types():
+    assert "replace_strict" not in transform_func_to_new_source(mixed_value_types)
+    df = pl.DataFrame({"x": [1, 3, 5, 7, None]})
+    result = df.select(polarify(mixed_value_types)(pl.col("x"))).to_series()
+    # polars casts the values of a when-then chain to their supertype
+    assert result.to_list() == ["1", "two", "3", "4", "0"]
+
+
+@requires_replace_strict
+def test_exact_float_keys():
+    source = transform_func_to_new_source(float_keys, schema={"x": pl.Float32})
+    assert "x.replace_strict([1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5]" in source
+    assert "replace_strict" in transform_func_to_new_source(tenths, schema={"x": pl.Float64})
+    # tenths can't be represented exactly as a Float32
+    assert "replace_strict" not in transform_func_to_new_source(tenths, schema={"x": pl.Float32})
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="requires python3.10")
+@requires_replace_strict
+@pytest.mark.parametrize("dtype", [pl.Int16, pl.Float32])
+def test_schema(dtype):
+    source = transform_func_to_new_source(match_tuple_lookup_table, schema={"x": dtype})
+    assert "replace_strict(" in source
+    assert "return_dtype=pl." in source
+    df = pl.DataFrame({"x": list(range(-12, 12))}, schema={"x": dtype})
+    result = df.select(polarify(match_tuple_lookup_table, schema={"x": dtype})(pl.col("x")))
+    assert_series_equal(
+        result.to_series(),
+        pl.Series("k0", [match_tuple_lookup_table(x) for x in range(-12, 12)], dtype=dtype),
+    )
@@ -0,0 +1,97 @@
+# ruff: noqa: PLR2004
+import sys
+
+import polars as pl
+import pytest
+
+from polarify.profiling import profile_branches
+
+from .functions import nested_partial_return_with_assignments, signum
+
+if sys.version_info >= (3, 10):
+    from .functions_310 import match_signum
+
+DF = pl.DataFrame({"x": list(range(-5, 20))})
+
+
+def test_profile_branches():
+    report = profile_branches(signum, DF)
+    assert report.rows == DF.height
+    assert [branch.conditions for branch in report.branches] == [("x > 0",), ("x < 0",), ()]
+    assert [branch.value for branch in report.branches] == ["1", "-1", "0"]
+    assert [branch.hits for branch in report.branches] == [19, 5, 1]
+    # the rows taking the first branch don't evaluate the other conditions
+    assert [branch.evaluated for branch in report.branches] == [25, 6, 1]
+    assert not report.dead_branches
+
+
+def test_profile_branches_line_numbers():
+    report = profile_branches(nested_partial_return_with_assignments, DF)
+    first_line = nested_partial_return_with_assignments.__code__.co_firstlineno
+    lines = [branch.lineno for branch in report.branches]
+    assert all(line is not None and line > first_line for line in lines)
+    assert str(report).splitlines()[1].startswith(f"  line {lines[0]}")
+
+
+def test_profile_branches_selecting_lines():
+    report = profile_branches(signum, DF)
+    first_line = signum.__code__.co_firstlineno
+    # the lines of `if x > 0`, `elif x < 0` and of the return statement
+    assert [branch.lineno for branch in report.branches] == [
+        first_line + 2,
+        first_line + 4,
+        first_line + 6,
+    ]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="requires python3.10")
+def test_profile_branches_case_lines():
+    report = profile_branches(match_signum, DF)
+    first_line = match_signum.__code__.co_firstlineno
+    lines = [branch.lineno for branch in report.branches]
+    assert lines == [first_line + 3, first_line + 5, first_line + 7, first_line + 9]
+
+
+def positional_and_keyword_only(x, /, y, *, z):
+    if x > y:
+        return z
+    return y
+
+
+def test_positional_and_keyword_only_parameters():
+    df = DF.with_columns([pl.lit(3).alias("y"), (pl.col("x") * 2).alias("z")])
+    report = profile_branches(positional_and_keyword_only, df)
+    assert [branch.hits for branch in report.branches] == [16, 9]
+
+
+def make_threshold(threshold):
+    def above(x):
+        if x > threshold:
+            return 1
+        return 0
+
+    return above
+
+
+def test_closure():
+    report = profile_branches(make_threshold(9), DF)
+    assert [branch.conditions for branch in report.branches] == [("x > threshold",), ()]
+    assert [branch.hits for branch in report.branches] == [10, 15]
+
+
+def test_dead_branches():
+    report = profile_branches(signum, DF.filter(pl.col("x") > 0))
+    assert [branch.value for branch in report.branches if branch.dead] == ["-1", "0"]
+    assert len(report.dead_branches) == 2
+
+
+def test_columns():
+    report = profile_branches(signum, DF.rename({"x": "y"}), {"x": "y"})
+    assert [branch.hits for branch in report.branches] == [19, 5, 1]
+    report = profile_branches(signum, DF, {"x": pl.col("x") - 10})
+    assert [branch.hits for branch in report.branches] == [9, 15, 1]
+
+
+def test_single_branch():
+    report = profile_branches(lambda x: x + 1, DF)
+    assert [(branch.hits, branch.lineno) for branch in report.branches] == [(25, None)]
@@ -0,0 +1,87 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from polarify import polarify
+from polarify.rules import PREDICATE_PREFIX, compile_rules
+
+from .functions import signum
+
+
+@polarify
+def approved(x, status):
+    if (x > 0) & (status == "A"):
+        return 1
+    return 0
+
+
+def label(x, status):
+    if x > 0:
+        return "positive"
+    elif status == "A":
+        return "active"
+    return "other"
+
+
+def make_threshold(threshold):
+    def above(value):
+        if value > threshold:
+            return 2
+        elif value > 0:
+            return 1
+        return 0
+
+    return above
+
+
+@pytest.fixture
+def df() -> pl.DataFrame:
+    return pl.DataFrame({"x": [-1, 0, 1, 6, 10, None], "status": ["A", "B", "A", None, "A", "B"]})
+
+
+def expected(df: pl.DataFrame, rules: dict, columns: dict) -> pl.DataFrame:
+    def argument(name):
+        return pl.col(columns.get(name, name))
+
+    return df.with_columns(
+        [
+            polarify(rule)(
+                *map(argument, rule.__code__.co_varnames[: rule.__code__.co_argcount])
+            ).alias(name)
+            for name, rule in rules.items()
+        ]
+    )
+
+
+def test_shared_predicates(df):
+    rules = {
+        "approved": approved,
+        "label": label,
+        "above_5": make_threshold(5),
+        "above_7": make_threshold(7),
+    }
+    columns = {"value": "x"}
+    rule_set = compile_rules(rules, columns)
+    # `value > 0` is `x > 0`, the comparisons with the thresholds depend on the closures
+    assert [str(expr) for expr in rule_set.predicates.values()] == [
+        str((pl.col("x") > 0).alias(f"{PREDICATE_PREFIX}0")),
+        str((pl.col("status") == "A").alias(f"{PREDICATE_PREFIX}1")),
+    ]
+    unwrapped = {**rules, "approved": approved.__wrapped__}
+    assert_frame_equal(rule_set.apply(df), expected(df, unwrapped, columns))
+    assert_frame_equal(rule_set.apply(df.lazy()).collect(), rule_set.apply(df))
+
+
+def test_no_shared_predicates(df):
+    rule_set = compile_rules({"label": label})
+    assert rule_set.predicates == {}
+    assert_frame_equal(rule_set.apply(df), expected(df, {"label": label}, {}))
+
+
+def test_expression_inputs(df):
+    rule_set = compile_rules({"a": signum, "b": signum}, {"x": pl.col("x") * 2})
+    # `x > 0` and `x < 0` of both rules
+    assert len(rule_set.predicates) == 2  # noqa: PLR2004
+    result = rule_set.apply(df)
+    assert result.columns == ["x", "status", "a", "b"]
+    assert result["a"].to_list() == [-1, 0, 1, 1, 1, 0]
@@ -0,0 +1,43 @@
+import sys
+
+import polars as pl
+import pytest
+
+from benchmarks._generate import make_function
+from polarify import polarify, transform_func_to_new_source
+from polarify.main import MAX_CHAIN_LENGTH
+
+# the branches don't return literals, which would be lowered to a lookup table
+KINDS = [
+    "elif",
+    "early_return",
+    pytest.param(
+        "match",
+        marks=pytest.mark.skipif(sys.version_info < (3, 10), reason="requires python3.10"),
+    ),
+    pytest.param(
+        "match_or",
+        marks=pytest.mark.skipif(sys.version_info < (3, 10), reason="requires python3.10"),
+    ),
+]
+
+
+@pytest.mark.parametrize("kind", KINDS)
+@pytest.mark.parametrize("n", [1, MAX_CHAIN_LENGTH, 3 * MAX_CHAIN_LENGTH + 1])
+def test_many_branches(kind, n):
+    func = make_function(kind, n, literals=False)
+    df = pl.DataFrame({"x": list(range(-1, n + 2))})
+    result = df.select(polarify(func)(pl.col("x"))).to_series().to_list()
+    assert result == [func(x) for x in df["x"]]
+
+
+# python itself can't compile much longer elif chains
+@pytest.mark.parametrize("kind", [pytest.param("elif", id="elif-2000"), *KINDS[1:]])
+def test_transpile_10k_branches(kind):
+    n = 2_000 if kind == "elif" else 10_000
+    func = make_function(kind, n, literals=False)
+    if kind != "match_or":
+        # long when-then chains are split into nested chains
+        assert transform_func_to_new_source(func).count("_when") > n // MAX_CHAIN_LENGTH
+    # evaluating the expression is left out, polars is slow for this many branches
+    assert isinstance(polarify(func)(pl.col("x")), pl.Expr)
@@ -0,0 +1,113 @@
+import textwrap
+
+import polars as pl
+import pytest
+
+from polarify.scan import benchmark_candidate, compile_candidate, main, scan
+
+SOURCE = textwrap.dedent(
+    """
+    import polars as pl
+
+
+    def signum(x):
+        if x > 0:
+            return 1
+        elif x < 0:
+            return -1
+        return 0
+
+
+    def loop(x):
+        for i in range(3):
+            x += i
+        return x
+
+
+    df = pl.DataFrame({"x": [1, 2]})
+    df.select(pl.col("x").map_elements(signum))
+    df.select(pl.col("x").map_elements(loop))
+    df.select(pl.col("x").apply(lambda x: x * 2 if x > 1 else x))
+    df.map_rows(helpers.f)
+    df.select(pl.col("x").map_elements(function=signum, return_dtype=pl.Int64))
+    df.select(pl.col("x").sum())
+    """
+)
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "udfs.py").write_text(SOURCE)
+    (tmp_path / ".venv").mkdir()
+    (tmp_path / ".venv" / "ignored.py").write_text(SOURCE)
+    return tmp_path
+
+
+def test_scan(source_tree):
+    candidates = scan([source_tree])
+    assert [(c.lineno, c.method, c.name, c.error) for c in candidates] == [
+        (20, "map_elements", "signum", None),
+        (21, "map_elements", "loop", "Unsupported statement type: <class 'ast.For'>"),
+        (22, "apply", "lambda", None),
+        (23, "map_rows", "helpers.f", "function is not defined in this file"),
+        (24, "map_elements", "signum", None),
+    ]
+
+
+def test_scan_does_not_execute(tmp_path):
+    (tmp_path / "side_effect.py").write_text(
+        "raise RuntimeError\ndf.map_elements(lambda x: 1 if x else 0)\n"
+    )
+    (candidate,) = scan([tmp_path])
+    assert candidate.convertible
+
+
+ROW_WISE_SOURCE = textwrap.dedent(
+    """
+    df.map_rows(lambda row: row[0] * 2 if row[2] > 0 else row[0])
+    df.map_rows(lambda row: sum(row))
+    df.map_rows(lambda row, scale: row[0] * scale)
+    df.apply(lambda row: row[1])
+    df.select(pl.col("x").apply(lambda x: x + 1))
+    """
+)
+
+
+def test_row_wise(tmp_path):
+    (tmp_path / "rows.py").write_text(ROW_WISE_SOURCE)
+    candidates = scan([tmp_path])
+    assert [(c.method, c.row_wise, c.error) for c in candidates] == [
+        ("map_rows", True, None),
+        (
+            "map_rows",
+            True,
+            "Row-wise UDFs must only index the row with integer literals, e.g. row[0]",
+        ),
+        ("map_rows", True, "Row-wise UDFs must take the row as their only parameter"),
+        ("apply", True, None),
+        ("apply", False, None),
+    ]
+    # the fields of the row are passed as columns, the fields before the last index as well
+    original, polarified = compile_candidate(candidates[0])
+    df = pl.DataFrame({"a": [1, 2, 3], "b": [0, 0, 0], "c": [1, -1, 0]})
+    result = df.select(polarified(pl.col("a"), pl.col("b"), pl.col("c"))).to_series()
+    assert result.to_list() == [original(row) for row in df.rows()]
+    udf, native = benchmark_candidate(candidates[0], 100, repeat=1)
+    assert udf > 0
+    assert native > 0
+
+
+def test_syntax_error(tmp_path):
+    (tmp_path / "broken.py").write_text("x = (")
+    with pytest.warns(UserWarning, match="Could not parse"):
+        assert scan([tmp_path]) == []
+
+
+def test_cli(source_tree, capsys):
+    assert main(["scan", str(source_tree), "--benchmark", "--rows", "100"]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith(f"{source_tree / 'pkg' / 'udfs.py'}:20 map_elements(signum): ok, ")
+    assert "x faster" in lines[0]
+    assert lines[1].endswith("blocked: Unsupported statement type: <class 'ast.For'>")
+    assert lines[-1] == "3 of 5 UDFs can be transpiled"
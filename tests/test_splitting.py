@@ -0,0 +1,148 @@
+# ruff: noqa: PLR2004
+import ast
+import logging
+
+import polars as pl
+import pytest
+from polars.testing import assert_series_equal
+
+from polarify import polarify
+from polarify import splitting as splitting_module
+from polarify.splitting import (
+    MIN_SPLIT_COST,
+    expensive,
+    expression_cost,
+    is_elementwise,
+    split_branches,
+)
+
+from .functions import nested_partial_return_with_assignments, signum
+
+DF = pl.DataFrame({"x": [*range(-5, 20), None], "s": [f"a{i}@b" for i in range(26)]})
+
+INT64 = pl.Int64
+calls = []
+
+
+def count_calls(value):
+    calls.append(value)
+    return value * 10
+
+
+def marked(x):
+    if x > 15:
+        return expensive(x.map_elements(count_calls, return_dtype=INT64))
+    elif x < 0:
+        return -1
+    return x
+
+
+def marked_by_module(x):
+    if x > 15:
+        return splitting_module.expensive(x * 10)
+    return 0
+
+
+def regex(x, s):
+    if x > 17:
+        return s.str.replace_all(r"(\w+)@(\w+)", "$2 at $1")
+    return "plain"
+
+
+def constant(x):  # noqa: ARG001
+    return 1
+
+
+def centered(x):
+    if x > 15:
+        return expensive(x - x.mean())
+    return x
+
+
+def make_scaled(factor):
+    def scaled(x):
+        if x > 15:
+            return expensive(x * factor)
+        return 0
+
+    return scaled
+
+
+def expected(func, df: pl.DataFrame, *columns: str) -> pl.Series:
+    return df.select(polarify(func)(*map(pl.col, columns)).alias(func.__name__)).to_series()
+
+
+@pytest.mark.skipif(not hasattr(pl.Expr, "map_elements"), reason="requires Expr.map_elements")
+def test_expensive_branch_only_sees_its_rows():
+    calls.clear()
+    result = split_branches(marked, DF)
+    assert calls == [16, 17, 18, 19]
+    assert_series_equal(
+        result, pl.Series("marked", [-1] * 5 + list(range(16)) + [160, 170, 180, 190, None])
+    )
+
+
+def test_marker_attribute():
+    result = split_branches(marked_by_module, DF)
+    assert result.to_list() == [0] * 21 + [160, 170, 180, 190, 0]
+
+
+def test_cost_heuristic(caplog):
+    value = ast.parse('s.str.replace_all("a", "b")', mode="eval").body
+    assert expression_cost(value) >= MIN_SPLIT_COST
+    assert expression_cost(ast.parse("x * 2 + 1", mode="eval").body) < MIN_SPLIT_COST
+    with caplog.at_level(logging.DEBUG, logger="polarify.splitting"):
+        result = split_branches(regex, DF)
+    assert "Splitting the branches [0]" in caplog.text
+    assert_series_equal(result, expected(regex, DF, "x", "s"))
+    assert result.to_list()[-3:] == ["b at a23", "b at a24", "plain"]
+
+
+def test_share_of_rows(caplog):
+    # the expensive branch is taken by most of the rows
+    with caplog.at_level(logging.DEBUG, logger="polarify.splitting"):
+        result = split_branches(regex, DF, max_share=0.01)
+    assert "Splitting the branches []" in caplog.text
+    assert_series_equal(result, expected(regex, DF, "x", "s"))
+
+
+def test_unsplit_functions():
+    assert_series_equal(split_branches(signum, DF), expected(signum, DF, "x"))
+    assert split_branches(constant, DF).to_list() == [1] * DF.height
+    assert_series_equal(
+        split_branches(nested_partial_return_with_assignments, DF),
+        expected(nested_partial_return_with_assignments, DF, "x"),
+    )
+
+
+def test_closure(caplog):
+    with caplog.at_level(logging.DEBUG, logger="polarify.splitting"):
+        result = split_branches(make_scaled(3), DF)
+    assert "Splitting the branches [0]" in caplog.text
+    assert result.to_list() == [0] * 21 + [48, 51, 54, 57, 0]
+
+
+def test_columns():
+    result = split_branches(marked_by_module, DF.rename({"x": "y"}), {"x": "y"})
+    assert result.to_list() == split_branches(marked_by_module, DF).to_list()
+    result = split_branches(marked_by_module, DF, {"x": pl.col("x") - 2})
+    assert result.to_list() == [0] * 23 + [160, 170, 0]
+
+
+def test_non_elementwise_values(caplog):
+    with caplog.at_level(logging.DEBUG, logger="polarify.splitting"):
+        result = split_branches(centered, DF)
+    assert "Not splitting centered" in caplog.text
+    # the mean of all rows, not of the rows taking the branch
+    assert_series_equal(result, expected(centered, DF, "x"))
+    assert result.to_list()[-5:-1] == [16 - 7, 17 - 7, 18 - 7, 19 - 7]
+
+
+def test_is_elementwise():
+    def parse(source):
+        return ast.parse(source, mode="eval").body
+
+    assert is_elementwise(parse("x.str.len_chars() + x.list.sum() + x.fill_null(0)"))
+    for source in ["x - x.mean()", "x.shift(1)", "x.rank()", "x.sum().over(g)", "x.cum_sum()"]:
+        assert not is_elementwise(parse(source))
+    assert not is_elementwise(parse('x.fill_null(strategy="forward")'))
@@ -0,0 +1,56 @@
+# ruff: noqa: PLR2004
+import logging
+
+from polarify import cache_clear, polarify
+from polarify.stats import CompilationStats
+
+from .functions import signum
+
+
+def test_stats():
+    stats = polarify(signum).stats
+    assert isinstance(stats, CompilationStats)
+    assert stats.name == "signum"
+    assert list(stats.timings) == [
+        "getsource",
+        "ast_parse",
+        "parse_body",
+        "transform",
+        "unparse",
+        "exec",
+    ]
+    assert stats.total_time == sum(stats.timings.values())
+    assert stats.when_count == 2
+    assert stats.nodes > stats.max_depth > 0
+    # `s` is returned in all three branches
+    assert stats.inlined == {"s": 3}
+
+
+def test_stats_bytecode():
+    stats = polarify(lambda x: 1 if x > 0 else 2).stats
+    assert "parse_bytecode" in stats.timings
+    assert "getsource" not in stats.timings
+    assert stats.when_count == 1
+
+
+def test_stats_other_backend():
+    assert polarify(signum, backend="numpy").stats.when_count == 0
+
+
+def test_explain():
+    explanation = polarify(signum).stats.explain()
+    lines = explanation.splitlines()
+    assert lines[0].startswith("signum: compiled in ")
+    assert lines[1].split()[0] == "getsource"
+    assert "nodes: " in explanation
+    assert lines[-1] == "inlined: s x3"
+
+
+def test_logging_hook(caplog):
+    # cached compilations are only logged as such
+    cache_clear()
+    with caplog.at_level(logging.DEBUG, logger="polarify"):
+        func = polarify(signum)
+    (record,) = caplog.records
+    assert record.stats is func.stats
+    assert record.getMessage().startswith("Compiled signum in ")
@@ -0,0 +1,93 @@
+import inspect
+import logging
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from polarify import vectorize
+
+from .functions import signum
+
+# `map_elements` was called `apply` in polars < 0.19
+map_elements = getattr(pl.Expr, "map_elements", None) or pl.Expr.apply
+
+
+def loop(x):
+    for _ in range(3):
+        x = x + 1
+    return x
+
+
+@pytest.fixture
+def df():
+    return pl.DataFrame({"x": [-2, 0, 3]})
+
+
+def test_vectorize(df, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        result = df.select(vectorize(pl.col("x"), signum))
+    assert result.to_series().to_list() == [-1, 0, 1]
+    (record,) = caplog.records
+    assert record.vectorized
+    assert record.call_site.endswith(
+        f"test_vectorize.py:{test_vectorize.__code__.co_firstlineno + 2}"
+    )
+    assert "Vectorized signum" in record.getMessage()
+
+
+@pytest.mark.skipif(not hasattr(pl.Expr, "pipe"), reason="requires Expr.pipe")
+def test_vectorize_pipe(df, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        result = df.select(pl.col("x").pipe(vectorize, lambda x: 0 if x < 0 else x))
+    assert result.to_series().to_list() == [0, 0, 3]
+    (record,) = caplog.records
+    # frames of polars are skipped
+    assert "test_vectorize.py" in record.call_site
+
+
+def test_fallback(df, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        result = df.select(vectorize(pl.col("x"), loop, return_dtype=pl.Int64))
+    assert result.to_series().to_list() == [1, 3, 6]
+    (record,) = caplog.records
+    assert not record.vectorized
+    assert "Falling back to map_elements for loop" in record.getMessage()
+
+
+def test_return_dtype(df):
+    assert_frame_equal(
+        df.select(vectorize(pl.col("x"), lambda x: x if x > 0 else 0, return_dtype=pl.Int16)),
+        pl.DataFrame({"x": pl.Series([0, 0, 3], dtype=pl.Int16)}),
+    )
+
+
+def test_callables_without_bytecode(df, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        result = df.select(vectorize(pl.col("x"), abs, return_dtype=pl.Int64))
+    assert result.to_series().to_list() == [2, 0, 3]
+    (record,) = caplog.records
+    assert not record.vectorized
+
+
+@pytest.mark.parametrize("skip_nulls", [True, False])
+def test_skip_nulls(skip_nulls):
+    df = pl.DataFrame({"x": [3, None, -2]})
+    result = df.select(vectorize(pl.col("x"), signum, skip_nulls=skip_nulls)).to_series()
+    # the comparisons of signum are null, so it takes the last branch
+    assert result.to_list() == [1, None if skip_nulls else 0, -1]
+
+
+@pytest.mark.skipif(
+    "strategy" not in inspect.signature(map_elements).parameters,
+    reason="requires map_elements(strategy=...)",
+)
+def test_map_elements_arguments(df, caplog):
+    with caplog.at_level(logging.INFO, logger="polarify"):
+        result = df.select(
+            vectorize(pl.col("x"), signum, return_dtype=pl.Int64, strategy="thread_local")
+        )
+    assert result.to_series().to_list() == [-1, 0, 1]
+    (record,) = caplog.records
+    assert not record.vectorized
+    assert "strategy are only supported by map_elements" in record.getMessage()